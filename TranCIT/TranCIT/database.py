@@ -0,0 +1,105 @@
+"""
+DATABASES configuration for settings.py.
+
+SQLite (no DATABASE_URL): a busy timeout instead of immediate "database is
+locked" errors, IMMEDIATE write transactions so two writers can't deadlock
+upgrading their locks, and a memory-mapped read path. With SQLITE_WAL=1 also a
+WAL journal, so readers no longer block behind a writer, and synchronous=NORMAL
+(safe with WAL, one fsync per checkpoint instead of per commit). WAL is opt-in
+because the mode is stored in the database file itself: it would stick to the
+checked-in db.sqlite3 and leave -wal/-shm files next to it.
+
+PostgreSQL: a psycopg 3 connection pool per worker process with health
+checks, instead of one long-lived SSL connection per worker that can go stale.
+
+Read replicas (DATABASE_REPLICA_URLS, or SQLITE_REPLICA_PATHS locally) are added
+as replica1, replica2, ... and used by route_input.routers.ReplicaRouter.
+"""
+
+import os
+
+import dj_database_url
+
+SQLITE_WAL = os.getenv("SQLITE_WAL", "0") == "1"
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "20"))  # seconds
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # bytes
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(32 * 1024)))
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10"))  # seconds to wait for a free connection
+DB_POOL_MAX_IDLE = int(os.getenv("DB_POOL_MAX_IDLE", "300"))  # close idle connections after (seconds)
+DB_POOL_MAX_LIFETIME = int(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))  # recycle connections after (seconds)
+
+
+def sqlite_pragmas(wal=False):
+    # Without WAL the journal mode is left alone (rollback journal) and so is synchronous=FULL
+    pragmas = ["PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL"] if wal else []
+    return ";".join(pragmas + [
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}",
+        "PRAGMA temp_store=MEMORY",
+    ])
+
+
+def sqlite_database(path, wal=None):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'OPTIONS': {
+            'timeout': SQLITE_BUSY_TIMEOUT,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': sqlite_pragmas(SQLITE_WAL if wal is None else wal),
+        },
+    }
+
+
+def _psycopg_pool_available():
+    try:
+        import psycopg  # noqa: F401
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def postgres_database(url):
+    pooled = os.getenv("DB_POOL", "1") == "1" and _psycopg_pool_available()
+    config = dj_database_url.parse(
+        url,
+        # Pooled connections are returned to the pool after each request;
+        # Django refuses persistent connections on top of a pool.
+        conn_max_age=0 if pooled else 600,
+        conn_health_checks=True,
+        ssl_require=True,
+    )
+    if pooled:
+        # With CONN_HEALTH_CHECKS Django passes ConnectionPool.check_connection,
+        # so a connection killed by the server is replaced before it is handed out.
+        config.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+            'max_idle': DB_POOL_MAX_IDLE,
+            'max_lifetime': DB_POOL_MAX_LIFETIME,
+        }
+    return config
+
+
+def _split(value):
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def database_config(database_url, sqlite_path, replica_urls=None, sqlite_replica_paths=None):
+    if database_url:
+        databases = {'default': postgres_database(database_url)}
+        replicas = [postgres_database(url) for url in _split(replica_urls)]
+    else:
+        databases = {'default': sqlite_database(sqlite_path)}
+        replicas = [sqlite_database(path) for path in _split(sqlite_replica_paths)]
+    for i, replica in enumerate(replicas, start=1):
+        # Tests run against the primary only
+        replica['TEST'] = {'MIRROR': 'default'}
+        databases[f'replica{i}'] = replica
+    return databases
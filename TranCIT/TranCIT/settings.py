@@ -13,7 +13,6 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-import dj_database_url
 
 # -------------------------------------------------------------------
 # Load environment variables properly
@@ -24,23 +23,62 @@ load_dotenv(os.path.join(BASE_DIR, ".env"))
 ORS_API_KEY = os.getenv("ORS_API_KEY")
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# See TranCIT/database.py: busy timeout (and WAL with SQLITE_WAL=1) for SQLite,
+# a psycopg pool with health checks for PostgreSQL (imported here, after .env
+# has been loaded).
+from .database import database_config  # noqa: E402
+
+DATABASES = database_config(
+    DATABASE_URL,
+    os.getenv("SQLITE_PATH") or BASE_DIR / 'db.sqlite3',
+    replica_urls=os.getenv("DATABASE_REPLICA_URLS"),
+    sqlite_replica_paths=os.getenv("SQLITE_REPLICA_PATHS"),
+)
+
+# Route/SavedRoute reads go to the replicas; a session that just wrote reads
+# from the primary for REPLICA_STICKY_SECONDS (route_input/routers.py).
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['route_input.routers.ReplicaRouter'] if DATABASE_REPLICAS else []
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+
 if DATABASE_URL:
-    DATABASES = {
-        'default': dj_database_url.config(
-            default=DATABASE_URL,
-            conn_max_age=1800,
-            ssl_require=True
-        )
-    }
     print("INFO: Using Supabase PostgreSQL database.")
 else:
-    DATABASES = {
+    print("⚠️  DATABASE_URL not set. Using SQLite fallback.")
+
+
+# -------------------------------------------------------------------
+# Cache & sessions
+# -------------------------------------------------------------------
+# A shared cache lets every gunicorn worker see the same sessions and
+# cached geocodes. Without REDIS_URL each worker keeps its own LocMemCache.
+REDIS_URL = os.getenv("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
         'default': {
-            'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'trancit-default',
         }
     }
-    print("⚠️  DATABASE_URL not set. Using SQLite fallback.")
+
+# Per-worker byte-bounded cache in front of CACHES['default'] (route_input/caching.py),
+# and an optional log of its misses for `manage.py warm_caches` to replay after a deploy
+CACHE_L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", 16 * 1024 * 1024))
+CACHE_RECORD_PATH = os.getenv("CACHE_RECORD_PATH") or None
+
+# cached_db serves session reads from the cache and only touches the
+# database when the session is modified. Set SESSION_ENGINE to
+# "django.contrib.sessions.backends.signed_cookies" to keep sessions
+# entirely client-side.
+SESSION_ENGINE = os.getenv("SESSION_ENGINE", "django.contrib.sessions.backends.cached_db")
 
 
 # Quick-start development settings - unsuitable for production
@@ -69,13 +107,22 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # WhiteNoise must run before everything else that can touch static requests
+    "whitenoise.middleware.WhiteNoiseMiddleware",
+    # Off unless PROFILE_SAMPLE_RATE > 0 or a staff-signed X-Profile header is sent
+    'route_input.profiling.ProfilingMiddleware',
+    # Brotli/gzip for HTML and JSON; static files are pre-compressed by WhiteNoise
+    'route_input.middleware.CompressionMiddleware',
+    # One time budget per request for all Nominatim/ORS calls
+    'route_input.upstream.UpstreamDeadlineMiddleware',
+    # Keeps a session that just saved a route reading from the primary database
+    'route_input.routers.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
 ]
 
 ROOT_URLCONF = 'TranCIT.urls'
@@ -93,8 +140,22 @@ TEMPLATES = [
             ],
         },
     },
+    {
+        # Only used for templates under <app>/jinja2/ (see DASHBOARD_TEMPLATE_ENGINE)
+        'BACKEND': 'django.template.backends.jinja2.Jinja2',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'environment': 'route_input.jinja_env.environment',
+        },
+    },
 ]
 
+# Dashboard rendering: 'django' or 'jinja2' (same page, faster template engine),
+# and how long its sidebar fragments stay cached (0 = off)
+DASHBOARD_TEMPLATE_ENGINE = os.getenv("DASHBOARD_TEMPLATE_ENGINE", "django")
+DASHBOARD_FRAGMENT_TTL = int(os.getenv("DASHBOARD_FRAGMENT_TTL", "600"))
+
 WSGI_APPLICATION = 'TranCIT.wsgi.application'
 
 
@@ -117,6 +178,43 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing ("auth performance mode")
+# The first hasher hashes new passwords; the rest only verify old hashes.
+# Users are rehashed transparently with the preferred hasher (and its current
+# parameters) the next time they log in.
+# AUTH_PASSWORD_HASHER: "scrypt" (default), "argon2" (needs argon2-cffi) or "pbkdf2".
+AUTH_PASSWORD_HASHER = os.getenv("AUTH_PASSWORD_HASHER", "scrypt")
+
+_PASSWORD_HASHER_CHOICES = {
+    'scrypt': 'login_registration.hashers.TunedScryptPasswordHasher',
+    'argon2': 'login_registration.hashers.TunedArgon2PasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHER_CHOICES[AUTH_PASSWORD_HASHER]] + [
+    hasher for name, hasher in _PASSWORD_HASHER_CHOICES.items() if name != AUTH_PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+# scrypt cost: n = 2**14, r = 8 needs 16 MiB and ~50 ms per hash.
+SCRYPT_WORK_FACTOR = int(os.getenv("SCRYPT_WORK_FACTOR", 2 ** 14))
+SCRYPT_BLOCK_SIZE = int(os.getenv("SCRYPT_BLOCK_SIZE", 8))
+SCRYPT_PARALLELISM = int(os.getenv("SCRYPT_PARALLELISM", 1))
+
+# argon2id cost: memory in KiB.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 2))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 19 * 1024))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 1))
+
+# Token-bucket throttles checked before any password hashing.
+# Each bucket holds BURST attempts and refills PER_MINUTE attempts a minute.
+LOGIN_THROTTLE_BURST = int(os.getenv("LOGIN_THROTTLE_BURST", 10))
+LOGIN_THROTTLE_PER_MINUTE = float(os.getenv("LOGIN_THROTTLE_PER_MINUTE", 5))
+REGISTER_THROTTLE_BURST = int(os.getenv("REGISTER_THROTTLE_BURST", 5))
+REGISTER_THROTTLE_PER_MINUTE = float(os.getenv("REGISTER_THROTTLE_PER_MINUTE", 2))
+# Proxies in front of the app that append to X-Forwarded-For (Render: 1). The client
+# is the hop the outermost of them appended; 0 ignores the header and uses REMOTE_ADDR.
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", 1))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -137,8 +235,63 @@ STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_DIRS = [BASE_DIR / "static"]
 
-# WhiteNoise for static files
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+# WhiteNoise for static files: content-hashed names plus .gz/.br variants
+# (Brotli needs the Brotli package). Hashed files are served with far-future
+# "immutable" cache headers.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+
+# Minified bundles and vendored folium assets are generated into static/ by
+# `manage.py build_assets` (see build.sh). Templates use the bundles once they exist.
+USE_ASSET_BUNDLES = os.getenv(
+    "USE_ASSET_BUNDLES",
+    "1" if (BASE_DIR / "static" / "bundles").is_dir() else "0",
+) == "1"
+
+# Shared, mmap'ed snapshot of the route network (route_input/network.py).
+# Disabled unless a directory is configured; every worker maps the same file.
+# Route changes mark it dirty; it is rebuilt once, ROUTE_SNAPSHOT_REBUILD_DELAY
+# seconds after the first change, or (AUTO_REBUILD=0) by a scheduled
+# `manage.py build_route_snapshot --if-dirty`.
+ROUTE_SNAPSHOT_DIR = os.getenv("ROUTE_SNAPSHOT_DIR") or None
+ROUTE_SNAPSHOT_AUTO_REBUILD = os.getenv("ROUTE_SNAPSHOT_AUTO_REBUILD", "1") == "1"
+ROUTE_SNAPSHOT_REBUILD_DELAY = int(os.getenv("ROUTE_SNAPSHOT_REBUILD_DELAY", 30))
+
+# Canonical jeepney lines (route_input/lines.py) are rebuilt by a scheduled
+# `manage.py build_jeepney_lines`, or (AUTO_REBUILD=1) on a background thread
+# LINE_CATALOGUE_REBUILD_DELAY seconds after the first change of a burst.
+LINE_CATALOGUE_AUTO_REBUILD = os.getenv("LINE_CATALOGUE_AUTO_REBUILD", "0") == "1"
+LINE_CATALOGUE_REBUILD_DELAY = int(os.getenv("LINE_CATALOGUE_REBUILD_DELAY", 30))
+
+# Draw the dashboard's suggested routes from the browser's synced copy of the route
+# network (route_input/sync.py) instead of embedding their paths in the map HTML
+ROUTE_NETWORK_CLIENT_SYNC = os.getenv("ROUTE_NETWORK_CLIENT_SYNC", "1") == "1"
+
+# Search analytics (route_input/analytics.py): per-worker heavy-hitter sketches of what
+# people search for, flushed into per-window rollups; staff dashboard at /routes/analytics/
+SEARCH_ANALYTICS = os.getenv("SEARCH_ANALYTICS", "1") == "1"
+SEARCH_ANALYTICS_WINDOW = int(os.getenv("SEARCH_ANALYTICS_WINDOW", 60 * 60))
+
+# Route path previews (route_input/thumbnails.py), content-addressed files under
+# THUMBNAIL_DIR, rendered in the background after a route's path changes
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR") or BASE_DIR / "var" / "thumbnails"
+THUMBNAIL_AUTO_RENDER = os.getenv("THUMBNAIL_AUTO_RENDER", "1") == "1"
+
+# Request profiling (route_input/profiling.py); captures are listed in the admin.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR") or BASE_DIR / "var" / "profiles"
+
+# Map tiles through the caching tile proxy (route_input/tiles.py). TILE_MBTILES is an
+# optional read-only MBTiles file consulted before the on-disk cache.
+MAP_TILE_PROXY = os.getenv("MAP_TILE_PROXY", "1") == "1"
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR") or BASE_DIR / "var" / "tiles"
+TILE_MBTILES = os.getenv("TILE_MBTILES") or None
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
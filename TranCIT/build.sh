@@ -3,4 +3,8 @@ set -o errexit
  
 pip install -r requirements.txt
 python manage.py migrate --noinput
-python manage.py collectstatic --noinput
\ No newline at end of file
+python manage.py build_assets
+python manage.py collectstatic --noinput
+if [ -n "${ROUTE_SNAPSHOT_DIR:-}" ]; then
+  python manage.py build_route_snapshot
+fi
\ No newline at end of file
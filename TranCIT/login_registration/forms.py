@@ -1,6 +1,8 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.db.models.functions import Lower
 
 class RegistrationForm(forms.Form):
     username = forms.CharField(
@@ -31,20 +33,31 @@ class RegistrationForm(forms.Form):
 
     def clean_username(self):
         username = self.cleaned_data.get('username')
-        if User.objects.filter(username=username).exists():
-            raise ValidationError("Username already exists.")
         if len(username) < 3:
             raise ValidationError("Username must be at least 3 characters long.")
         return username
 
-    def clean_email(self):
-        email = self.cleaned_data.get('email')
-        if User.objects.filter(email=email).exists():
-            raise ValidationError("Email already registered.")
-        return email
+    def _check_unique(self, username, email):
+        # One query covers both checks. Emails are compared case-insensitively as
+        # LOWER(email), which the expression index of migration 0002 serves.
+        email = email.lower() if email else email
+        filters = Q()
+        if username:
+            filters |= Q(username=username)
+        if email:
+            filters |= Q(email_lower=email)
+        if not filters:
+            return
+        existing = User.objects.annotate(email_lower=Lower('email')).filter(filters)
+        for existing_username, existing_email in existing.values_list('username', 'email_lower')[:2]:
+            if username and existing_username == username and 'username' not in self._errors:
+                self.add_error('username', "Username already exists.")
+            if email and existing_email == email and 'email' not in self._errors:
+                self.add_error('email', "Email already registered.")
 
     def clean(self):
         cleaned_data = super().clean()
+        self._check_unique(cleaned_data.get('username'), cleaned_data.get('email'))
         password = cleaned_data.get('password')
         password_confirm = cleaned_data.get('password_confirm')
 
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, ScryptPasswordHasher
+
+# These keep the stock algorithm names, so existing hashes stay valid. When the
+# cost settings change, must_update() notices the old parameters and Django
+# rehashes the password on the user's next successful login.
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    work_factor = settings.SCRYPT_WORK_FACTOR
+    block_size = settings.SCRYPT_BLOCK_SIZE
+    parallelism = settings.SCRYPT_PARALLELISM
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    time_cost = settings.ARGON2_TIME_COST
+    memory_cost = settings.ARGON2_MEMORY_COST
+    parallelism = settings.ARGON2_PARALLELISM
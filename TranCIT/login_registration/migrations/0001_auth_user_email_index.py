@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    auth.User.email has no index, so the registration uniqueness check scanned
+    auth_user. The model belongs to django.contrib.auth, so the index is added
+    with plain SQL (valid on both SQLite and PostgreSQL).
+    """
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS auth_user_email_trancit_idx ON auth_user (email);',
+            reverse_sql='DROP INDEX IF EXISTS auth_user_email_trancit_idx;',
+        ),
+    ]
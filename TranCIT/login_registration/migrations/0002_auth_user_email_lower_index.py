@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Registration treats emails case-insensitively and filters on LOWER(email),
+    which the plain email index of 0001 cannot serve. Expression indexes are
+    supported by both SQLite (3.9+) and PostgreSQL.
+    """
+
+    dependencies = [
+        ('login_registration', '0001_auth_user_email_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS auth_user_email_lower_trancit_idx ON auth_user (LOWER(email));',
+            reverse_sql='DROP INDEX IF EXISTS auth_user_email_lower_trancit_idx;',
+        ),
+    ]
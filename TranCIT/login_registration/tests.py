@@ -1,3 +1,146 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import get_hashers, make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .forms import RegistrationForm
+from .hashers import TunedScryptPasswordHasher
+
+# The login page links its CSS through {% static %}; tests run without collectstatic
+PLAIN_STATIC_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+def _registration(**overrides):
+    data = {'username': 'newrider', 'email': 'rider@example.com',
+            'password': 'long-enough-pw', 'password_confirm': 'long-enough-pw'}
+    data.update(overrides)
+    return data
+
+
+@override_settings(STORAGES=PLAIN_STATIC_STORAGES)
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        User.objects.create_user('rider', 'rider@example.com', 'correct-horse')
+
+    @mock.patch('login_registration.views.authenticate', return_value=None)
+    def test_login_is_rejected_once_the_bucket_is_empty(self, authenticate):
+        url = reverse('login_registration:login')
+        statuses = [self.client.post(url, {'username': 'rider', 'password': 'wrong'}).status_code
+                    for _ in range(settings.LOGIN_THROTTLE_BURST + 1)]
+
+        self.assertEqual(statuses[:-1], [200] * settings.LOGIN_THROTTLE_BURST)
+        self.assertEqual(statuses[-1], 429)
+        # The throttled attempt never reaches the password hasher
+        self.assertEqual(authenticate.call_count, settings.LOGIN_THROTTLE_BURST)
+
+    @mock.patch('login_registration.views.authenticate', return_value=None)
+    def test_username_bucket_ignores_case_and_client_ip(self, authenticate):
+        url = reverse('login_registration:login')
+        for attempt in range(settings.LOGIN_THROTTLE_BURST):
+            username = 'RIDER' if attempt % 2 else 'rider'
+            self.client.post(url, {'username': username, 'password': 'wrong'}, REMOTE_ADDR=f'10.0.0.{attempt}')
+
+        response = self.client.post(url, {'username': 'Rider', 'password': 'wrong'}, REMOTE_ADDR='10.0.1.1')
+        self.assertEqual(response.status_code, 429)
+
+
+    def test_spoofed_forwarded_for_does_not_get_a_fresh_bucket(self):
+        url = reverse('login_registration:register')
+        statuses = [self.client.post(url, _registration(username=f'rider{attempt}', email=f'r{attempt}@example.com'),
+                                     HTTP_X_FORWARDED_FOR=f'203.0.113.{attempt}, 198.51.100.7').status_code
+                    for attempt in range(settings.REGISTER_THROTTLE_BURST + 1)]
+
+        self.assertNotIn(429, statuses[:-1])
+        self.assertEqual(statuses[-1], 429)
+
+    @override_settings(TRUSTED_PROXY_COUNT=2)
+    def test_client_is_the_hop_the_outermost_trusted_proxy_appended(self):
+        from django.test import RequestFactory
+        from .throttling import _client_ip
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='10.9.9.9, 198.51.100.7, 10.0.0.2')
+        self.assertEqual(_client_ip(request), '198.51.100.7')
+        with override_settings(TRUSTED_PROXY_COUNT=0):
+            self.assertEqual(_client_ip(request), request.META['REMOTE_ADDR'])
+
+
+class RegistrationUniquenessTests(TestCase):
+    def setUp(self):
+        User.objects.create_user('rider', 'Rider@Example.com', 'correct-horse')
+
+    def test_email_is_unique_regardless_of_case(self):
+        form = RegistrationForm(_registration(email='rider@EXAMPLE.com'))
+
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['email'], ["Email already registered."])
+
+    def test_both_errors_come_from_one_query(self):
+        form = RegistrationForm(_registration(username='rider', email='RIDER@example.com'))
+
+        with self.assertNumQueries(1):
+            self.assertFalse(form.is_valid())
+        self.assertIn('username', form.errors)
+        self.assertIn('email', form.errors)
+
+    def test_new_email_is_accepted(self):
+        self.assertTrue(RegistrationForm(_registration(email='someone.else@example.com')).is_valid())
+
+
+class EmailIndexMigrationTests(TestCase):
+    def test_auth_user_email_indexes_exist(self):
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, 'auth_user')
+
+        self.assertIn('auth_user_email_trancit_idx', indexes)
+        self.assertEqual(indexes['auth_user_email_trancit_idx']['columns'], ['email'])
+        self.assertIn('auth_user_email_lower_trancit_idx', indexes)
+
+
+@override_settings(STORAGES=PLAIN_STATIC_STORAGES)
+class PasswordRehashTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def _login(self, username, password):
+        return self.client.post(reverse('login_registration:login'), {'username': username, 'password': password})
+
+    def test_pbkdf2_hash_is_upgraded_to_the_preferred_hasher_on_login(self):
+        preferred = get_hashers()[0].algorithm
+        if preferred == 'pbkdf2_sha256':
+            self.skipTest("the preferred hasher is PBKDF2 already")
+        user = User.objects.create(username='rider', password=make_password('correct-horse', hasher='pbkdf2_sha256'))
+
+        self.assertRedirects(self._login('rider', 'correct-horse'), '/routes/', fetch_redirect_response=False)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith(f"{preferred}$"))
+        self.assertTrue(user.check_password('correct-horse'))
+
+    def test_hash_with_old_cost_parameters_is_rehashed(self):
+        if settings.AUTH_PASSWORD_HASHER != 'scrypt':
+            self.skipTest("cost upgrade is checked against the scrypt hasher")
+        with mock.patch.object(TunedScryptPasswordHasher, 'work_factor', 2 ** 10):
+            user = User.objects.create(username='rider', password=make_password('correct-horse'))
+        old_hash = user.password
+
+        self._login('rider', 'correct-horse')
+        user.refresh_from_db()
+        self.assertNotEqual(user.password, old_hash)
+        self.assertEqual(TunedScryptPasswordHasher().decode(user.password)['work_factor'],
+                         settings.SCRYPT_WORK_FACTOR)
+
+    def test_failed_login_keeps_the_old_hash(self):
+        user = User.objects.create(username='rider', password=make_password('correct-horse', hasher='pbkdf2_sha256'))
+
+        self._login('rider', 'wrong-horse')
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
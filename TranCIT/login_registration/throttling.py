@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _client_ip(request):
+    """
+    The address the outermost trusted proxy saw. Each of the TRUSTED_PROXY_COUNT
+    proxies appends the hop it received from to X-Forwarded-For, so anything to the
+    left of those is whatever the client sent and cannot be trusted.
+    """
+    proxies = settings.TRUSTED_PROXY_COUNT
+    hops = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+    if proxies and hops:
+        return hops[-min(proxies, len(hops))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def take_token(key, burst, per_minute):
+    """
+    Take one token from the bucket stored under `key` in the cache.
+    Returns False when the bucket is empty, i.e. the attempt should be rejected.
+    """
+    refill_per_second = per_minute / 60.0
+    now = time.time()
+    state = cache.get(key)
+    if state is None:
+        tokens, stamp = float(burst), now
+    else:
+        tokens, stamp = state
+        tokens = min(float(burst), tokens + (now - stamp) * refill_per_second)
+
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    # Keep the bucket only as long as it takes to refill completely.
+    ttl = int(burst / refill_per_second) + 1 if refill_per_second else None
+    cache.set(key, (tokens, now), ttl)
+    return allowed
+
+
+def allow_attempt(request, scope, burst, per_minute, identifier=None):
+    """Check the per-IP bucket and, if given, the per-identifier (e.g. username) bucket."""
+    keys = [f"throttle:{scope}:ip:{_client_ip(request)}"]
+    if identifier:
+        keys.append(f"throttle:{scope}:id:{identifier.strip().lower()}")
+    # Evaluate every bucket so a blocked IP still drains the account bucket.
+    results = [take_token(key, burst, per_minute) for key in keys]
+    return all(results)
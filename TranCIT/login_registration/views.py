@@ -2,7 +2,11 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.contrib import messages
+from django.conf import settings
 from .forms import RegistrationForm, LoginForm
+from .throttling import allow_attempt
+
+THROTTLED_MESSAGE = 'Too many attempts. Please wait a minute and try again.'
 
 def login_view(request):
     # If user is already authenticated, redirect them
@@ -16,7 +20,15 @@ def login_view(request):
         if form.is_valid():
             username = form.cleaned_data.get('username')
             password = form.cleaned_data.get('password')
-            
+
+            # Reject brute-force attempts before authenticate() does any hashing work
+            if not allow_attempt(request, 'login', settings.LOGIN_THROTTLE_BURST,
+                                 settings.LOGIN_THROTTLE_PER_MINUTE, identifier=username):
+                messages.error(request, THROTTLED_MESSAGE)
+                return render(request, 'login_registration/login.html', {
+                    'show_register': show_register
+                }, status=429)
+
             user = authenticate(request, username=username, password=password)
             
             if user is not None:
@@ -43,6 +55,14 @@ def register_view(request):
     show_register = True
     
     if request.method == 'POST':
+        # create_user() hashes the password, so throttle before validating anything
+        if not allow_attempt(request, 'register', settings.REGISTER_THROTTLE_BURST,
+                             settings.REGISTER_THROTTLE_PER_MINUTE):
+            messages.error(request, THROTTLED_MESSAGE)
+            return render(request, 'login_registration/login.html', {
+                'show_register': show_register
+            }, status=429)
+
         form = RegistrationForm(request.POST)
         if form.is_valid():
             username = form.cleaned_data.get('username')
@@ -1,8 +1,78 @@
-
-
 from django.contrib import admin
-from .models import Route 
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import JeepneyLine, Route, ProfileCapture
+from .profiling import PROFILE_HEADER, PROFILE_TOKEN_MAX_AGE, capture_file, delete_capture_files, make_token
 
 
 admin.site.register(Route)
 
+
+@admin.register(JeepneyLine)
+class JeepneyLineAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name', 'length_km', 'route_count', 'updated_at')
+    search_fields = ('code', 'name')
+    readonly_fields = [f.name for f in JeepneyLine._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ProfileCapture)
+class ProfileCaptureAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'view_name', 'method', 'path', 'status_code', 'duration_ms', 'sample_count',
+                    'trigger', 'downloads')
+    list_filter = ('view_name', 'trigger')
+    search_fields = ('path',)
+    date_hierarchy = 'created_at'
+    readonly_fields = [f.name for f in ProfileCapture._meta.fields] + ['downloads']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Files")
+    def downloads(self, obj):
+        return format_html(
+            '<a href="{}">flamegraph (.folded)</a> | <a href="{}">speedscope</a>',
+            reverse('admin:route_input_profilecapture_download', args=[obj.pk, 'folded']),
+            reverse('admin:route_input_profilecapture_download', args=[obj.pk, 'speedscope']),
+        )
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/<str:fmt>/', self.admin_site.admin_view(self.download),
+                 name='route_input_profilecapture_download'),
+        ] + super().get_urls()
+
+    def download(self, request, pk, fmt):
+        capture = get_object_or_404(ProfileCapture, pk=pk)
+        if fmt not in ('folded', 'speedscope') or not self.has_view_permission(request, capture):
+            raise Http404
+        file_path = capture_file(capture, fmt)
+        if not file_path.exists():
+            raise Http404("Capture file was removed")
+        return FileResponse(open(file_path, 'rb'), as_attachment=True, filename=file_path.name)
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = dict(extra_context or {})
+        extra_context.update(
+            profile_header=PROFILE_HEADER,
+            profile_token=make_token(request.user),
+            profile_token_minutes=PROFILE_TOKEN_MAX_AGE // 60,
+        )
+        return super().changelist_view(request, extra_context)
+
+    def delete_model(self, request, obj):
+        delete_capture_files(obj)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for capture in queryset:
+            delete_capture_files(capture)
+        super().delete_queryset(request, queryset)
@@ -0,0 +1,162 @@
+# --- START OF FILE: route_input/admission.py ---
+
+"""
+Admission control for the expensive route calculations (dashboard with
+coordinates, plan_route).
+
+A request is admitted at full cost only if
+1. the client's token buckets (per IP and, when logged in, per user) have a
+   token left,
+2. fewer than `global_limit` calculations are in flight across all workers
+   (a counter in the Django cache, so it needs REDIS_URL to span processes), and
+3. a slot of this process's `concurrency` limit frees up, waiting at most
+   `wait` seconds in a queue of at most `queue` requests.
+
+Anything else is shed: the caller still answers, but degraded (no ORS or
+Nominatim calls, straight-line estimates, a lighter map) instead of piling up
+until gunicorn's worker timeout kills it.
+"""
+
+from collections import namedtuple
+from contextlib import contextmanager
+import logging
+import threading
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+
+from login_registration.throttling import allow_attempt
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_LIMITS = getattr(settings, 'ADMISSION_LIMITS', {
+    'route_calculation': {
+        'concurrency': 4, 'queue': 8, 'wait': 2.0, 'global_limit': 16,
+        'burst': 10, 'per_minute': 30,
+    },
+})
+# In-flight counters expire so a crashed worker can't leak slots forever
+IN_FLIGHT_TTL = getattr(settings, 'ADMISSION_IN_FLIGHT_TTL', 60)
+
+Admission = namedtuple('Admission', 'admitted reason')
+
+ADMITTED = Admission(True, None)
+
+
+class ConcurrencyLimiter:
+    """Per-process concurrency limit with a bounded, time-limited wait queue."""
+
+    def __init__(self, limit, max_waiting, wait_timeout):
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.waiting = 0
+
+    def acquire(self):
+        if self._slots.acquire(blocking=False):
+            return True
+        with self._lock:
+            if self.waiting >= self.max_waiting:
+                return False
+            self.waiting += 1
+        try:
+            return self._slots.acquire(timeout=self.wait_timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    def release(self):
+        self._slots.release()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def _limiter(endpoint):
+    with _limiters_lock:
+        if endpoint not in _limiters:
+            config = ADMISSION_LIMITS[endpoint]
+            _limiters[endpoint] = ConcurrencyLimiter(config['concurrency'], config['queue'], config['wait'])
+        return _limiters[endpoint]
+
+
+def _count(endpoint, outcome):
+    with _stats_lock:
+        counts = _stats.setdefault(endpoint, {'admitted': 0, 'rate_limited': 0, 'overloaded': 0, 'busy': 0})
+        counts[outcome] += 1
+    if outcome != 'admitted':
+        logger.info("Shedding %s request: %s", endpoint, outcome)
+
+
+def admission_stats():
+    """Outcome counters for this worker process."""
+    with _stats_lock:
+        return {endpoint: dict(counts) for endpoint, counts in _stats.items()}
+
+
+def _in_flight_key(endpoint):
+    return f"admission:in_flight:{endpoint}"
+
+
+def _enter_global(endpoint, limit):
+    key = _in_flight_key(endpoint)
+    cache.add(key, 0, IN_FLIGHT_TTL)
+    try:
+        in_flight = cache.incr(key)
+    except ValueError:  # expired between add() and incr()
+        cache.add(key, 1, IN_FLIGHT_TTL)
+        in_flight = 1
+    if in_flight > limit:
+        _leave_global(endpoint)
+        return False
+    return True
+
+
+def _leave_global(endpoint):
+    try:
+        cache.decr(_in_flight_key(endpoint))
+    except ValueError:
+        pass  # counter expired meanwhile; it restarts from zero
+
+
+@contextmanager
+def admit(request, endpoint='route_calculation'):
+    """
+    Context manager yielding an Admission. When `admitted` is False the caller
+    must take its cheap path; `reason` says why ('rate_limited', 'overloaded',
+    'busy').
+    """
+    config = ADMISSION_LIMITS[endpoint]
+    # The user id from the session, so the check doesn't cost a query for request.user
+    session = getattr(request, 'session', None)
+    user_id = session.get(SESSION_KEY) if session is not None else None
+    identifier = f"user-{user_id}" if user_id else None
+    if not allow_attempt(request, f"admission:{endpoint}", config['burst'], config['per_minute'], identifier):
+        _count(endpoint, 'rate_limited')
+        yield Admission(False, 'rate_limited')
+        return
+
+    if not _enter_global(endpoint, config['global_limit']):
+        _count(endpoint, 'overloaded')
+        yield Admission(False, 'overloaded')
+        return
+    try:
+        limiter = _limiter(endpoint)
+        if not limiter.acquire():
+            _count(endpoint, 'busy')  # queue full, or no slot within `wait`
+            yield Admission(False, 'busy')
+            return
+        try:
+            _count(endpoint, 'admitted')
+            yield ADMITTED
+        finally:
+            limiter.release()
+    finally:
+        _leave_global(endpoint)
+
+# --- END OF FILE: route_input/admission.py ---
@@ -0,0 +1,318 @@
+# --- START OF FILE: route_input/analytics.py ---
+
+"""
+Search analytics in bounded memory: which origins, destinations, jeepney codes
+and origin/destination pairs people look for (dashboard search filters and
+plan_route).
+
+Every worker keeps, per dimension and time window (SEARCH_ANALYTICS_WINDOW):
+
+- a space-saving summary: at most SEARCH_ANALYTICS_CAPACITY counted terms; a new
+  term replaces the smallest one and inherits its count, so every term searched
+  more than total / capacity times is guaranteed to be in it;
+- a count-min sketch (depth x width counters) over all terms, which also only
+  overestimates.
+
+flush() writes each dimension's top SEARCH_ANALYTICS_TOP_K terms, counted as the
+smaller of the two estimates, into SearchRollup, adding to what other workers
+wrote for the same window. Flushes happen every SEARCH_ANALYTICS_FLUSH_INTERVAL
+seconds (on the next search), on exit, and before the rollups are read; a
+failed flush keeps its data for the next one. Memory per worker is fixed by the
+settings, whatever people type.
+
+top_terms() and precompute_targets() read the rollups: the staff dashboard
+(/routes/analytics/) and `manage.py warm_caches --from-analytics`, which
+geocodes and routes the most searched places and pairs ahead of time.
+"""
+
+import atexit
+from datetime import datetime, timedelta, timezone as dt_timezone
+import hashlib
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError, models, transaction
+from django.utils import timezone
+
+from .models import SearchRollup
+
+logger = logging.getLogger(__name__)
+
+SEARCH_ANALYTICS = getattr(settings, 'SEARCH_ANALYTICS', True)
+SEARCH_ANALYTICS_WINDOW = getattr(settings, 'SEARCH_ANALYTICS_WINDOW', 60 * 60)  # seconds per rollup window
+SEARCH_ANALYTICS_FLUSH_INTERVAL = getattr(settings, 'SEARCH_ANALYTICS_FLUSH_INTERVAL', 60)  # seconds
+SEARCH_ANALYTICS_TOP_K = getattr(settings, 'SEARCH_ANALYTICS_TOP_K', 50)  # terms written per dimension and flush
+SEARCH_ANALYTICS_CAPACITY = getattr(settings, 'SEARCH_ANALYTICS_CAPACITY', 200)  # terms tracked per dimension
+SEARCH_ANALYTICS_SKETCH = getattr(settings, 'SEARCH_ANALYTICS_SKETCH', (4, 1024))  # count-min depth, width
+SEARCH_ANALYTICS_RETENTION_DAYS = getattr(settings, 'SEARCH_ANALYTICS_RETENTION_DAYS', 90)
+# Windows kept in memory while the database cannot be written
+SEARCH_ANALYTICS_MAX_UNFLUSHED = getattr(settings, 'SEARCH_ANALYTICS_MAX_UNFLUSHED', 24)
+
+DIMENSIONS = tuple(name for name, _ in SearchRollup.DIMENSIONS)
+PAIR_SEPARATOR = ' -> '
+TERM_MAX_LENGTH = SearchRollup._meta.get_field('term').max_length
+
+
+# -----------------------------
+# Sketches
+# -----------------------------
+
+class CountMinSketch:
+    """depth x width counters; estimate() never undercounts, overcounts by ~e/width of the total."""
+
+    def __init__(self, depth, width):
+        self.depth, self.width = depth, width
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self._rows = np.arange(depth)
+
+    def _columns(self, term):
+        digest = hashlib.blake2b(term.encode('utf-8'), digest_size=8 * self.depth).digest()
+        return np.frombuffer(digest, dtype='<u8') % self.width
+
+    def add(self, term, count=1):
+        self.table[self._rows, self._columns(term)] += count
+
+    def estimate(self, term):
+        return int(self.table[self._rows, self._columns(term)].min())
+
+    def merge(self, other):
+        self.table += other.table
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+
+class SpaceSaving:
+    """Top terms in at most `capacity` counters (Metwally et al.): {term: [count, overcount]}."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counters = {}
+
+    def add(self, term, count=1):
+        counter = self.counters.get(term)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[term] = [count, 0]
+        else:
+            # Linear scan: capacity is small and this only happens for a new term
+            smallest = min(self.counters, key=lambda t: self.counters[t][0])
+            floor = self.counters.pop(smallest)[0]
+            self.counters[term] = [floor + count, floor]
+
+    def merge(self, other):
+        for term, (count, _) in other.counters.items():
+            self.add(term, count)
+
+    def top(self, k):
+        """[(term, count, overcount)], most counted first."""
+        ranked = sorted(self.counters.items(), key=lambda item: (-item[1][0], item[0]))[:k]
+        return [(term, count, overcount) for term, (count, overcount) in ranked]
+
+
+class WindowSketches:
+    """Both sketches for every dimension of one window."""
+
+    def __init__(self, start):
+        self.start = start
+        self.total = 0
+        depth, width = SEARCH_ANALYTICS_SKETCH
+        self.dimensions = {name: (SpaceSaving(SEARCH_ANALYTICS_CAPACITY), CountMinSketch(depth, width))
+                           for name in DIMENSIONS}
+
+    def add(self, dimension, term):
+        top, sketch = self.dimensions[dimension]
+        top.add(term)
+        sketch.add(term)
+
+    def merge(self, other):
+        self.total += other.total
+        for name, (top, sketch) in other.dimensions.items():
+            self.dimensions[name][0].merge(top)
+            self.dimensions[name][1].merge(sketch)
+
+    def rollup_counts(self, k=None):
+        """{(dimension, term): count} of the top k terms per dimension."""
+        counts = {}
+        for name, (top, sketch) in self.dimensions.items():
+            for term, count, _ in top.top(k or SEARCH_ANALYTICS_TOP_K):
+                counts[(name, term)] = min(count, sketch.estimate(term))
+        return counts
+
+
+# -----------------------------
+# Recording
+# -----------------------------
+
+_lock = threading.Lock()
+_current = None  # WindowSketches of the window being counted
+_closed = []  # earlier windows not flushed yet, oldest first
+_state = {'started': time.monotonic(), 'searches': 0, 'flushes': 0, 'rows_written': 0, 'failures': 0, 'dropped': 0}
+
+
+def normalise(term):
+    """Case- and whitespace-insensitive form of a search term ('' when blank)."""
+    return ' '.join(str(term or '').split()).casefold()[:TERM_MAX_LENGTH]
+
+
+def window_start(when=None):
+    """Start of the rollup window containing `when` (aligned to the epoch, UTC)."""
+    seconds = (when or timezone.now()).timestamp()
+    return datetime.fromtimestamp(seconds - seconds % SEARCH_ANALYTICS_WINDOW, tz=dt_timezone.utc)
+
+
+def _window(start):
+    """The current window's sketches, closing the previous window when a new one begins. Call with _lock held."""
+    global _current
+    if _current is None or _current.start != start:
+        if _current is not None and _current.total:
+            _closed.append(_current)
+        _current = WindowSketches(start)
+    return _current
+
+
+def record_search(origin=None, destination=None, code=None, when=None):
+    """Count one search; blank parts are ignored and a pair is counted when both ends are given."""
+    if not SEARCH_ANALYTICS:
+        return
+    terms = {'origin': normalise(origin), 'destination': normalise(destination), 'code': normalise(code)}
+    if terms['origin'] and terms['destination']:
+        terms['pair'] = (terms['origin'] + PAIR_SEPARATOR + terms['destination'])[:TERM_MAX_LENGTH]
+    terms = {name: term for name, term in terms.items() if term}
+    if not terms:
+        return
+    start = window_start(when)
+    with _lock:
+        window = _window(start)
+        window.total += 1
+        for name, term in terms.items():
+            window.add(name, term)
+        _state['searches'] += 1
+        due = time.monotonic() - _state['started'] >= SEARCH_ANALYTICS_FLUSH_INTERVAL
+    if due:
+        flush()
+
+
+def _keep_unflushed(windows):
+    """Put windows that could not be written back, merging them into their window if it is still counted."""
+    global _current
+    with _lock:
+        for window in windows:
+            if _current is not None and _current.start == window.start:
+                _current.merge(window)
+            else:
+                _closed.insert(0, window)
+        _closed.sort(key=lambda w: w.start)
+        while len(_closed) > SEARCH_ANALYTICS_MAX_UNFLUSHED:
+            _closed.pop(0)
+            _state['dropped'] += 1
+
+
+def _write(counts_by_window):
+    """Add {window_start: {(dimension, term): count}} to SearchRollup; returns rows written."""
+    keys = [(start, name, term) for start, counts in counts_by_window.items() for name, term in counts]
+    if not keys:
+        return 0
+    with transaction.atomic():
+        # Create missing rows at 0 first, so concurrent flushes from other workers only ever add
+        SearchRollup.objects.bulk_create(
+            [SearchRollup(window_start=start, dimension=name, term=term) for start, name, term in keys],
+            ignore_conflicts=True, batch_size=500)
+        ids = {(row.window_start, row.dimension, row.term): row.pk for row in SearchRollup.objects.filter(
+            window_start__in=list(counts_by_window), dimension__in=DIMENSIONS,
+            term__in=list({term for _, _, term in keys})).only('id', 'window_start', 'dimension', 'term')}
+        rows = []
+        for start, name, term in keys:
+            row = SearchRollup(pk=ids[(start, name, term)])
+            row.count = models.F('count') + counts_by_window[start][(name, term)]
+            rows.append(row)
+        SearchRollup.objects.bulk_update(rows, ['count'], batch_size=500)
+    return len(rows)
+
+
+def flush():
+    """Write the sketches' top terms to SearchRollup; returns the number of rows written."""
+    global _current
+    with _lock:
+        windows, _closed[:] = list(_closed), []
+        if _current is not None and _current.total:
+            windows.append(_current)
+            _current = WindowSketches(_current.start)
+        _state['started'] = time.monotonic()
+    if not windows:
+        return 0
+
+    counts_by_window = {}
+    for window in windows:
+        counts = counts_by_window.setdefault(window.start, {})
+        for key, count in window.rollup_counts().items():
+            counts[key] = counts.get(key, 0) + count
+    try:
+        written = _write(counts_by_window)
+        if len(counts_by_window) > 1 or min(counts_by_window) < window_start():
+            # A window was closed since the last flush: drop rollups past retention
+            SearchRollup.objects.filter(
+                window_start__lt=timezone.now() - timedelta(days=SEARCH_ANALYTICS_RETENTION_DAYS)).delete()
+    except DatabaseError:
+        logger.exception("Could not write search analytics for %s windows; keeping them for the next flush",
+                         len(windows))
+        _keep_unflushed(windows)
+        with _lock:
+            _state['failures'] += 1
+        return 0
+
+    with _lock:
+        _state['flushes'] += 1
+        _state['rows_written'] += written
+    return written
+
+
+atexit.register(flush)
+
+
+# -----------------------------
+# Reading
+# -----------------------------
+
+def top_terms(dimension, days=7, limit=20, now=None):
+    """[(term, count)] most searched in the last `days` (after a flush), most searched first."""
+    flush()
+    since = window_start((now or timezone.now()) - timedelta(days=days))
+    rows = (SearchRollup.objects.filter(dimension=dimension, window_start__gte=since)
+            .values('term').annotate(total=models.Sum('count'))
+            .order_by('-total', 'term')[:limit])
+    return [(row['term'], row['total']) for row in rows]
+
+
+def split_pair(term):
+    origin, _, destination = term.partition(PAIR_SEPARATOR)
+    return origin, destination
+
+
+def precompute_targets(days=7, limit=50):
+    """What to compute ahead of time: {'places': [...], 'pairs': [(origin, destination)]}, most searched first."""
+    places = {}
+    for dimension in ('origin', 'destination'):
+        for term, count in top_terms(dimension, days, limit):
+            places[term] = places.get(term, 0) + count
+    return {
+        'places': sorted(places, key=lambda term: (-places[term], term))[:limit],
+        'pairs': [split_pair(term) for term, _ in top_terms('pair', days, limit)],
+    }
+
+
+def stats():
+    """Counters and sketch sizes for this worker process."""
+    with _lock:
+        windows = _closed + ([_current] if _current is not None else [])
+        tracked = {name: sum(len(window.dimensions[name][0].counters) for window in windows) for name in DIMENSIONS}
+        sketch_bytes = sum(sketch.nbytes for window in windows for _, sketch in window.dimensions.values())
+        counters = {name: value for name, value in _state.items() if name != 'started'}
+        return dict(counters, windows_in_memory=len(windows), terms_tracked=tracked, sketch_bytes=sketch_bytes)
+
+# --- END OF FILE: route_input/analytics.py ---
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RouteInputConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'route_input'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,138 @@
+# --- START OF FILE: route_input/assets.py ---
+
+"""
+Static asset bundles and vendored folium/Leaflet assets.
+
+`python manage.py build_assets` (run from build.sh before collectstatic) writes
+minified bundles and a local copy of the CDN files folium.Map pulls in into
+STATICFILES_DIRS. collectstatic then gives them content-hashed names plus .gz/.br
+variants, which WhiteNoise serves with far-future cache headers.
+"""
+
+from functools import lru_cache
+from pathlib import Path
+import json
+import logging
+import re
+
+from django.conf import settings
+from django.templatetags.static import static
+
+logger = logging.getLogger(__name__)
+
+# Bundle name -> source files (static paths), concatenated in order.
+BUNDLES = {
+    'dashboard.css': ['route_input/css/styles.css'],
+    'dashboard.js': ['route_input/js/network-sync.js', 'route_input/js/script.js'],
+    'login.css': ['login_registration/css/styles.css'],
+    'login.js': ['login_registration/js/animation.js'],
+}
+
+BUNDLE_DIR = 'bundles'
+FOLIUM_VENDOR_DIR = 'vendor/folium'
+FOLIUM_VENDOR_MANIFEST = f'{FOLIUM_VENDOR_DIR}/manifest.json'
+
+
+def build_dir():
+    """First STATICFILES_DIRS entry; generated assets live there, outside the apps."""
+    return Path(settings.STATICFILES_DIRS[0])
+
+
+def bundle_path(name):
+    stem, ext = name.rsplit('.', 1)
+    return f'{BUNDLE_DIR}/{stem}.min.{ext}'
+
+
+# -----------------------------
+# Minification
+# -----------------------------
+
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACE_RE = re.compile(r'\s+')
+_CSS_BLOCK_SPLIT_RE = re.compile(r'(?<=[{}])')
+# Spaces around ':' only go inside declaration blocks: in a selector, "a :hover"
+# (any hovered descendant) and "a:hover" are different selectors.
+_CSS_SELECTOR_PUNCT_RE = re.compile(r'\s*([{},>])\s*')
+_CSS_DECLARATION_PUNCT_RE = re.compile(r'\s*([};:,])\s*')
+
+
+def minify_css(source):
+    css = _CSS_COMMENT_RE.sub('', source)
+    css = _CSS_SPACE_RE.sub(' ', css)
+    parts = []
+    # Each piece ends at a brace: '...}' is a declaration block, '...{' a selector or at-rule prelude
+    for piece in _CSS_BLOCK_SPLIT_RE.split(css):
+        punct = _CSS_DECLARATION_PUNCT_RE if piece.endswith('}') else _CSS_SELECTOR_PUNCT_RE
+        parts.append(punct.sub(r'\1', piece.strip()))
+    return ''.join(parts).replace(';}', '}')
+
+
+def minify_js(source):
+    """
+    Use rjsmin when it is installed. Otherwise only strip indentation, blank lines
+    and whole-line // comments, which cannot change the meaning of our scripts
+    (none of them use multi-line template literals).
+    """
+    try:
+        import rjsmin
+    except ImportError:
+        rjsmin = None
+    if rjsmin is not None:
+        return rjsmin.jsmin(source)
+
+    lines = []
+    for line in source.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('//'):
+            continue
+        lines.append(stripped)
+    return '\n'.join(lines)
+
+
+MINIFIERS = {
+    'css': minify_css,
+    'js': minify_js,
+}
+
+
+# -----------------------------
+# Runtime lookups
+# -----------------------------
+
+def use_bundles():
+    return getattr(settings, 'USE_ASSET_BUNDLES', False)
+
+
+def bundle_sources(name):
+    """Static paths to reference for a bundle: the bundle itself if built, else its sources."""
+    if use_bundles():
+        return [bundle_path(name)]
+    return list(BUNDLES[name])
+
+
+@lru_cache(maxsize=1)
+def _folium_vendor_manifest():
+    manifest_file = build_dir() / FOLIUM_VENDOR_MANIFEST
+    if not manifest_file.exists():
+        return {}
+    try:
+        with open(manifest_file, encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        logger.exception("Unreadable folium vendor manifest %s", manifest_file)
+        return {}
+
+
+def localize_folium_assets(folium_map):
+    """
+    Point a folium.Map at the vendored copies of its Leaflet/Bootstrap/Font Awesome
+    assets. URLs that were not vendored (e.g. after a folium upgrade) keep using the CDN.
+    """
+    urls = _folium_vendor_manifest().get('files', {})
+    if not urls:
+        return folium_map
+    folium_map.default_js = [(name, static(urls[url]) if url in urls else url) for name, url in folium_map.default_js]
+    folium_map.default_css = [(name, static(urls[url]) if url in urls else url) for name, url in folium_map.default_css]
+    return folium_map
+
+# --- END OF FILE: route_input/assets.py ---
@@ -0,0 +1,246 @@
+# --- START OF FILE: route_input/batch.py ---
+
+"""
+Batch trip planning: fares and travel times for many origin/destination pairs.
+
+Each item is {"origin": ..., "destination": ..., "transport_type": "Jeepney", "code": "01A"}
+where origin/destination are a place name or coordinates ([lat, lon] or
+{"lat": ..., "lon": ...}). transport_type and code are optional.
+
+The work is deduplicated twice: every distinct place name is geocoded once and
+every distinct coordinate pair is routed once (one routing call prices every
+transport mode, see views.compare_transport_modes). Geocoding and routing run
+on bounded thread pools inside upstream.rate_limited(), so a batch of hundreds
+of pairs stays within Nominatim's and ORS's rate limits.
+
+plan_batch() yields one result dict per input item, as soon as its route is
+done (so not in input order; each result carries its "index"), followed by a
+summary dict. With persist=True successful results are also saved as Route
+rows, in chunks, and carry their "route_id".
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+
+from . import thumbnails
+from .dedupe import geometry_signature
+from .models import JEEPNEY_CODE_CHOICES, Route, route_display_label
+from .sync import log_changes
+from .upstream import rate_limited
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_PAIRS = getattr(settings, 'BATCH_MAX_PAIRS', 1000)
+BATCH_GEOCODE_WORKERS = getattr(settings, 'BATCH_GEOCODE_WORKERS', 2)
+BATCH_ROUTE_WORKERS = getattr(settings, 'BATCH_ROUTE_WORKERS', 4)
+BATCH_PERSIST_CHUNK = getattr(settings, 'BATCH_PERSIST_CHUNK', 50)
+
+TRANSPORT_TYPES = {choice for choice, _ in Route.TRANSPORT_CHOICES}
+JEEPNEY_CODES = {choice for choice, _ in JEEPNEY_CODE_CHOICES}
+
+
+class BatchError(ValueError):
+    """The batch as a whole is invalid (not a list, too many pairs)."""
+
+
+def _place(value):
+    """('text', name) or ('coords', (lat, lon)) with coordinates rounded to 6 decimals."""
+    if isinstance(value, dict):
+        value = [value.get('lat', value.get('latitude')), value.get('lon', value.get('longitude'))]
+    if isinstance(value, (list, tuple)):
+        if len(value) != 2:
+            raise ValueError("coordinates must be [lat, lon]")
+        lat, lon = (round(float(v), 6) for v in value)
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError("coordinates out of range")
+        return ('coords', (lat, lon))
+    if isinstance(value, str) and value.strip():
+        return ('text', ' '.join(value.split()))
+    raise ValueError("expected a place name or [lat, lon]")
+
+
+def parse_item(item):
+    """Validated (origin, destination, transport_type, code) for one batch item."""
+    if not isinstance(item, dict):
+        raise ValueError("each item must be an object")
+    transport_type = item.get('transport_type') or 'Jeepney'
+    if transport_type not in TRANSPORT_TYPES:
+        raise ValueError(f"unknown transport_type {transport_type!r}")
+    # Same rule as the forms: bulk_create() would store any string, bypassing the field's choices
+    code = (item.get('code') or None) if transport_type == 'Jeepney' else None
+    if code is not None and code not in JEEPNEY_CODES:
+        raise ValueError(f"unknown jeepney code {code!r}")
+    return _place(item.get('origin')), _place(item.get('destination')), transport_type, code
+
+
+def _in_worker(func, *args):
+    """Run func in a pool thread with rate limits on, and close the thread's DB connections after."""
+    try:
+        with rate_limited():
+            return func(*args)
+    finally:
+        connections.close_all()
+
+
+def _geocode(name):
+    from .views import _get_coords_from_request_data
+    lat, lon, error = _get_coords_from_request_data(name)
+    if error:
+        raise LookupError(error)
+    return float(lat), float(lon)
+
+
+def _route(origin, destination):
+    from .views import compare_transport_modes
+    modes, route_geojson = compare_transport_modes(*origin, *destination)
+    if not modes:
+        raise LookupError("Could not route between these points.")
+    return {mode['transport_type']: mode for mode in modes}, route_geojson
+
+
+def _result(index, origin, destination, transport_type, code, coords, routed):
+    origin_coords, destination_coords = coords
+    modes, _ = routed
+    mode = modes[transport_type]
+    return {
+        'index': index,
+        'status': 'ok',
+        'origin': origin[1] if origin[0] == 'text' else None,
+        'destination': destination[1] if destination[0] == 'text' else None,
+        'origin_coords': list(origin_coords),
+        'destination_coords': list(destination_coords),
+        'transport_type': transport_type,
+        'code': code,
+        'distance_km': str(mode['distance_km']),
+        'travel_time_minutes': None if mode['travel_time_minutes'] is None else str(mode['travel_time_minutes']),
+        'fare': None if mode['fare'] is None else str(mode['fare']),
+        'source': mode['source'],
+    }
+
+
+def _route_row(result, route_geojson):
+    from .views import store_route_path
+    origin = result['origin'] or '{:.6f}, {:.6f}'.format(*result['origin_coords'])
+    destination = result['destination'] or '{:.6f}, {:.6f}'.format(*result['destination_coords'])
+    route = Route(
+        origin=origin[:255], destination=destination[:255],
+        origin_latitude=Decimal(f"{result['origin_coords'][0]:.6f}"),
+        origin_longitude=Decimal(f"{result['origin_coords'][1]:.6f}"),
+        destination_latitude=Decimal(f"{result['destination_coords'][0]:.6f}"),
+        destination_longitude=Decimal(f"{result['destination_coords'][1]:.6f}"),
+        transport_type=result['transport_type'], code=result['code'],
+        distance_km=result['distance_km'], travel_time_minutes=result['travel_time_minutes'], fare=result['fare'],
+        notes='Batch trip planning',
+    )
+    # bulk_create() skips save(), which normally fills the label, signature and thumbnail key in
+    route.display_label = route_display_label(route.transport_type, route.code, route.origin, route.destination)
+    store_route_path(route, route_geojson)
+    path = route.get_path_coords()
+    route.geometry_signature = geometry_signature(path)
+    route.thumbnail_key = thumbnails.geometry_key(path)
+    return route
+
+
+def _save_chunk(pending):
+    """bulk_create the Routes for [(result, route_geojson), ...], set each result's route_id, return the count."""
+    if not pending:
+        return 0
+    rows = [_route_row(result, geojson) for result, geojson in pending]
+    try:
+        with transaction.atomic():
+            Route.objects.bulk_create(rows)
+            # bulk_create() sends no post_save either
+            log_changes([row.pk for row in rows])
+    except DatabaseError:
+        logger.exception("Could not save %s batch routes", len(rows))
+        for result, _ in pending:
+            result['route_id'] = None
+        return 0
+    for (result, _), row in zip(pending, rows):
+        result['route_id'] = row.pk
+    return len(rows)
+
+
+def plan_batch(items, persist=False, geocode_workers=BATCH_GEOCODE_WORKERS, route_workers=BATCH_ROUTE_WORKERS):
+    """
+    Iterator over a result per item (as completed), then {'summary': {...}}. See
+    the module docstring. Raises BatchError up front, before any work starts.
+    """
+    if not isinstance(items, list):
+        raise BatchError("expected a list of origin/destination pairs")
+    if len(items) > BATCH_MAX_PAIRS:
+        raise BatchError(f"at most {BATCH_MAX_PAIRS} pairs per batch")
+    return _plan(items, persist, geocode_workers, route_workers)
+
+
+def _plan(items, persist, geocode_workers, route_workers):
+    parsed = {}
+    for index, item in enumerate(items):
+        try:
+            parsed[index] = parse_item(item)
+        except (ValueError, TypeError) as e:
+            yield {'index': index, 'status': 'error', 'error': str(e)}
+
+    names = {place[1] for origin, destination, _, _ in parsed.values()
+             for place in (origin, destination) if place[0] == 'text'}
+    counts = {'pairs': len(items), 'places_geocoded': len(names), 'routes_computed': 0,
+              'ok': 0, 'errors': len(items) - len(parsed), 'saved': 0}
+
+    geocoder = ThreadPoolExecutor(geocode_workers, thread_name_prefix='batch-geocode')
+    router = ThreadPoolExecutor(route_workers, thread_name_prefix='batch-route')
+    try:
+        geocoded = {name: geocoder.submit(_in_worker, _geocode, name) for name in names}
+
+        def coords_of(place):
+            return geocoded[place[1]].result() if place[0] == 'text' else place[1]
+
+        def resolve_and_route(origin, destination):
+            coords = (coords_of(origin), coords_of(destination))
+            return coords, _in_worker(_route, *coords)
+
+        # One routing job per distinct (origin, destination); the transport type only picks a mode
+        jobs = {}
+        for index, (origin, destination, transport_type, code) in parsed.items():
+            jobs.setdefault((origin, destination), []).append((index, transport_type, code))
+        futures = {router.submit(resolve_and_route, *key): key for key in jobs}
+        counts['routes_computed'] = len(futures)
+
+        pending = []
+        for future in as_completed(futures):
+            origin, destination = futures[future]
+            try:
+                coords, routed = future.result()
+            except Exception as e:  # geocoding or routing failed for this pair
+                if not isinstance(e, LookupError):
+                    logger.exception("Batch route %s -> %s failed", origin[1], destination[1])
+                for index, _, _ in jobs[(origin, destination)]:
+                    counts['errors'] += 1
+                    yield {'index': index, 'status': 'error', 'error': str(e) or e.__class__.__name__}
+                continue
+            for index, transport_type, code in jobs[(origin, destination)]:
+                result = _result(index, origin, destination, transport_type, code, coords, routed)
+                counts['ok'] += 1
+                if not persist:
+                    yield result
+                    continue
+                pending.append((result, routed[1]))
+                if len(pending) >= BATCH_PERSIST_CHUNK:
+                    counts['saved'] += _save_chunk(pending)
+                    yield from (result for result, _ in pending)
+                    pending = []
+        if persist:
+            counts['saved'] += _save_chunk(pending)
+            yield from (result for result, _ in pending)
+    finally:
+        # A client that disconnects closes this generator mid-batch: drop the queued
+        # lookups instead of blocking the response thread until they have all run
+        geocoder.shutdown(wait=False, cancel_futures=True)
+        router.shutdown(wait=False, cancel_futures=True)
+
+    yield {'summary': counts}
+
+# --- END OF FILE: route_input/batch.py ---
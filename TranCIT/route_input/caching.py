@@ -0,0 +1,267 @@
+# --- START OF FILE: route_input/caching.py ---
+
+"""
+Two-tier cache for values that never change under their key: geocodes, ORS
+routes, and results keyed by a data version (lines, reachability, sync pages).
+
+- L1: per-process LRU of pickled values, bounded by CACHE_L1_MAX_BYTES in total.
+  Values are stored pickled, so callers always get their own copy and the byte
+  count is exact.
+- L2: the shared Django cache (Redis in production), filled on every set and
+  read on an L1 miss (an L2 hit is copied into L1).
+
+Each Namespace has its own TTL (CACHE_TTLS overrides the defaults) and an
+optional compact() applied before storing, so only the fields callers use are
+kept (an ORS FeatureCollection shrinks to its path, summary and steps).
+Hits, misses, sets, evictions and L1 bytes are counted per namespace (stats(),
+in /routes/metrics/).
+
+Mutable shared state (saved route lists, breakers, admission counters) stays on
+the Django cache directly: an L1 copy could not be invalidated across workers.
+
+With CACHE_RECORD_PATH set, the arguments of every miss in a namespace with a
+warm function are appended to that file (one JSON line each);
+`manage.py warm_caches` replays them after a deploy.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import pickle
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+CACHE_L1_MAX_BYTES = getattr(settings, 'CACHE_L1_MAX_BYTES', 16 * 1024 * 1024)
+CACHE_L1_MAX_ITEM_BYTES = getattr(settings, 'CACHE_L1_MAX_ITEM_BYTES', 1024 * 1024)
+CACHE_TTLS = getattr(settings, 'CACHE_TTLS', {})
+CACHE_RECORD_PATH = getattr(settings, 'CACHE_RECORD_PATH', None)
+
+COUNTERS = ('l1_hits', 'l2_hits', 'misses', 'sets', 'evictions')
+
+
+class LocalLRU:
+    """Byte-bounded LRU of pickled values with per-entry expiry (monotonic seconds)."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()  # key -> (expires_at, namespace, pickled)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, namespace, pickled, ttl):
+        """Store; returns [namespace of each entry evicted to make room]."""
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, namespace, pickled)
+            self.bytes += len(pickled)
+            while self.bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                evicted.append(self._entries[oldest][1])
+                self._remove(oldest)
+        return evicted
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        self.bytes -= len(self._entries.pop(key)[2])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def usage(self):
+        """{namespace: (entries, bytes)}"""
+        with self._lock:
+            usage = {}
+            for _, namespace, pickled in self._entries.values():
+                entries, size = usage.get(namespace, (0, 0))
+                usage[namespace] = (entries + 1, size + len(pickled))
+            return usage
+
+
+_local = LocalLRU(CACHE_L1_MAX_BYTES)
+_stats_lock = threading.Lock()
+_record_lock = threading.Lock()
+_replaying = threading.local()
+NAMESPACES = {}
+
+
+class Namespace:
+    def __init__(self, name, ttl, compact=None, warm=None):
+        """
+        warm: dotted path of the function that computes (and caches) an entry from
+        the `args` given to get(); needed for the entry to be recorded and replayed.
+        """
+        self.name = name
+        self.ttl = CACHE_TTLS.get(name, ttl)
+        self.compact = compact
+        self.warm = warm
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        NAMESPACES[name] = self
+
+    def _key(self, key):
+        return f"{self.name}:{hashlib.blake2b(str(key).encode('utf-8'), digest_size=16).hexdigest()}"
+
+    def _count(self, name, amount=1):
+        with _stats_lock:
+            self.counts[name] += amount
+
+    def get(self, key, args=None):
+        """Cached value or None. On a miss, `args` are recorded for warm_caches."""
+        full_key = self._key(key)
+        pickled = _local.get(full_key)
+        if pickled is not None:
+            self._count('l1_hits')
+            return pickle.loads(pickled)
+        value = shared_cache.get(full_key)
+        if value is not None:
+            self._count('l2_hits')
+            self._store_local(full_key, value)
+            return value
+        self._count('misses')
+        if args is not None and self.warm and CACHE_RECORD_PATH:
+            _record(self.name, args)
+        return None
+
+    def set(self, key, value):
+        """Store value (compacted) in both tiers; returns what was stored."""
+        if value is None:
+            return None
+        if self.compact is not None:
+            value = self.compact(value)
+        full_key = self._key(key)
+        shared_cache.set(full_key, value, self.ttl)
+        self._store_local(full_key, value)
+        self._count('sets')
+        return value
+
+    def get_or_set(self, key, compute, args=None):
+        value = self.get(key, args)
+        if value is None:
+            value = self.set(key, compute())
+        return value
+
+    def delete(self, key):
+        full_key = self._key(key)
+        _local.delete(full_key)
+        shared_cache.delete(full_key)
+
+    def _store_local(self, full_key, value):
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(pickled) > CACHE_L1_MAX_ITEM_BYTES:
+            return
+        for namespace in _local.set(full_key, self.name, pickled, self.ttl):
+            NAMESPACES[namespace]._count('evictions')
+
+
+def _record(name, args):
+    if getattr(_replaying, 'active', False):
+        return
+    line = json.dumps({'ns': name, 'args': list(args)}, default=str) + '\n'
+    try:
+        with _record_lock, open(CACHE_RECORD_PATH, 'a', encoding='utf-8') as log:
+            log.write(line)
+    except OSError:
+        logger.warning("Could not record a cache miss to %s", CACHE_RECORD_PATH, exc_info=True)
+
+
+def warm(name, args):
+    """Recompute (and so cache) an entry of namespace `name` from recorded args; not recorded again."""
+    _replaying.active = True
+    try:
+        return import_string(NAMESPACES[name].warm)(*args)
+    finally:
+        _replaying.active = False
+
+
+def stats():
+    """Per-namespace counters and L1 usage for this worker process."""
+    usage = _local.usage()
+    with _stats_lock:
+        namespaces = {
+            name: dict(namespace.counts, l1_entries=usage.get(name, (0, 0))[0], l1_bytes=usage.get(name, (0, 0))[1])
+            for name, namespace in NAMESPACES.items()
+        }
+    return {'l1_bytes': _local.bytes, 'l1_max_bytes': _local.max_bytes, 'namespaces': namespaces}
+
+
+def clear_local():
+    """Empty this process's L1 and reset the counters (the shared cache is untouched)."""
+    _local.clear()
+    with _stats_lock:
+        for namespace in NAMESPACES.values():
+            namespace.counts = dict.fromkeys(COUNTERS, 0)
+
+
+# -----------------------------
+# Compaction
+# -----------------------------
+
+def compact_ors_route(route_geojson):
+    """
+    The parts of an ORS directions FeatureCollection we use: the first feature's
+    [lon, lat] coordinates, summary, and each step's distance, duration and way points.
+    """
+    try:
+        feature = route_geojson['features'][0]
+    except (KeyError, IndexError, TypeError):
+        return route_geojson
+    properties = feature.get('properties', {})
+    segments = [
+        {'steps': [{field: step[field] for field in ('distance', 'duration', 'way_points') if field in step}
+                   for step in segment.get('steps', [])]}
+        for segment in properties.get('segments', [])
+    ]
+    return {'type': 'FeatureCollection', 'features': [{
+        'type': 'Feature',
+        'geometry': {'type': 'LineString',
+                     'coordinates': [point[:2] for point in feature.get('geometry', {}).get('coordinates', [])]},
+        'properties': {'summary': {field: value for field, value in properties.get('summary', {}).items()
+                                   if field in ('distance', 'duration')},
+                       'segments': segments},
+    }]}
+
+
+def compact_geocode(result):
+    lat, lon, address = result
+    return (float(lat), float(lon), address)
+
+
+# -----------------------------
+# Namespaces
+# -----------------------------
+
+GEOCODES = Namespace('geocode', getattr(settings, 'GEOCODE_CACHE_TTL', 24 * 60 * 60),
+                     compact=compact_geocode, warm='route_input.views.cached_geocode')
+ORS_ROUTES = Namespace('ors', getattr(settings, 'ORS_ROUTE_CACHE_TTL', 6 * 60 * 60),
+                       compact=compact_ors_route, warm='route_input.views.get_route_geojson_cached')
+LINES = Namespace('lines', getattr(settings, 'LINE_CATALOGUE_CACHE_TTL', 60 * 60))
+REACHABILITY = Namespace('reach', getattr(settings, 'REACHABILITY_CACHE_TTL', 10 * 60),
+                         warm='route_input.reachability.reachable')
+SYNC_PAGES = Namespace('sync', getattr(settings, 'SYNC_CACHE_TTL', 60 * 60))
+
+# --- END OF FILE: route_input/caching.py ---
@@ -0,0 +1,301 @@
+# --- START OF FILE: route_input/dedupe.py ---
+
+"""
+Near-duplicate detection for jeepney routes.
+
+Every plan/suggest submission used to become a new Route, so a popular code
+collects many almost identical polylines. Two routes are near duplicates when
+they have the same code and their paths stay within a few tens of metres of each
+other, in the same direction (discrete Fréchet distance).
+
+Finding candidates without comparing every pair:
+- a path is reduced to the set of DEDUPE_CELL_DEG grid cells it passes through,
+- a MinHash of that set is cut into DEDUPE_BANDS bands (locality-sensitive
+  hashing); Route.geometry_signature stores the band keys,
+- routes of the same code sharing any band key are candidates; only cluster
+  representatives (duplicate_of unset) are, most shared bands first, at most
+  DEDUPE_MAX_CANDIDATES per route.
+Candidates are then checked on resampled paths in metres: Hausdorff distance
+first (one vectorized distance matrix, a lower bound of Fréchet), then Fréchet,
+which also tells a route from the same road driven the other way. The first
+candidate within DEDUPE_MERGE_M ends the search.
+
+A new route is merged into an existing one (not saved) within DEDUPE_MERGE_M and
+saved but flagged (Route.duplicate_of) within DEDUPE_FLAG_M. Routes without a
+path (plain suggestions) only match the same code and origin/destination text.
+`manage.py dedupe_routes` does the same for the whole table.
+"""
+
+from collections import Counter
+import hashlib
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Route, SavedRoute
+
+logger = logging.getLogger(__name__)
+
+DEDUPE_CELL_DEG = getattr(settings, 'DEDUPE_CELL_DEG', 0.002)  # ~220 m
+DEDUPE_BANDS = getattr(settings, 'DEDUPE_BANDS', 6)
+DEDUPE_ROWS = getattr(settings, 'DEDUPE_ROWS', 3)
+DEDUPE_MERGE_M = getattr(settings, 'DEDUPE_MERGE_M', 25)
+DEDUPE_FLAG_M = getattr(settings, 'DEDUPE_FLAG_M', 75)
+DEDUPE_SPACING_M = getattr(settings, 'DEDUPE_SPACING_M', 25)  # resampling step for the distance checks
+DEDUPE_MAX_POINTS = getattr(settings, 'DEDUPE_MAX_POINTS', 200)
+DEDUPE_MAX_CANDIDATES = getattr(settings, 'DEDUPE_MAX_CANDIDATES', 20)  # paths compared per route
+
+M_PER_DEG_LAT = 110_574.0
+M_PER_DEG_LON = 111_320.0
+
+# Multiply-shift hash functions for the MinHash, fixed so signatures are stable
+_rng = np.random.default_rng(20251019)
+_HASH_A = _rng.integers(1, 2 ** 63, DEDUPE_BANDS * DEDUPE_ROWS, dtype=np.uint64) | np.uint64(1)
+_HASH_B = _rng.integers(0, 2 ** 63, DEDUPE_BANDS * DEDUPE_ROWS, dtype=np.uint64)
+
+
+# -----------------------------
+# Fingerprints
+# -----------------------------
+
+def _as_path(path):
+    path = np.asarray(path, dtype=np.float64).reshape(-1, 2)
+    return path[np.isfinite(path).all(axis=1)]
+
+
+def to_metres(path, origin):
+    """Equirectangular projection of [[lat, lon], ...] around origin; fine at city scale."""
+    scale = np.array([M_PER_DEG_LAT, M_PER_DEG_LON * np.cos(np.radians(origin[0]))])
+    return (path - origin) * scale
+
+
+def resample(path, spacing_m=DEDUPE_SPACING_M, max_points=DEDUPE_MAX_POINTS, origin=None):
+    """Path in metres (around origin), resampled to points spacing_m apart along its length."""
+    path = _as_path(path)
+    xy = to_metres(path, path[0] if origin is None else origin)
+    if len(xy) < 2:
+        return xy
+    along = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(xy, axis=0).T))])
+    count = int(min(max(along[-1] // spacing_m + 1, 2), max_points))
+    at = np.linspace(0.0, along[-1], count)
+    return np.column_stack([np.interp(at, along, xy[:, 0]), np.interp(at, along, xy[:, 1])])
+
+
+def path_cells(path):
+    """Ids of the DEDUPE_CELL_DEG cells the path passes through (densified, so no cell is skipped)."""
+    path = _as_path(path)
+    if len(path) < 2:
+        return np.empty(0, dtype=np.uint64)
+    step = DEDUPE_CELL_DEG / 4
+    gaps = np.ceil(np.abs(np.diff(path, axis=0)).max(axis=1) / step).astype(np.int64).clip(min=1)
+    t = np.concatenate([np.arange(n) / n for n in gaps] + [[1.0]])
+    start = np.repeat(np.arange(len(gaps)), gaps)
+    start = np.append(start, len(gaps) - 1)
+    dense = path[start] + (path[start + 1] - path[start]) * t[:, None]
+    cells = np.floor(dense / DEDUPE_CELL_DEG).astype(np.int64) + (1 << 20)
+    return np.unique((cells[:, 0].astype(np.uint64) << np.uint64(32)) | cells[:, 1].astype(np.uint64))
+
+
+def geometry_signature(path):
+    """Space-separated LSH band keys of the path's cell set ('' for paths with fewer than 2 points)."""
+    cells = path_cells(path)
+    if not len(cells):
+        return ''
+    with np.errstate(over='ignore'):
+        hashes = (cells[None, :] * _HASH_A[:, None] + _HASH_B[:, None]) >> np.uint64(32)
+    minhash = hashes.min(axis=1).reshape(DEDUPE_BANDS, DEDUPE_ROWS)
+    return ' '.join(
+        f"{band}:{hashlib.blake2b(row.tobytes(), digest_size=4).hexdigest()}" for band, row in enumerate(minhash)
+    )
+
+
+# -----------------------------
+# Distances
+# -----------------------------
+
+def _pairwise(a, b):
+    return np.hypot(a[:, None, 0] - b[None, :, 0], a[:, None, 1] - b[None, :, 1])
+
+
+def hausdorff_m(a, b):
+    distances = _pairwise(a, b)
+    return max(distances.min(axis=1).max(), distances.min(axis=0).max())
+
+
+def frechet_m(a, b, distances=None):
+    """Discrete Fréchet distance, filled one anti-diagonal at a time."""
+    d = _pairwise(a, b) if distances is None else distances
+    n, m = d.shape
+    ca = np.full((n, m), np.inf)
+    for k in range(n + m - 1):
+        i = np.arange(max(0, k - m + 1), min(n, k + 1))
+        j = k - i
+        if k == 0:
+            ca[0, 0] = d[0, 0]
+            continue
+        previous = np.full(len(i), np.inf)
+        up, left, diag = i > 0, j > 0, (i > 0) & (j > 0)
+        previous[up] = ca[i[up] - 1, j[up]]
+        previous[left] = np.minimum(previous[left], ca[i[left], j[left] - 1])
+        previous[diag] = np.minimum(previous[diag], ca[i[diag] - 1, j[diag] - 1])
+        ca[i, j] = np.maximum(previous, d[i, j])
+    return float(ca[-1, -1])
+
+
+def path_distance_m(path_a, path_b, limit=DEDUPE_FLAG_M):
+    """Fréchet distance in metres, or inf as soon as the Hausdorff bound already exceeds limit."""
+    path_a, path_b = _as_path(path_a), _as_path(path_b)
+    if len(path_a) < 2 or len(path_b) < 2:
+        return np.inf
+    a, b = resample(path_a), resample(path_b, origin=path_a[0])
+    distances = _pairwise(a, b)
+    if max(distances.min(axis=1).max(), distances.min(axis=0).max()) > limit:
+        return np.inf
+    return frechet_m(a, b, distances)
+
+
+def shared_bands(signature_a, signature_b):
+    return len(set(signature_a.split()) & set(signature_b.split()))
+
+
+def closest_match(path, candidates):
+    """
+    (id, distance_m) from [(id, path), ...] in order: the first candidate within
+    DEDUPE_MERGE_M, else the closest within DEDUPE_FLAG_M, else (None, None).
+    """
+    best, best_distance = None, None
+    for pk, other in candidates:
+        distance = path_distance_m(path, other)
+        if distance <= DEDUPE_MERGE_M:
+            return pk, distance
+        if distance <= DEDUPE_FLAG_M and (best is None or distance < best_distance):
+            best, best_distance = pk, distance
+    return best, best_distance
+
+
+# -----------------------------
+# Submission time
+# -----------------------------
+
+def _same_text(a, b):
+    return ' '.join((a or '').lower().split()) == ' '.join((b or '').lower().split())
+
+
+def find_near_duplicate(route):
+    """
+    (existing Route, distance_m) for the earlier route `route` duplicates (see
+    closest_match), or (None, None). Only jeepney routes with a code are compared,
+    and only against representatives: a flagged route's original stands for it.
+    """
+    if route.transport_type != 'Jeepney' or not route.code:
+        return None, None
+    representatives = (Route.objects.filter(transport_type='Jeepney', code=route.code, duplicate_of__isnull=True)
+                       .exclude(pk=route.pk))
+    path = route.get_path_coords()
+    if len(path) < 2:
+        for candidate in representatives.only('id', 'origin', 'destination', 'transport_type', 'code'):
+            if _same_text(candidate.origin, route.origin) and _same_text(candidate.destination, route.destination):
+                return candidate, 0.0
+        return None, None
+
+    signature = route.geometry_signature or geometry_signature(path)
+    if not signature:
+        return None, None
+    any_band = Q()
+    for band in signature.split():
+        any_band |= Q(geometry_signature__contains=band)
+    shared = {pk: shared_bands(signature, other)
+              for pk, other in representatives.filter(any_band).values_list('id', 'geometry_signature')}
+    candidate_ids = sorted((pk for pk in shared if shared[pk]), key=lambda pk: (-shared[pk], pk))
+    candidate_ids = candidate_ids[:DEDUPE_MAX_CANDIDATES]
+    candidates = Route.objects.in_bulk(candidate_ids)
+    best, distance = closest_match(path, ((pk, candidates[pk].get_path_coords()) for pk in candidate_ids))
+    return (None, None) if best is None else (candidates[best], distance)
+
+
+def check_submission(route):
+    """
+    Decide what to do with an unsaved route: ('merge', existing) when it duplicates an
+    existing route closely enough to not be saved, ('flag', existing) when it should
+    be saved with duplicate_of set, or ('new', None).
+    """
+    route.geometry_signature = geometry_signature(route.get_path_coords())
+    existing, distance = find_near_duplicate(route)
+    if existing is None:
+        return 'new', None
+    logger.info("Route %s -> %s (%s) is %.0f m from route %s", route.origin, route.destination,
+                route.code, distance, existing.pk)
+    if distance <= DEDUPE_MERGE_M:
+        return 'merge', existing
+    route.duplicate_of = existing
+    return 'flag', existing
+
+
+# -----------------------------
+# Whole table
+# -----------------------------
+
+def candidates(signatures, representatives=None, limit=DEDUPE_MAX_CANDIDATES):
+    """
+    {id: [candidate ids]} from {id: (code, signature)}: the earlier representatives
+    (all routes when representatives is None) sharing a code and an LSH band, most
+    shared bands first. Each (code, band) bucket offers at most `limit` of its
+    oldest representatives, and each route keeps at most `limit` candidates, so
+    the work is O(n * bands * limit) however large a bucket grows.
+    """
+    buckets = {}
+    for pk in sorted(signatures):
+        code, signature = signatures[pk]
+        for band in signature.split():
+            bucket = buckets.setdefault((code, band), [])
+            if len(bucket) < limit and (representatives is None or pk in representatives):
+                bucket.append(pk)
+    found = {}
+    for pk, (code, signature) in signatures.items():
+        shared = Counter(other for band in signature.split()
+                         for other in buckets.get((code, band), ()) if other < pk)
+        if shared:
+            found[pk] = sorted(shared, key=lambda other: (-shared[other], other))[:limit]
+    return found
+
+
+def cluster(pairs):
+    """Union-find: {member id: lowest id of its group} for the given (id, id) pairs."""
+    parent = {}
+
+    def root(pk):
+        while parent.setdefault(pk, pk) != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    for a, b in pairs:
+        ra, rb = root(a), root(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    return {pk: root(pk) for pk in parent}
+
+
+@transaction.atomic
+def merge_routes(keep, duplicate_ids):
+    """Point saved routes and flags at `keep`, fill its blanks from the duplicates, delete them."""
+    duplicate_ids = [pk for pk in duplicate_ids if pk != keep.pk]
+    if not duplicate_ids:
+        return 0
+    changed = []
+    for duplicate in Route.objects.filter(pk__in=duplicate_ids).only('notes', 'fare', 'distance_km', 'travel_time_minutes'):
+        for field in ('notes', 'fare', 'distance_km', 'travel_time_minutes'):
+            if getattr(keep, field) in (None, '') and getattr(duplicate, field) not in (None, ''):
+                setattr(keep, field, getattr(duplicate, field))
+                changed.append(field)
+    if changed:
+        keep.save(update_fields=sorted(set(changed)))
+    SavedRoute.objects.filter(original_route_id__in=duplicate_ids).update(original_route=keep)
+    Route.objects.filter(duplicate_of_id__in=duplicate_ids).update(duplicate_of=keep)
+    deleted, _ = Route.objects.filter(pk__in=duplicate_ids).delete()
+    return deleted
+
+# --- END OF FILE: route_input/dedupe.py ---
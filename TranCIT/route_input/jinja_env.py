@@ -0,0 +1,67 @@
+# --- START OF FILE: route_input/jinja_env.py ---
+
+"""
+Jinja2 environment for the templates under route_input/jinja2/ (the dashboard,
+when DASHBOARD_TEMPLATE_ENGINE = 'jinja2').
+
+Provides the pieces the Django template uses: static(), url(), bundle(), the
+Django filters with Django semantics, and cached() as a stand-in for
+{% cache %}:
+
+    {% call cached(ttl, 'fragment_name', vary_on, ...) %}...{% endcall %}
+"""
+
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.template.defaultfilters import default_if_none, floatformat, truncatewords
+from django.templatetags.static import static
+from django.utils.html import json_script
+from django.urls import reverse
+from jinja2 import Environment
+from markupsafe import Markup
+
+from .templatetags.assets import bundle
+
+
+def url(name, *args, **kwargs):
+    return reverse(name, args=args or None, kwargs=kwargs or None)
+
+
+def _fragment_cache():
+    # Same cache as Django's {% cache %} tag
+    try:
+        return caches['template_fragments']
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def cached(ttl, name, *vary_on, caller):
+    """Render the call block once per (name, vary_on) and keep it for `ttl` seconds (0 = no caching)."""
+    if not ttl:
+        return caller()
+    fragment_cache = _fragment_cache()
+    key = make_template_fragment_key(f"jinja2:{name}", vary_on)
+    fragment = fragment_cache.get(key)
+    if fragment is None:
+        fragment = str(caller())
+        fragment_cache.set(key, fragment, ttl)
+    return Markup(fragment)
+
+
+def environment(**options):
+    env = Environment(**options)
+    env.globals.update({
+        'static': static,
+        'url': url,
+        'bundle': bundle,
+        'cached': cached,
+    })
+    env.filters.update({
+        'default_if_none': default_if_none,
+        'floatformat': floatformat,
+        'json_script': json_script,
+        'truncatewords': truncatewords,
+    })
+    return env
+
+# --- END OF FILE: route_input/jinja_env.py ---
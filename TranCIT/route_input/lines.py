@@ -0,0 +1,336 @@
+# --- START OF FILE: route_input/lines.py ---
+
+"""
+Jeepney line catalogue: one JeepneyLine per code, merged from its Route rows.
+
+For each code:
+- geometry: the medoid route (smallest total Hausdorff distance to the others),
+  each point then moved to the median of the nearby points of the routes that
+  follow it in the same direction, so one odd submission cannot bend the line;
+- stops: route endpoints clustered on a LINE_STOP_CELL_DEG grid (touching cells
+  merge), kept when they lie near the line and ordered by distance along it;
+  named after the most common route origin/destination in the cluster. Saved
+  routes are private: their pins never name a stop, and only count where at
+  least LINE_STOP_MIN_OWNERS different owners pinned the same place;
+- fare_table: fare between every pair of stops from calculate_fare (see
+  reachability.RideCosts), plus the line's length.
+
+sync_lines() compares every code's (route count, latest updated_at) with the
+stamp stored on its line in one grouped query, and only rebuilds the codes that
+changed; a code whose routes have no path keeps an empty line holding its stamp.
+Run it with `manage.py build_jeepney_lines` on a schedule, or set
+LINE_CATALOGUE_AUTO_REBUILD to rebuild the changed codes on a background
+thread, LINE_CATALOGUE_REBUILD_DELAY seconds after the first committed change
+of a burst (signals.py).
+"""
+
+from collections import Counter
+import json
+import logging
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, models, transaction
+
+from .caching import LINES
+from .dedupe import cluster, hausdorff_m, resample, to_metres
+from .models import JeepneyLine, Route, SavedRoute
+
+logger = logging.getLogger(__name__)
+
+LINE_MAX_ROUTES = getattr(settings, 'LINE_MAX_ROUTES', 30)  # newest routes used per code
+LINE_CONSENSUS_M = getattr(settings, 'LINE_CONSENSUS_M', 100)
+LINE_STOP_CELL_DEG = getattr(settings, 'LINE_STOP_CELL_DEG', 0.0015)  # ~165 m
+LINE_STOP_MAX_OFFSET_M = getattr(settings, 'LINE_STOP_MAX_OFFSET_M', 250)
+LINE_MAX_STOPS = getattr(settings, 'LINE_MAX_STOPS', 40)
+LINE_STOP_MIN_OWNERS = getattr(settings, 'LINE_STOP_MIN_OWNERS', 5)  # saved-route pins
+REBUILD_DELAY = getattr(settings, 'LINE_CATALOGUE_REBUILD_DELAY', 30)  # seconds from the first change
+
+
+def _from_metres(xy, origin):
+    scale = np.array([110_574.0, 111_320.0 * np.cos(np.radians(origin[0]))])
+    return xy / scale + origin
+
+
+def _code_stamp(count, last):
+    return f"{count}-{last.timestamp() if last else 0:.6f}"
+
+
+# -----------------------------
+# Building one line
+# -----------------------------
+
+def merged_geometry(paths):
+    """(merged [[lat, lon], ...], number of routes that agree with it) from the routes' paths."""
+    paths = [np.asarray(p, dtype=np.float64).reshape(-1, 2) for p in paths]
+    paths = [p for p in paths if len(p) >= 2]
+    if not paths:
+        return [], 0
+    origin = paths[0][0]
+    resampled = [resample(p, origin=origin) for p in paths]
+    if len(resampled) == 1:
+        return paths[0].round(6).tolist(), 1
+
+    n = len(resampled)
+    distances = np.zeros((n, n))
+    for i in range(n):
+        for j in range(i + 1, n):
+            distances[i, j] = distances[j, i] = hausdorff_m(resampled[i], resampled[j])
+    medoid_index = int(distances.sum(axis=1).argmin())
+    medoid = resampled[medoid_index]
+
+    # Routes along the medoid, in its direction
+    agreeing = [r for r, d in zip(resampled, distances[medoid_index])
+                if d <= LINE_CONSENSUS_M
+                and np.hypot(*(r[0] - medoid[0])) < np.hypot(*(r[0] - medoid[-1]))]
+    merged = medoid.copy()
+    for index, point in enumerate(medoid):
+        near = []
+        for route in agreeing:
+            offsets = np.hypot(*(route - point).T)
+            closest = offsets.argmin()
+            if offsets[closest] <= LINE_CONSENSUS_M:
+                near.append(route[closest])
+        if near:
+            merged[index] = np.median(np.asarray(near), axis=0)
+    return _from_metres(merged, origin).round(6).tolist(), len(agreeing)
+
+
+def _cell_groups(coords):
+    """Indices of coords grouped by touching LINE_STOP_CELL_DEG cells."""
+    cells = [tuple(c) for c in np.floor(coords / LINE_STOP_CELL_DEG).astype(np.int64).tolist()]
+    occupied = set(cells)
+    pairs = [(cell, (cell[0] + di, cell[1] + dj)) for cell in occupied
+             for di in (-1, 0, 1) for dj in (-1, 0, 1) if (cell[0] + di, cell[1] + dj) in occupied]
+    group_of = cluster(pairs)
+
+    groups = {}
+    for index, cell in enumerate(cells):
+        groups.setdefault(group_of.get(cell, cell), []).append(index)
+    return list(groups.values())
+
+
+def _crowded(private):
+    """The private points in places pinned by at least LINE_STOP_MIN_OWNERS different owners."""
+    if not private:
+        return []
+    coords = np.array([(lat, lon) for lat, lon, _, _ in private], dtype=np.float64)
+    return [private[i] for members in _cell_groups(coords)
+            if len({private[i][3] for i in members}) >= LINE_STOP_MIN_OWNERS for i in members]
+
+
+def infer_stops(points, path):
+    """
+    Stops from [(lat, lon, name or None, owner or None), ...]: clusters of nearby
+    points within LINE_STOP_MAX_OFFSET_M of the line, as [{name, lat, lon, km, count}, ...]
+    by km. Points with an owner are private (see _crowded) and never name a stop.
+    """
+    points = [p for p in points if p[3] is None] + _crowded([p for p in points if p[3] is not None])
+    if not points or len(path) < 2:
+        return []
+    coords = np.array([(lat, lon) for lat, lon, _, _ in points], dtype=np.float64)
+
+    origin = np.asarray(path[0], dtype=np.float64)
+    line_xy = to_metres(np.asarray(path, dtype=np.float64), origin)
+    along = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(line_xy, axis=0).T))])
+    stops = []
+    for members in _cell_groups(coords):
+        centre = coords[members].mean(axis=0)
+        offsets = np.hypot(*(line_xy - to_metres(centre, origin)).T)
+        nearest = int(offsets.argmin())
+        if offsets[nearest] > LINE_STOP_MAX_OFFSET_M:
+            continue
+        names = Counter(points[i][2] for i in members if points[i][2] and points[i][3] is None)
+        stops.append({
+            'name': names.most_common(1)[0][0] if names else None,
+            'lat': round(float(centre[0]), 6), 'lon': round(float(centre[1]), 6),
+            'km': round(float(along[nearest]) / 1000, 2),
+            'count': len(members),
+        })
+    stops = sorted(stops, key=lambda s: -s['count'])[:LINE_MAX_STOPS]
+    return sorted(stops, key=lambda s: s['km'])
+
+
+def fare_table(stops, length_km):
+    """fares[i][j - i - 1]: fare from stop i to each later stop j."""
+    from .reachability import RideCosts
+    costs = RideCosts(length_km + 1)
+    km = np.array([stop['km'] for stop in stops])
+    table = []
+    for i in range(len(stops)):
+        _, fares = costs.lookup(np.maximum(km[i + 1:] - km[i], 0))
+        table.append(np.atleast_1d(fares).round(2).tolist())
+    return table
+
+
+def _pins(code):
+    """
+    (lat, lon, name, owner) of route endpoints (owner None) and saved-route pins
+    (no name, owner 'user:<id>' / 'anon:<hash>') for a code.
+    """
+    pins = []
+    rows = Route.objects.filter(transport_type='Jeepney', code=code).values_list(
+        'origin_latitude', 'origin_longitude', 'origin',
+        'destination_latitude', 'destination_longitude', 'destination')
+    for o_lat, o_lon, o_name, d_lat, d_lon, d_name in rows:
+        for lat, lon, name in ((o_lat, o_lon, o_name), (d_lat, d_lon, d_name)):
+            if lat is not None and lon is not None:
+                pins.append((float(lat), float(lon), ' '.join((name or '').split()) or None, None))
+
+    rows = SavedRoute.objects.filter(transport_type='Jeepney', code=code).values_list(
+        'user_id', 'session_key_hash',
+        'origin_latitude', 'origin_longitude', 'destination_latitude', 'destination_longitude')
+    for user_id, owner_hash, o_lat, o_lon, d_lat, d_lon in rows:
+        owner = f"user:{user_id}" if user_id else f"anon:{owner_hash}" if owner_hash else None
+        if owner is None:
+            continue
+        for lat, lon in ((o_lat, o_lon), (d_lat, d_lon)):
+            if lat is not None and lon is not None:
+                pins.append((float(lat), float(lon), None, owner))
+    return pins
+
+
+def build_line(code, stamp):
+    """Build the JeepneyLine for code; empty (no path, just the stamp) when none of its routes has a path."""
+    from .network import route_paths
+    routes = list(Route.objects.filter(transport_type='Jeepney', code=code).exclude(route_path_coords='')
+                  .order_by('-updated_at')
+                  .only('id', 'origin', 'destination', 'updated_at', 'route_path_coords')[:LINE_MAX_ROUTES])
+    paths = route_paths(routes)
+    path, agreeing = merged_geometry([paths[route.id] for route in routes])
+    if not path:
+        # Keep the stamp, or every sync would rebuild this code again
+        JeepneyLine.objects.update_or_create(code=code, defaults={
+            'name': '', 'path_coords': '', 'stops': '', 'fare_table': '', 'length_km': None,
+            'route_count': 0, 'source_version': stamp,
+        })
+        return None
+
+    xy = to_metres(np.asarray(path), np.asarray(path[0]))
+    length_km = float(np.hypot(*np.diff(xy, axis=0).T).sum()) / 1000
+    pins = _pins(code) + [(*p[0], None, None) for p in (paths[r.id] for r in routes) if len(p)] \
+        + [(*p[-1], None, None) for p in (paths[r.id] for r in routes) if len(p)]
+    stops = infer_stops(pins, path)
+    names = Counter(f"{r.origin} to {r.destination}" for r in routes)
+    line, _ = JeepneyLine.objects.update_or_create(code=code, defaults={
+        'name': names.most_common(1)[0][0][:600],
+        'path_coords': json.dumps(path),
+        'stops': json.dumps(stops),
+        'fare_table': json.dumps(fare_table(stops, length_km)),
+        'length_km': f"{length_km:.2f}",
+        'route_count': len(routes),
+        'source_version': stamp,
+    })
+    logger.info("Built jeepney line %s from %s routes (%s agree), %s stops, %.1f km",
+                code, len(routes), agreeing, len(stops), length_km)
+    return line
+
+
+# -----------------------------
+# Incremental sync
+# -----------------------------
+
+def sync_lines(codes=None, force=False):
+    """
+    Rebuild the lines whose routes changed since they were built (or just `codes`),
+    and delete lines whose code has no routes left. Returns the rebuilt codes.
+    """
+    routes = Route.objects.filter(transport_type='Jeepney').exclude(code__isnull=True).exclude(code='')
+    if codes is not None:
+        routes = routes.filter(code__in=codes)
+    stamps = {row['code']: _code_stamp(row['count'], row['last']) for row in
+              routes.values('code').annotate(count=models.Count('id'), last=models.Max('updated_at'))}
+    lines = JeepneyLine.objects.all() if codes is None else JeepneyLine.objects.filter(code__in=codes)
+    built = dict(lines.values_list('code', 'source_version'))
+
+    rebuilt = []
+    for code, stamp in sorted(stamps.items()):
+        if force or built.get(code) != stamp:
+            with transaction.atomic():
+                build_line(code, stamp)
+            rebuilt.append(code)
+    gone = set(built) - set(stamps)
+    if gone:
+        JeepneyLine.objects.filter(code__in=gone).delete()
+    return rebuilt
+
+
+_rebuild_lock = threading.Lock()
+_rebuild_timer = None
+_pending_codes = set()
+
+
+def _sync_later():
+    global _rebuild_timer
+    with _rebuild_lock:
+        _rebuild_timer = None
+        codes = sorted(_pending_codes)
+        _pending_codes.clear()
+    try:
+        sync_lines(codes=codes)
+    except Exception:
+        # The stamps still differ, so the next sync or build_jeepney_lines picks these codes up
+        logger.exception("Jeepney line rebuild of %s failed", codes)
+    finally:
+        close_old_connections()
+
+
+def schedule_sync(codes, delay=None):
+    """Sync these codes once, `delay` seconds after the first change of a burst; later changes join it."""
+    global _rebuild_timer
+    with _rebuild_lock:
+        _pending_codes.update(codes)
+        if _rebuild_timer is not None:
+            return
+        _rebuild_timer = threading.Timer(REBUILD_DELAY if delay is None else delay, _sync_later)
+        _rebuild_timer.daemon = True
+        _rebuild_timer.start()
+
+
+# -----------------------------
+# Serving
+# -----------------------------
+
+def catalogue_version():
+    stats = JeepneyLine.objects.aggregate(count=models.Count('id'), last=models.Max('updated_at'))
+    return _code_stamp(stats['count'], stats['last'])
+
+
+def line_summary(line):
+    path = line.get_path_coords()
+    lats, lons = [p[0] for p in path], [p[1] for p in path]
+    return {
+        'code': line.code,
+        'name': line.name,
+        'length_km': float(line.length_km) if line.length_km is not None else None,
+        'route_count': line.route_count,
+        'stop_count': len(line.get_stops()),
+        'bbox': [min(lons), min(lats), max(lons), max(lats)] if path else None,
+    }
+
+
+def line_detail(line):
+    return dict(line_summary(line), path=line.get_path_coords(), stops=line.get_stops(),
+                fare_table=line.get_fare_table())
+
+
+def line_json(code, version):
+    """line_detail() for a code, cached per line version; None if there is no such line."""
+    key = f"{code}:{version}"
+    data = LINES.get(key)
+    if data is None:
+        line = JeepneyLine.objects.filter(code=code).exclude(path_coords='').first()
+        if line is None:
+            return None
+        data = LINES.set(key, line_detail(line))
+    return data
+
+
+def catalogue(version=None):
+    """JSON-ready list of every line's summary, cached per catalogue version."""
+    version = version or catalogue_version()
+    return LINES.get_or_set(f"catalogue:{version}", lambda: {
+        'version': version, 'lines': [line_summary(line) for line in JeepneyLine.objects.exclude(path_coords='')]})
+
+# --- END OF FILE: route_input/lines.py ---
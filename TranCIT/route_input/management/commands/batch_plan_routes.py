@@ -0,0 +1,54 @@
+import csv
+import json
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from route_input.batch import BATCH_GEOCODE_WORKERS, BATCH_ROUTE_WORKERS, plan_batch
+
+
+def _csv_item(row):
+    item = {'transport_type': row.get('transport_type') or None, 'code': row.get('code') or None}
+    for end in ('origin', 'destination'):
+        lat, lon = row.get(f'{end}_lat'), row.get(f'{end}_lon')
+        item[end] = [lat, lon] if lat and lon else row.get(end)
+    return item
+
+
+def read_pairs(path):
+    """Pairs from a .csv (origin,destination[,transport_type,code] or *_lat/*_lon columns), .json or .jsonl file."""
+    text = sys.stdin.read() if path == '-' else Path(path).read_text(encoding='utf-8')
+    if path.endswith('.csv'):
+        return [_csv_item(row) for row in csv.DictReader(text.splitlines())]
+    if path.endswith('.jsonl') or path.endswith('.ndjson'):
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    return json.loads(text)
+
+
+class Command(BaseCommand):
+    help = (
+        "Plan many trips at once: fares, times and distances for origin/destination pairs, "
+        "printed as NDJSON as they complete (see route_input/batch.py for the input format)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('pairs', help="CSV, JSON or JSONL file with the pairs ('-' reads JSON from stdin).")
+        parser.add_argument('--persist', action='store_true', help="Also save the results as Route rows.")
+        parser.add_argument('--geocode-workers', type=int, default=BATCH_GEOCODE_WORKERS)
+        parser.add_argument('--route-workers', type=int, default=BATCH_ROUTE_WORKERS)
+
+    def handle(self, *args, **options):
+        try:
+            pairs = read_pairs(options['pairs'])
+            results = plan_batch(pairs, persist=options['persist'],
+                                 geocode_workers=options['geocode_workers'],
+                                 route_workers=options['route_workers'])
+        except (OSError, ValueError) as e:  # BatchError is a ValueError
+            raise CommandError(e)
+        for result in results:
+            if 'summary' in result:
+                self.stderr.write(json.dumps(result['summary']))
+            else:
+                self.stdout.write(json.dumps(result, default=str))
+                self.stdout.flush()
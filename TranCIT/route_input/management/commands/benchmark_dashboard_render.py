@@ -0,0 +1,81 @@
+from statistics import median
+import time
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from route_input import views
+from route_input.forms import JeepneySuggestionForm, RouteForm
+from route_input.models import Route
+
+BENCHMARK_USERNAME = 'dashboard-render-benchmark'
+TEMPLATE = 'route_input/index.html'
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time rendering of the dashboard template (sidebars included, map left out) with the "
+        "Django and Jinja2 engines, with and without the sidebar fragment cache. Each render "
+        "builds a fresh context, so the suggestion and saved-route queries are part of the cost."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--engines', default='django,jinja2')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+        self.stdout.write(f"{Route.objects.count()} routes, {options['iterations']} renders per run")
+        try:
+            for engine in options['engines'].split(','):
+                for ttl in (0, views.DASHBOARD_FRAGMENT_TTL or 60):
+                    self._run(engine, ttl, user, options['iterations'])
+        finally:
+            User.objects.filter(username=BENCHMARK_USERNAME).delete()
+
+    def _context(self, request, ttl):
+        return {
+            'form': RouteForm(),
+            'suggestion_form': JeepneySuggestionForm(),
+            'map': '<div id="map"></div>',
+            'suggestions': views._suggestions_page(
+                request, Route.objects.filter(transport_type='Jeepney').defer('route_path_coords'), 1),
+            'suggestions_page': 1,
+            'saved_page': views._saved_first_page(request),
+            'fragment_ttl': ttl,
+            'routes_version': views._routes_version(request),
+            'saved_version': views._saved_version(request),
+            'highlight_route_id': '',
+            'selected_transport_type': 'Jeepney',
+        }
+
+    def _render_once(self, engine, ttl, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        request.session = SessionBase()
+        started = time.perf_counter()
+        render_to_string(TEMPLATE, self._context(request, ttl), request=request, using=engine)
+        return (time.perf_counter() - started) * 1000
+
+    def _run(self, engine, ttl, user, iterations):
+        self._render_once(engine, ttl, user)  # warm-up: template compilation, fragment cache fill
+        timings = []
+        reset_queries()
+        with CaptureQueriesContext(connection) as captured:
+            for _ in range(iterations):
+                timings.append(self._render_once(engine, ttl, user))
+        label = f"{engine}, {'fragments cached' if ttl else 'no fragment cache'}"
+        self.stdout.write(
+            f"{label:<32} median {median(timings):7.2f} ms   p95 {_percentile(timings, 95):7.2f} ms   "
+            f"{len(captured.captured_queries) / iterations:.1f} queries/render"
+        )
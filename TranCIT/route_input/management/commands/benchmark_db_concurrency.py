@@ -0,0 +1,121 @@
+from statistics import median
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+
+BENCHMARK_USERNAME = 'db-concurrency-benchmark'
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent save_current_route writes and dashboard reads against the configured "
+        "database and report throughput, latency and errors. --compare also runs a baseline with "
+        "SQLite's defaults (rollback journal, deferred transactions). Use a scratch database, e.g. "
+        "SQLITE_PATH=/tmp/bench.sqlite3 python manage.py migrate first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds per run.")
+        parser.add_argument('--compare', action='store_true',
+                            help="SQLite only: run the untuned baseline first, then the tuned configuration.")
+
+    def handle(self, *args, **options):
+        self.host = next((h for h in settings.ALLOWED_HOSTS if h not in ('*', '')), 'localhost')
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+        try:
+            runs = []
+            if options['compare'] and connection.vendor == 'sqlite':
+                runs.append(('baseline', self._baseline_options()))
+            runs.append(('configured', None))
+            for label, db_options in runs:
+                self._run(label, user, db_options, options)
+        finally:
+            connections.close_all()
+            User.objects.filter(username=BENCHMARK_USERNAME).delete()  # cascades to its saved routes
+
+    def _baseline_options(self):
+        return {}  # Django's defaults: rollback journal, deferred transactions, 5 s busy timeout
+
+    def _run(self, label, user, db_options, options):
+        db_settings = settings.DATABASES['default']
+        original_options = db_settings.get('OPTIONS', {})
+        connections.close_all()
+        if db_options is not None:
+            db_settings['OPTIONS'] = db_options
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=DELETE')
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                label = f"{label} (journal_mode={cursor.fetchone()[0]})"
+        connection.close()
+        try:
+            results = self._run_threads(user, options)
+        finally:
+            connections.close_all()
+            db_settings['OPTIONS'] = original_options
+
+        self.stdout.write(label)
+        for kind in ('write', 'read'):
+            latencies, errors = results[kind]
+            rate = len(latencies) / options['duration']
+            self.stdout.write(
+                f"  {kind:5} {len(latencies):6} ok {errors:5} errors {rate:8.1f}/s  "
+                f"p50 {median(latencies) * 1000 if latencies else 0:7.1f} ms  "
+                f"p95 {_percentile(latencies, 95) * 1000:7.1f} ms"
+            )
+
+    def _run_threads(self, user, options):
+        deadline = time.monotonic() + options['duration']
+        results = {'write': ([], 0), 'read': ([], 0)}
+        lock = threading.Lock()
+
+        def worker(kind, n):
+            client = Client(HTTP_HOST=self.host, raise_request_exception=False)
+            client.force_login(user)
+            latencies, errors, i = [], 0, 0
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    if kind == 'write':
+                        response = client.post(reverse('save_current_route'), {
+                            'origin': f"Bench {n}-{i}", 'destination': 'Benchmark',
+                            'transport_type': 'Jeepney', 'fare': '13',
+                        })
+                    else:
+                        response = client.get(reverse('routes_page'))
+                    ok = response.status_code < 400
+                except Exception:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+                i += 1
+            connections.close_all()
+            with lock:
+                done, failed = results[kind]
+                results[kind] = (done + latencies, failed + errors)
+
+        threads = [threading.Thread(target=worker, args=('write', n)) for n in range(options['writers'])]
+        threads += [threading.Thread(target=worker, args=('read', n)) for n in range(options['readers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
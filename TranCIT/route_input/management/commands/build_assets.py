@@ -0,0 +1,119 @@
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+import json
+import re
+import shutil
+
+import folium
+import requests
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+
+from route_input.assets import (
+    BUNDLES, FOLIUM_VENDOR_DIR, FOLIUM_VENDOR_MANIFEST, MINIFIERS, build_dir, bundle_path,
+)
+
+CSS_URL_RE = re.compile(r'url\(\s*[\'"]?([^\'")]+)[\'"]?\s*\)')
+DOWNLOAD_TIMEOUT = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Minify and bundle the app CSS/JS and vendor the CDN assets folium.Map uses. "
+        "Run before collectstatic, which adds hashed names and .gz/.br variants."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-vendor', action='store_true',
+                            help="Only build bundles; keep serving folium assets from the CDN.")
+
+    def handle(self, *args, **options):
+        out_dir = build_dir()
+        self.build_bundles(out_dir)
+        if not options['skip_vendor']:
+            self.vendor_folium_assets(out_dir)
+
+    # -----------------------------
+    # Bundles
+    # -----------------------------
+
+    def build_bundles(self, out_dir):
+        for name, sources in BUNDLES.items():
+            ext = name.rsplit('.', 1)[1]
+            parts = []
+            for source in sources:
+                found = finders.find(source)
+                if not found:
+                    raise CommandError(f"Bundle {name}: source {source} not found")
+                parts.append(Path(found).read_text(encoding='utf-8'))
+
+            # JS gets a ';' between files so one file's missing semicolon can't join statements.
+            separator = '\n;\n' if ext == 'js' else '\n'
+            minified = MINIFIERS[ext](separator.join(parts))
+
+            target = out_dir / bundle_path(name)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(minified, encoding='utf-8')
+            original = sum(len(p.encode('utf-8')) for p in parts)
+            self.stdout.write(f"{bundle_path(name)}: {original} -> {len(minified.encode('utf-8'))} bytes")
+
+    # -----------------------------
+    # Vendored folium assets
+    # -----------------------------
+
+    def vendor_folium_assets(self, out_dir):
+        """
+        Download folium.Map's default JS/CSS (and the fonts/images their CSS
+        references) so pages never depend on third-party CDNs. On any failure the
+        vendor directory is removed and the map keeps using the CDN URLs.
+        """
+        vendor_dir = out_dir / FOLIUM_VENDOR_DIR
+        if vendor_dir.exists():
+            shutil.rmtree(vendor_dir)
+
+        files = {}
+        session = requests.Session()
+        try:
+            for _, url in folium.Map.default_js + folium.Map.default_css:
+                files[url] = self._download(session, url, out_dir)
+        except (requests.RequestException, OSError) as e:
+            shutil.rmtree(vendor_dir, ignore_errors=True)
+            self.stderr.write(self.style.WARNING(f"Could not vendor folium assets, using CDN instead: {e}"))
+            return
+
+        manifest = out_dir / FOLIUM_VENDOR_MANIFEST
+        manifest.write_text(json.dumps({'folium': folium.__version__, 'files': files}, indent=2), encoding='utf-8')
+        self.stdout.write(f"Vendored {len(files)} folium assets into {vendor_dir}")
+
+    def _download(self, session, url, out_dir):
+        """Save `url` under vendor/folium/<host>/<path> and return its static path."""
+        static_path = self._static_path_for(url)
+        target = out_dir / static_path
+        if target.exists():
+            return static_path
+
+        response = session.get(url, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(response.content)
+
+        if target.suffix == '.css':
+            # collectstatic's manifest storage rewrites url() references and fails
+            # on missing files, so fetch everything the stylesheet points at.
+            for ref in CSS_URL_RE.findall(response.text):
+                if ref.startswith(('data:', '#')):
+                    continue
+                absolute = urljoin(url, ref)
+                if urlsplit(absolute).netloc != urlsplit(url).netloc:
+                    continue
+                self._download(session, absolute.split('#')[0].split('?')[0], out_dir)
+        return static_path
+
+    @staticmethod
+    def _static_path_for(url):
+        parts = urlsplit(url)
+        path = parts.path.lstrip('/')
+        # Some CDN URLs (e.g. unpkg package roots) have no file extension.
+        if not Path(path).suffix:
+            path += '.js'
+        return f"{FOLIUM_VENDOR_DIR}/{parts.netloc}/{path}"
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from route_input.lines import sync_lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the canonical jeepney lines (geometry, stops, fare tables) whose routes "
+        "changed since they were last built."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('codes', nargs='*', help="Only these codes (default: every code).")
+        parser.add_argument('--force', action='store_true', help="Rebuild even if nothing changed.")
+
+    def handle(self, *args, **options):
+        rebuilt = sync_lines(codes=options['codes'] or None, force=options['force'])
+        self.stdout.write(f"Rebuilt {len(rebuilt)} lines{': ' + ', '.join(rebuilt) if rebuilt else ''}")
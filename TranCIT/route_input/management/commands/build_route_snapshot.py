@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from route_input.network import RouteNetwork, build_snapshot, is_dirty
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the route network into a new mmap-able snapshot file and point CURRENT at it. "
+        "Running workers swap to it on their next lookup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None,
+                            help="Snapshot directory (default: ROUTE_SNAPSHOT_DIR).")
+        parser.add_argument('--if-dirty', action='store_true',
+                            help="Only rebuild when routes changed since the last build (for cron).")
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or settings.ROUTE_SNAPSHOT_DIR
+        if not directory:
+            raise CommandError("Set ROUTE_SNAPSHOT_DIR or pass --dir.")
+        if options['if_dirty'] and not is_dirty(directory):
+            self.stdout.write("Snapshot is up to date")
+            return
+        path = build_snapshot(directory)
+        network = RouteNetwork(path)
+        self.stdout.write(
+            f"{path}: {len(network)} routes, {len(network.coords)} points, "
+            f"{len(network.bucket_keys)} cells, {path.stat().st_size} bytes (version {network.version})"
+        )
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+
+from route_input import dedupe
+from route_input.models import Route
+from route_input.network import route_paths
+
+CHUNK = 500
+
+
+def _chunks(values, size=CHUNK):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class Command(BaseCommand):
+    help = (
+        "Find near-duplicate jeepney routes (same code, paths within DEDUPE_MERGE_M / DEDUPE_FLAG_M "
+        "metres) using the LSH geometry signatures, and optionally merge or flag them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--merge', action='store_true',
+                            help="Merge each group of duplicates into its oldest route.")
+        parser.add_argument('--flag', action='store_true',
+                            help="Set duplicate_of on routes that are close but not merged.")
+
+    def handle(self, *args, **options):
+        jeepneys = Route.objects.filter(transport_type='Jeepney').exclude(code__isnull=True).exclude(code='')
+        missing = list(jeepneys.filter(geometry_signature='').exclude(route_path_coords='')
+                       .values_list('id', flat=True))
+        for ids in _chunks(missing):
+            routes = list(Route.objects.filter(pk__in=ids).only('id', 'route_path_coords'))
+            for route in routes:
+                route.geometry_signature = dedupe.geometry_signature(route.get_path_coords())
+            Route.objects.bulk_update(routes, ['geometry_signature'])
+
+        signatures = {pk: (code, signature) for pk, code, signature in
+                      jeepneys.exclude(geometry_signature='').values_list('id', 'code', 'geometry_signature')}
+        representatives = set(jeepneys.filter(duplicate_of__isnull=True).values_list('id', flat=True))
+        candidates = dedupe.candidates(signatures, representatives)
+        compared = sum(len(others) for others in candidates.values())
+
+        paths = {}
+        for ids in _chunks(set(candidates) | {pk for others in candidates.values() for pk in others}):
+            paths.update(route_paths(Route.objects.filter(pk__in=ids).only('id', 'updated_at', 'route_path_coords')))
+        close, near = [], []
+        for pk, others in sorted(candidates.items()):
+            match, distance = dedupe.closest_match(paths[pk], ((other, paths[other]) for other in others))
+            if match is None:
+                continue
+            (close if distance <= dedupe.DEDUPE_MERGE_M else near).append((match, pk))
+
+        groups = {}
+        for pk, keep in dedupe.cluster(close).items():
+            groups.setdefault(keep, []).append(pk)
+        duplicates = sum(len(members) - 1 for members in groups.values())
+        self.stdout.write(
+            f"{len(signatures)} routes, {compared} candidate pairs, {len(close)} duplicate pairs "
+            f"({duplicates} routes in {len(groups)} groups), {len(near)} near pairs"
+        )
+
+        merged = 0
+        if options['merge']:
+            for keep_id, members in groups.items():
+                merged += dedupe.merge_routes(Route.objects.get(pk=keep_id), members)
+            self.stdout.write(f"Merged {merged} duplicate routes")
+        if options['flag']:
+            gone = {pk for keep, members in groups.items() for pk in members if pk != keep} if options['merge'] else set()
+            flagged = 0
+            for a, b in near:
+                if a not in gone and b not in gone:
+                    flagged += Route.objects.filter(pk=b, duplicate_of__isnull=True).update(duplicate_of_id=a)
+            self.stdout.write(f"Flagged {flagged} near-duplicate routes")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from route_input import sync
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete route change log rows older than ROUTE_CHANGE_RETENTION_DAYS, keeping the newest "
+        "ROUTE_CHANGE_KEEP; clients that synced before the oldest kept row get a full reset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Age in days after which a change is deleted (default: ROUTE_CHANGE_RETENTION_DAYS).")
+        parser.add_argument('--keep', type=int, default=None,
+                            help="Newest changes kept whatever their age (default: ROUTE_CHANGE_KEEP).")
+
+    def handle(self, *args, **options):
+        deleted = sync.prune_log(days=options['days'], keep=options['keep'])
+        current, oldest = sync.log_state()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} route changes; versions {oldest}-{current} remain."))
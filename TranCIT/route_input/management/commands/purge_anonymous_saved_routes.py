@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from route_input.models import SavedRoute
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete anonymous saved routes that no session can reach any more: rows with "
+        "no owner at all, and rows not used for longer than the session lifetime."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help="Age in days after which an anonymous route is orphaned (default: SESSION_COOKIE_AGE).",
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows deleted per query.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count what would be deleted.")
+
+    def handle(self, *args, **options):
+        if options['days'] is not None:
+            max_age = timedelta(days=options['days'])
+        else:
+            max_age = timedelta(seconds=settings.SESSION_COOKIE_AGE)
+        cutoff = timezone.now() - max_age
+        batch_size = max(1, options['batch_size'])
+
+        no_owner = (Q(session_key_hash__isnull=True) | Q(session_key_hash='')) & \
+                   (Q(session_key__isnull=True) | Q(session_key=''))
+        orphaned = SavedRoute.objects.filter(user__isnull=True).filter(no_owner | Q(last_used__lt=cutoff))
+
+        if options['dry_run']:
+            self.stdout.write(f"{orphaned.count()} orphaned anonymous saved routes would be deleted.")
+            return
+
+        total = 0
+        while True:
+            # Delete by primary key in small chunks so each statement holds its locks briefly.
+            ids = list(orphaned.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted, _ = SavedRoute.objects.filter(pk__in=ids).delete()
+            total += deleted
+        self.stdout.write(self.style.SUCCESS(f"Deleted {total} orphaned anonymous saved routes."))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from route_input import thumbnails
+from route_input.models import Route, SavedRoute
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill in missing route thumbnail keys, render the thumbnails that do not exist yet "
+        "and, with --prune, delete the files no route uses any more."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', action='append', choices=sorted(thumbnails.FORMATS),
+                            help="Formats to render (repeatable; default: THUMBNAIL_FORMATS).")
+        parser.add_argument('--prune', action='store_true', help="Delete thumbnails of keys no longer in use.")
+
+    def handle(self, *args, **options):
+        # Routes saved before keys existed (or bulk-created) only have their path
+        stale = []
+        for route in Route.objects.only('id', 'route_path_coords', 'thumbnail_key').iterator(chunk_size=500):
+            key = thumbnails.geometry_key(route.get_path_coords())
+            if key != route.thumbnail_key:
+                route.thumbnail_key = key
+                stale.append(route)
+        Route.objects.bulk_update(stale, ['thumbnail_key'], batch_size=500)
+
+        ids = list(Route.objects.exclude(thumbnail_key='').values_list('id', flat=True))
+        rendered = 0
+        for start in range(0, len(ids), 500):
+            rendered += thumbnails.render_routes(ids[start:start + 500], formats=options['format'])
+        self.stdout.write(f"Updated {len(stale)} keys, rendered {rendered} thumbnails for {len(ids)} routes")
+
+        if options['prune']:
+            keep = set(Route.objects.values_list('thumbnail_key', flat=True))
+            keep |= set(SavedRoute.objects.values_list('thumbnail_key', flat=True))
+            self.stdout.write(f"Removed {thumbnails.prune(keep)} unused thumbnail files")
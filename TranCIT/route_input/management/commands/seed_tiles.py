@@ -0,0 +1,60 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from route_input import tiles
+
+
+def _bbox(value):
+    try:
+        west, south, east, north = (float(part) for part in value.split(','))
+    except ValueError:
+        raise CommandError("--bbox must be west,south,east,north in degrees")
+    return west, south, east, north
+
+
+def _zooms(value):
+    low, _, high = value.partition('-')
+    try:
+        return range(int(low), int(high or low) + 1)
+    except ValueError:
+        raise CommandError("--zoom must be like 12-17 or 15")
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-seed the map tile cache (TILE_CACHE_DIR) from a local MBTiles file, by default "
+        "with Metro Cebu at zoom 12-17. Never downloads from the tile server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('mbtiles', help="MBTiles file with raster (PNG) tiles.")
+        parser.add_argument('--bbox', type=_bbox, default=tiles.CEBU_BBOX, help="west,south,east,north")
+        parser.add_argument('--zoom', type=_zooms,
+                            default=tiles.TILE_SEED_ZOOMS, help="Zoom range, e.g. 12-17.")
+        parser.add_argument('--overwrite', action='store_true', help="Replace tiles already in the cache.")
+
+    def handle(self, *args, **options):
+        source = Path(options['mbtiles'])
+        if not source.is_file():
+            raise CommandError(f"{source} does not exist")
+        bbox, zooms = options['bbox'], options['zoom']
+        expected = 0
+        for z in zooms:
+            x_min, x_max, y_min, y_max = tiles.tile_range(bbox, z)
+            expected += (x_max - x_min + 1) * (y_max - y_min + 1)
+
+        written = skipped = 0
+        cache_dir = tiles.tile_cache_dir()
+        for z, x, y, data in tiles.iter_mbtiles(source, bbox, zooms):
+            if not options['overwrite'] and tiles.tile_path(z, x, y).exists():
+                skipped += 1
+                continue
+            tiles.store_tile(z, x, y, data)
+            written += 1
+
+        missing = expected - written - skipped
+        self.stdout.write(
+            f"{written} tiles written, {skipped} already cached, {missing} of {expected} "
+            f"in the bbox not in {source.name} (zoom {zooms.start}-{zooms.stop - 1}) -> {cache_dir}"
+        )
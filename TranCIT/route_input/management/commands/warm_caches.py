@@ -0,0 +1,89 @@
+from collections import Counter
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from route_input import analytics, caching
+from route_input.upstream import rate_limited
+
+
+def read_log(path):
+    """Counter of (namespace, args as JSON) from a CACHE_RECORD_PATH log; bad lines are skipped."""
+    entries = Counter()
+    for line in Path(path).read_text(encoding='utf-8').splitlines():
+        try:
+            entry = json.loads(line)
+            entries[(entry['ns'], json.dumps(entry['args']))] += 1
+        except (ValueError, KeyError, TypeError):
+            continue
+    return entries
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay the cache misses recorded in CACHE_RECORD_PATH (geocodes, ORS routes, reachability), "
+        "most frequent first, so a fresh deploy starts with a warm shared cache. With --from-analytics, "
+        "geocode the most searched places and route the most searched pairs instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('log', nargs='?', help="Recorded log (default: CACHE_RECORD_PATH).")
+        parser.add_argument('--limit', type=int, default=None, help="Only the N most frequent entries.")
+        parser.add_argument('--namespace', action='append', choices=sorted(caching.NAMESPACES),
+                            help="Only these namespaces (repeatable).")
+        parser.add_argument('--from-analytics', action='store_true',
+                            help="Warm from the search rollups (route_input/analytics.py) instead of a log.")
+        parser.add_argument('--days', type=int, default=7, help="With --from-analytics: searches of the last N days.")
+
+    def warm_from_analytics(self, days, limit):
+        targets = analytics.precompute_targets(days=days, limit=limit or 50)
+        places = {}
+        for place in targets['places'] + [end for pair in targets['pairs'] for end in pair]:
+            if place not in places:
+                try:
+                    places[place] = caching.warm('geocode', [place])
+                except Exception as e:  # one bad place must not stop the others
+                    self.stderr.write(f"{place}: {e}")
+                    places[place] = None
+        routed = 0
+        for origin, destination in targets['pairs']:
+            start, end = places.get(origin), places.get(destination)
+            if not (start and end):
+                continue
+            try:
+                routed += caching.warm('ors', [start[0], start[1], end[0], end[1], 'driving-car']) is not None
+            except Exception as e:
+                self.stderr.write(f"{origin} -> {destination}: {e}")
+        found = sum(result is not None for result in places.values())
+        self.stdout.write(f"Geocoded {found} of {len(places)} searched places, "
+                          f"routed {routed} of {len(targets['pairs'])} searched pairs (last {days} days)")
+
+    def handle(self, *args, **options):
+        # A replay is a burst of Nominatim/ORS calls: pace them with UPSTREAM_RATE_LIMITS, as batch planning does
+        with rate_limited():
+            if options['from_analytics']:
+                return self.warm_from_analytics(options['days'], options['limit'])
+            return self.replay_log(options)
+
+    def replay_log(self, options):
+        path = options['log'] or caching.CACHE_RECORD_PATH
+        if not path or not Path(path).exists():
+            raise CommandError("No recorded log: pass one or set CACHE_RECORD_PATH.")
+        entries = [(name, json.loads(args)) for (name, args), _ in read_log(path).most_common()
+                   if name in caching.NAMESPACES and caching.NAMESPACES[name].warm
+                   and (not options['namespace'] or name in options['namespace'])]
+        entries = entries[:options['limit']]
+
+        warmed = Counter()
+        empty = Counter()
+        for name, entry_args in entries:
+            try:
+                result = caching.warm(name, entry_args)
+            except Exception as e:  # one bad entry must not stop the replay
+                self.stderr.write(f"{name} {entry_args}: {e}")
+                result = None
+            (warmed if result is not None else empty)[name] += 1
+        for name in sorted(set(warmed) | set(empty)):
+            self.stdout.write(f"{name}: {warmed[name]} warmed, {empty[name]} without a result")
+        self.stdout.write(f"Replayed {len(entries)} distinct entries from {path}")
@@ -0,0 +1,62 @@
+# --- START OF FILE: route_input/middleware.py ---
+
+import re
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; fall back to gzip only
+    brotli = None
+
+re_accepts_brotli = re.compile(r'\bbr\b')
+
+# Dynamic pages are compressed per request, so favour speed over ratio
+BROTLI_QUALITY = getattr(settings, 'BROTLI_QUALITY', 5)
+
+
+def _rendered_csrf_token(request, response):
+    # get_token() flags the request; CsrfViewMiddleware then (re)sends the cookie and clears the flag
+    return settings.CSRF_COOKIE_NAME in response.cookies or request.META.get('CSRF_COOKIE_NEEDS_UPDATE', False)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware that prefers Brotli when the client accepts it and the
+    Brotli package is installed. Streaming responses always use gzip.
+
+    BREACH: a page that rendered a CSRF token gets gzip, never Brotli. The token
+    itself is masked afresh for every response (get_token()), and Django's gzip
+    pads each response with a random-length header, so response lengths can't be
+    used to guess the secret byte by byte. Brotli has no such padding.
+    """
+
+    def process_response(self, request, response):
+        # Images (map tiles) are already compressed; don't spend CPU on them
+        if response.get('Content-Type', '').startswith('image/'):
+            return response
+        ae = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if (brotli is None or response.streaming or not re_accepts_brotli.search(ae)
+                or _rendered_csrf_token(request, response)):
+            return super().process_response(request, response)
+
+        if len(response.content) < 200 or response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        compressed_content = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response.headers['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+# --- END OF FILE: route_input/middleware.py ---
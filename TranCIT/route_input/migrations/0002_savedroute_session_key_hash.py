@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-19 12:38
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def backfill_session_key_hash(apps, schema_editor):
+    SavedRoute = apps.get_model('route_input', 'SavedRoute')
+    pending = SavedRoute.objects.filter(session_key_hash__isnull=True).exclude(session_key__isnull=True).exclude(session_key='')
+    batch = []
+    for saved in pending.only('id', 'session_key').iterator(chunk_size=1000):
+        saved.session_key_hash = hashlib.sha256(saved.session_key.encode('utf-8')).hexdigest()
+        batch.append(saved)
+        if len(batch) >= 1000:
+            SavedRoute.objects.bulk_update(batch, ['session_key_hash'])
+            batch = []
+    if batch:
+        SavedRoute.objects.bulk_update(batch, ['session_key_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_input', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='savedroute',
+            name='session_key_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the anonymous owner key', max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='savedroute',
+            name='session_key',
+            field=models.CharField(blank=True, help_text='Legacy raw session ID for anonymous users (no longer written)', max_length=255, null=True),
+        ),
+        migrations.RunPython(backfill_session_key_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-19 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_input', '0003_route_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileCapture',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('view_name', models.CharField(db_index=True, max_length=100)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('duration_ms', models.FloatField()),
+                ('sample_count', models.PositiveIntegerField()),
+                ('trigger', models.CharField(choices=[('sampled', 'Sampled'), ('header', 'Signed header')], max_length=10)),
+                ('file_stem', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:04
+
+from django.db import migrations, models
+
+
+def fill_display_labels(apps, schema_editor):
+    from route_input.models import route_display_label
+
+    Route = apps.get_model('route_input', 'Route')
+    routes = list(Route.objects.only('transport_type', 'code', 'origin', 'destination'))
+    for route in routes:
+        route.display_label = route_display_label(route.transport_type, route.code, route.origin, route.destination)
+    Route.objects.bulk_update(routes, ['display_label'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_input', '0004_profilecapture'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='display_label',
+            field=models.CharField(blank=True, editable=False, max_length=600),
+        ),
+        migrations.RunPython(fill_display_labels, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:20
+
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_geometry_signatures(apps, schema_editor):
+    from route_input.dedupe import geometry_signature
+
+    Route = apps.get_model('route_input', 'Route')
+    batch = []
+    for route in Route.objects.exclude(route_path_coords='').only('route_path_coords').iterator(chunk_size=500):
+        try:
+            path = json.loads(route.route_path_coords)
+        except ValueError:
+            continue
+        route.geometry_signature = geometry_signature(path)
+        batch.append(route)
+        if len(batch) >= 500:
+            Route.objects.bulk_update(batch, ['geometry_signature'])
+            batch = []
+    Route.objects.bulk_update(batch, ['geometry_signature'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_input', '0005_route_display_label'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='geometry_signature',
+            field=models.CharField(blank=True, editable=False, max_length=120),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                                    related_name='near_duplicates', to='route_input.route'),
+        ),
+        migrations.RunPython(fill_geometry_signatures, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_input', '0007_jeepneyline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TravelSpeed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cell', models.BigIntegerField()),
+                ('hour_of_week', models.PositiveSmallIntegerField()),
+                ('transport_type', models.CharField(max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('speed_sum', models.FloatField(default=0)),
+                ('speed_sq_sum', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('cell', 'hour_of_week', 'transport_type')},
+            },
+        ),
+    ]
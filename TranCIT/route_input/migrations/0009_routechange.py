@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:25
+
+from django.db import migrations, models
+
+
+def log_existing_routes(apps, schema_editor):
+    # Version 1..n are the routes that existed before the log, so clients that
+    # synced once have a non-zero version to continue from
+    Route = apps.get_model('route_input', 'Route')
+    RouteChange = apps.get_model('route_input', 'RouteChange')
+    ids = Route.objects.order_by('id').values_list('id', flat=True)
+    RouteChange.objects.bulk_create((RouteChange(route_id=pk) for pk in ids.iterator(chunk_size=500)), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_input', '0008_travelspeed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('route_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(log_existing_routes, migrations.RunPython.noop),
+    ]
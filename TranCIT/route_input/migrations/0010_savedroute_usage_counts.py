@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_input', '0009_routechange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='savedroute',
+            name='navigate_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='savedroute',
+            name='open_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='savedroute',
+            name='last_used',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
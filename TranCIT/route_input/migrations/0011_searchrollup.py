@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_input', '0010_savedroute_usage_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_start', models.DateTimeField()),
+                ('dimension', models.CharField(choices=[('origin', 'Origin'), ('destination', 'Destination'), ('code', 'Jeepney code'), ('pair', 'Origin/destination pair')], max_length=20)),
+                ('term', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dimension', 'window_start'], name='route_input_dimensi_e380c6_idx')],
+                'unique_together': {('window_start', 'dimension', 'term')},
+            },
+        ),
+    ]
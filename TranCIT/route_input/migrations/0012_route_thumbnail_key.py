@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_input', '0011_searchrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='thumbnail_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='savedroute',
+            name='thumbnail_key',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+    ]
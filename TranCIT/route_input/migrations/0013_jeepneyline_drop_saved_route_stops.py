@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:20
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def drop_built_stops(apps, schema_editor):
+    # Stops built before this release may carry saved-route names and pins; clear
+    # them and the stamps so the next sync_lines() rebuilds every line.
+    JeepneyLine = apps.get_model('route_input', 'JeepneyLine')
+    JeepneyLine.objects.update(stops='', fare_table='', source_version='', updated_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_input', '0012_route_thumbnail_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_built_stops, migrations.RunPython.noop),
+    ]
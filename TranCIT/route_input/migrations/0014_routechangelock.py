@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:34
+
+from django.db import migrations, models
+
+
+def create_lock_row(apps, schema_editor):
+    apps.get_model('route_input', 'RouteChangeLock').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_input', '0013_jeepneyline_drop_saved_route_stops'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteChangeLock',
+            fields=[
+                ('id', models.PositiveSmallIntegerField(default=1, primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.RunPython(create_lock_row, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,10 @@
 # --- START OF FILE route_input/models.py ---
 
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from decimal import Decimal
+import hashlib
 import json
 
 JEEPNEY_CODE_CHOICES = [
@@ -32,6 +34,12 @@ JEEPNEY_CODE_CHOICES = [
         ('62B', '62B'),
     ]
 
+def route_display_label(transport_type, code, origin, destination):
+    if code and transport_type == 'Jeepney':
+        return f"[{code}] {origin} to {destination} ({transport_type})"
+    return f"{origin} to {destination} ({transport_type})"
+
+
 class Route(models.Model):
     TRANSPORT_CHOICES = [
         ('Jeepney', 'Jeepney'),
@@ -40,33 +48,6 @@ class Route(models.Model):
         ('Motorcycle', 'Motorcycle'),
     ]
 
-    # JEEPNEY_CODE_CHOICES = [
-    #     ('01A', '01A'), ('01B', '01B'), ('01C', '01C'), ('01K', '01K'),
-    #     ('02A', '02A'), ('02B', '02B'),
-    #     ('03A', '03A'), ('03B', '03B'), ('03G', '03G'), ('03L', '03L'), ('03Q', '03Q'),
-    #     ('04B', '04B'), ('04C', '04C'), ('04D', '04D'), ('04H', '04H'), ('04I', '04I'), ('04L', '04L'), ('04M', '04M'),
-    #     ('06A', '06A'), ('06B', '06B'), ('06C', '06C'), ('06F', '06F'), ('06G', '06G'), ('06H', '06H'),
-    #     ('07B', '07B'), ('07D', '07D'),
-    #     ('08F', '08F'), ('08G', '08G'),
-    #     ('09C', '09C'), ('09F', '09F'), ('09G', '09G'),
-    #     ('10C', '10C'), ('10E', '10E'), ('10F', '10F'), ('10G', '10G'), ('10H', '10H'), ('10K', '10K'), ('10M', '10M'),
-    #     ('11A', '11A'), ('11D', '11D'),
-    #     ('12A', '12A'), ('12B', '12B'), ('12C', '12C'), ('12D', '12D'), ('12F', '12F'), ('12G', '12G'), ('12I', '12I'), ('12J', '12J'), ('12L', '12L'),
-    #     ('13B', '13B'), ('13C', '13C'), ('13H', '13H'),
-    #     ('14D', '14D'),
-    #     ('15', '15'),
-    #     ('17B', '17B'), ('17C', '17C'), ('17D', '17D'),
-    #     ('20A', '20A'), ('20B', '20B'),
-    #     ('21A', '21A'), ('21D', '21D'),
-    #     ('22A', '22A'), ('22I', '22I'),
-    #     ('23D', '23D'),
-    #     ('24A', '24A'), ('24F', '24F'), ('24I', '24I'),
-    #     ('26', '26'), ('27', '27'),
-    #     ('41B', '41B'), ('41D', '41D'),
-    #     ('42B', '42B'), ('42C', '42C'), ('42D', '42D'),
-    #     ('62B', '62B'),
-    # ]
-
     origin = models.CharField(max_length=255)
     destination = models.CharField(max_length=255)
     
@@ -97,6 +78,18 @@ class Route(models.Model):
     
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on every save; used (with the row count) as the route table version for ETags
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # "[01A] Origin to Destination (Jeepney)", filled in on save() so listings
+    # (admin, map popups) don't format it per row
+    display_label = models.CharField(max_length=600, blank=True, editable=False)
+    # LSH band keys of the path's grid cells, for near-duplicate lookup (see dedupe.py)
+    geometry_signature = models.CharField(max_length=120, blank=True, editable=False)
+    # Content hash of the path naming its preview image (see thumbnails.py)
+    thumbnail_key = models.CharField(max_length=20, blank=True, editable=False, db_index=True)
+    # Set when a submission was saved although it is close to this earlier route
+    duplicate_of = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='near_duplicates')
 
     class Meta:
         ordering = ['transport_type', 'code', 'origin']
@@ -104,9 +97,23 @@ class Route(models.Model):
         verbose_name_plural = "Routes"
 
     def __str__(self):
-        if self.code and self.transport_type == 'Jeepney':
-            return f"[{self.code}] {self.origin} to {self.destination} ({self.transport_type})"
-        return f"{self.origin} to {self.destination} ({self.transport_type})"
+        return self.display_label or route_display_label(self.transport_type, self.code, self.origin, self.destination)
+
+    def save(self, *args, **kwargs):
+        self.display_label = route_display_label(self.transport_type, self.code, self.origin, self.destination)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'route_path_coords' in update_fields:
+            from .dedupe import geometry_signature
+            from .thumbnails import geometry_key
+            path = self.get_path_coords()
+            self.geometry_signature = geometry_signature(path)
+            self.thumbnail_key = geometry_key(path)
+        if update_fields is not None:
+            extra = {'display_label'}
+            if 'route_path_coords' in update_fields:
+                extra |= {'geometry_signature', 'thumbnail_key'}
+            kwargs['update_fields'] = [*update_fields, *sorted(extra - set(update_fields))]
+        super().save(*args, **kwargs)
 
     def get_path_coords(self):
         if self.route_path_coords:
@@ -117,6 +124,49 @@ class Route(models.Model):
         return []
 
 
+def route_table_version():
+    """
+    Cheap version stamp of the Route table (row count + latest updated_at).
+    Changes whenever a route is added, edited or deleted, in every worker.
+    """
+    stats = Route.objects.aggregate(count=models.Count('id'), last=models.Max('updated_at'))
+    last = stats['last'].timestamp() if stats['last'] else 0
+    return f"{stats['count']}-{last:.6f}"
+
+
+class RouteChange(models.Model):
+    """
+    Append-only log of Route changes; the id is the network version clients sync
+    from (see sync.py). Written by signals.py in the same transaction as the change,
+    holding the RouteChangeLock row.
+    """
+    id = models.BigAutoField(primary_key=True)
+    route_id = models.BigIntegerField()  # not a FK: deletions are logged too
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"v{self.id}: route {self.route_id} {'deleted' if self.deleted else 'saved'}"
+
+
+class RouteChangeLock(models.Model):
+    """
+    Single row that sync.log_changes() locks until the writing transaction commits,
+    so RouteChange ids are handed out in commit order and no client skips one.
+    """
+    id = models.PositiveSmallIntegerField(primary_key=True, default=1)
+
+
+def hash_session_key(session_key):
+    """Fixed-width (64 hex chars) SHA-256 digest used to look up anonymous saved routes."""
+    if not session_key:
+        return None
+    return hashlib.sha256(session_key.encode('utf-8')).hexdigest()
+
+
 class SavedRoute(models.Model):
     """
     Model to store user's saved/favorite routes.
@@ -130,7 +180,9 @@ class SavedRoute(models.Model):
     
     # Session-based identification (for users without authentication)
     session_key = models.CharField(max_length=255, null=True, blank=True, 
-                                    help_text="Session ID for anonymous users")
+                                    help_text="Legacy raw session ID for anonymous users (no longer written)")
+    session_key_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True,
+                                        help_text="SHA-256 of the anonymous owner key")
     
     # Reference to original route (if saved from suggestions)
     original_route = models.ForeignKey(Route, on_delete=models.SET_NULL, 
@@ -150,6 +202,8 @@ class SavedRoute(models.Model):
     code = models.CharField(max_length=10, null=True, blank=True)
     
     route_path_coords = models.TextField(blank=True)
+    # The original route's thumbnail (thumbnails.py), kept current when its path changes
+    thumbnail_key = models.CharField(max_length=20, blank=True, editable=False)
     
     distance_km = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     travel_time_minutes = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
@@ -158,7 +212,11 @@ class SavedRoute(models.Model):
     notes = models.TextField(blank=True)
     
     saved_at = models.DateTimeField(auto_now_add=True)
-    last_used = models.DateTimeField(auto_now=True)
+    # Set on creation, then only by usage.flush(): opening or navigating a saved
+    # route is buffered and written in batches instead of one UPDATE per click
+    last_used = models.DateTimeField(default=timezone.now)
+    open_count = models.PositiveIntegerField(default=0)
+    navigate_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['-last_used']
@@ -166,7 +224,7 @@ class SavedRoute(models.Model):
         verbose_name_plural = "Saved Routes"
 
     def __str__(self):
-        identifier = f"Session: {self.session_key[:8]}..." if self.session_key else "User Route"
+        identifier = f"Session: {self.session_key_hash[:8]}..." if self.session_key_hash else "User Route"
         if self.code and self.transport_type == 'Jeepney':
             return f"{identifier} - [{self.code}] {self.origin} to {self.destination}"
         return f"{identifier} - {self.origin} to {self.destination} ({self.transport_type})"
@@ -179,4 +237,112 @@ class SavedRoute(models.Model):
                 return []
         return []
 
+
+class ProfileCapture(models.Model):
+    """One profiled request; the stacks live in files under PROFILE_DIR (see profiling.py)."""
+    TRIGGER_CHOICES = [
+        ('sampled', 'Sampled'),
+        ('header', 'Signed header'),
+    ]
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    view_name = models.CharField(max_length=100, db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    sample_count = models.PositiveIntegerField()
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    file_stem = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.view_name} {self.duration_ms:.0f} ms ({self.created_at:%Y-%m-%d %H:%M:%S})"
+
+class JeepneyLine(models.Model):
+    """
+    One jeepney code's canonical line, merged from every Route with that code
+    (see lines.py). Rebuilt by lines.sync_lines() after one of those routes
+    changes; empty when none of them has a path.
+    """
+    code = models.CharField(max_length=10, choices=JEEPNEY_CODE_CHOICES, unique=True)
+    name = models.CharField(max_length=600, blank=True)
+    path_coords = models.TextField(blank=True, help_text="JSON [[lat, lon], ...] of the merged geometry.")
+    stops = models.TextField(blank=True, help_text="JSON [{name, lat, lon, km, count}, ...] along the line.")
+    fare_table = models.TextField(blank=True, help_text="JSON fares between stops: row i, column j > i.")
+    length_km = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
+    route_count = models.PositiveIntegerField(default=0)
+    # Route count + latest updated_at of the code's routes when this line was built
+    source_version = models.CharField(max_length=64, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        ordering = ['code']
+
+    def __str__(self):
+        return f"[{self.code}] {self.name}" if self.name else self.code
+
+    def get_path_coords(self):
+        return json.loads(self.path_coords) if self.path_coords else []
+
+    def get_stops(self):
+        return json.loads(self.stops) if self.stops else []
+
+    def get_fare_table(self):
+        return json.loads(self.fare_table) if self.fare_table else []
+
+class TravelSpeed(models.Model):
+    """
+    Streaming speed statistics for one grid cell, hour of the week and transport
+    type (or 'car' for ORS driving results); see speeds.py. Kept as count, sum and
+    sum of squares so an observation is one atomic UPDATE.
+    """
+    cell = models.BigIntegerField()  # network.bucket_key()
+    hour_of_week = models.PositiveSmallIntegerField()  # 0 = Monday 00:00-01:00, local time
+    transport_type = models.CharField(max_length=50)
+    count = models.PositiveIntegerField(default=0)
+    speed_sum = models.FloatField(default=0)  # kph
+    speed_sq_sum = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('cell', 'hour_of_week', 'transport_type')]
+
+    def __str__(self):
+        return f"{self.transport_type} cell {self.cell} h{self.hour_of_week}: {self.mean_kph:.1f} kph (n={self.count})"
+
+    @property
+    def mean_kph(self):
+        return self.speed_sum / self.count if self.count else 0.0
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return 0.0
+        return max(self.speed_sq_sum - self.speed_sum ** 2 / self.count, 0.0) / (self.count - 1)
+
+
+class SearchRollup(models.Model):
+    """
+    How often a place, jeepney code or origin/destination pair was searched in one
+    time window, summed over the workers' heavy-hitter sketches (see analytics.py).
+    Counts are estimates: each worker only writes its top terms per flush.
+    """
+    DIMENSIONS = [('origin', 'Origin'), ('destination', 'Destination'), ('code', 'Jeepney code'),
+                  ('pair', 'Origin/destination pair')]
+
+    window_start = models.DateTimeField()
+    dimension = models.CharField(max_length=20, choices=DIMENSIONS)
+    term = models.CharField(max_length=255)  # normalised; a pair is "origin -> destination"
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('window_start', 'dimension', 'term')]
+        indexes = [models.Index(fields=['dimension', 'window_start'])]
+
+    def __str__(self):
+        return f"{self.dimension} {self.term!r} @ {self.window_start:%Y-%m-%d %H:%M}: {self.count}"
+
 # --- END OF FILE route_input/models.py ---
\ No newline at end of file
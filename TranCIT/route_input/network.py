@@ -0,0 +1,376 @@
+# --- START OF FILE: route_input/network.py ---
+
+"""
+Read-only binary snapshot of the route network, shared by all worker processes.
+
+Each gunicorn worker used to decode every Route.route_path_coords JSON string
+on its own. The snapshot stores the decoded network once, in one flat file:
+
+    magic (8 bytes) | header length (uint64) | JSON header | 64-byte aligned arrays
+
+Arrays: route ids / updated_at / transport / code / fare / distance / time,
+`offsets` into one (N, 2) float64 `coords` array of [lat, lon] points, and a
+spatial index of BUCKET_DEG grid cells -> route rows (CSR layout).
+
+Workers mmap the current file read-only and wrap it with numpy.frombuffer, so
+every process shares the same page-cache pages and nothing is copied. Builds go
+to a new versioned file; the CURRENT pointer file is then swapped with
+os.replace(), and workers pick the new version up on their next lookup.
+
+A committed Route change only marks the snapshot dirty (a DIRTY file next to
+CURRENT). The rebuild runs once per burst of changes, ROUTE_SNAPSHOT_REBUILD_DELAY
+seconds after the first one (ROUTE_SNAPSHOT_AUTO_REBUILD), or from
+`manage.py build_route_snapshot --if-dirty` on a schedule. Until then the stale
+paths fall back to their JSON.
+
+Enabled by setting ROUTE_SNAPSHOT_DIR.
+"""
+
+from pathlib import Path
+import json
+import logging
+import math
+import mmap
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import Route, route_table_version
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TRCNET01'
+ALIGN = 64
+BUCKET_DEG = getattr(settings, 'ROUTE_SNAPSHOT_BUCKET_DEG', 0.01)  # ~1.1 km cells
+CHECK_INTERVAL = getattr(settings, 'ROUTE_SNAPSHOT_CHECK_INTERVAL', 2)  # seconds between pointer checks
+REBUILD_DELAY = getattr(settings, 'ROUTE_SNAPSHOT_REBUILD_DELAY', 30)  # seconds from the first change
+KEEP_SNAPSHOTS = 3
+POINTER_NAME = 'CURRENT'
+DIRTY_NAME = 'DIRTY'
+
+TRANSPORT_TYPES = [choice for choice, _ in Route.TRANSPORT_CHOICES]
+
+
+def snapshot_dir():
+    directory = getattr(settings, 'ROUTE_SNAPSHOT_DIR', None)
+    return Path(directory) if directory else None
+
+
+def bucket_key(lat, lon):
+    """Grid cell of a point, packed into one int64 (works on scalars and numpy arrays)."""
+    lat_idx = np.floor(np.asarray(lat) / BUCKET_DEG).astype(np.int64)
+    lon_idx = np.floor(np.asarray(lon) / BUCKET_DEG).astype(np.int64)
+    return (lat_idx << 32) | (lon_idx & 0xFFFFFFFF)
+
+
+def _epoch_us(value):
+    return int(value.timestamp() * 1_000_000) if value else 0
+
+
+def _float_or_nan(value):
+    return float(value) if value is not None else math.nan
+
+
+# -----------------------------
+# Building
+# -----------------------------
+
+def build_arrays(rows):
+    """
+    rows: iterable of (id, updated_at, transport_type, code, fare, distance_km,
+    travel_time_minutes, route_path_coords). Returns (arrays, codes).
+    """
+    ids, updated, transport, code_idx, fare, distance, minutes = [], [], [], [], [], [], []
+    offsets, chunks = [0], []
+    codes = {}
+    for pk, updated_at, transport_type, code, fare_val, distance_val, time_val, path_json in rows:
+        try:
+            path = json.loads(path_json) if path_json else []
+        except json.JSONDecodeError:
+            path = []
+        points = np.asarray(path, dtype=np.float64).reshape(-1, 2) if path else np.empty((0, 2))
+
+        ids.append(pk)
+        updated.append(_epoch_us(updated_at))
+        transport.append(TRANSPORT_TYPES.index(transport_type) if transport_type in TRANSPORT_TYPES else 255)
+        code_idx.append(codes.setdefault(code, len(codes)) if code else -1)
+        fare.append(_float_or_nan(fare_val))
+        distance.append(_float_or_nan(distance_val))
+        minutes.append(_float_or_nan(time_val))
+        chunks.append(points)
+        offsets.append(offsets[-1] + len(points))
+
+    coords = np.concatenate(chunks) if chunks else np.empty((0, 2))
+    offsets = np.asarray(offsets, dtype=np.int64)
+
+    # Spatial buckets: every (cell, route row) pair the path touches, grouped by cell.
+    if len(coords):
+        point_rows = np.repeat(np.arange(len(ids), dtype=np.int32), np.diff(offsets))
+        pairs = np.unique(np.stack([bucket_key(coords[:, 0], coords[:, 1]), point_rows.astype(np.int64)], axis=1), axis=0)
+        keys, starts = np.unique(pairs[:, 0], return_index=True)
+        bucket_offsets = np.append(starts, len(pairs)).astype(np.int64)
+        bucket_routes = pairs[:, 1].astype(np.int32)
+    else:
+        keys = np.empty(0, dtype=np.int64)
+        bucket_offsets = np.zeros(1, dtype=np.int64)
+        bucket_routes = np.empty(0, dtype=np.int32)
+
+    arrays = {
+        'route_ids': np.asarray(ids, dtype=np.int64),
+        'route_updated': np.asarray(updated, dtype=np.int64),
+        'route_transport': np.asarray(transport, dtype=np.uint8),
+        'route_code': np.asarray(code_idx, dtype=np.int16),
+        'route_fare': np.asarray(fare, dtype=np.float32),
+        'route_distance': np.asarray(distance, dtype=np.float32),
+        'route_time': np.asarray(minutes, dtype=np.float32),
+        'offsets': offsets,
+        'coords': np.ascontiguousarray(coords, dtype=np.float64),
+        'bucket_keys': keys.astype(np.int64),
+        'bucket_offsets': bucket_offsets,
+        'bucket_routes': bucket_routes,
+    }
+    return arrays, [code for code, _ in sorted(codes.items(), key=lambda item: item[1])]
+
+
+def _pad(length):
+    return (-length) % ALIGN
+
+
+def write_snapshot(path, arrays, meta):
+    """Write arrays + metadata to `path` (via a temp file, so readers never see a partial file)."""
+    sections, offset = {}, 0
+    for name, array in arrays.items():
+        sections[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes + _pad(array.nbytes)
+    header = json.dumps(dict(meta, sections=sections)).encode('utf-8')
+    data_start = len(MAGIC) + 8 + len(header)
+    header += b' ' * _pad(data_start)
+
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as fh:
+        fh.write(MAGIC)
+        fh.write(len(header).to_bytes(8, 'little'))
+        fh.write(header)
+        for array in arrays.values():
+            fh.write(array.tobytes())
+            fh.write(b'\0' * _pad(array.nbytes))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, path)
+
+
+def build_snapshot(directory=None):
+    """Build a snapshot of the current Route table and make it CURRENT. Returns its path."""
+    directory = Path(directory) if directory else snapshot_dir()
+    if directory is None:
+        raise RuntimeError("ROUTE_SNAPSHOT_DIR is not configured")
+    directory.mkdir(parents=True, exist_ok=True)
+    # Cleared before reading, so a change committed during the build marks it dirty again
+    (directory / DIRTY_NAME).unlink(missing_ok=True)
+
+    version = route_table_version()
+    rows = (Route.objects.order_by('id')
+            .values_list('id', 'updated_at', 'transport_type', 'code', 'fare', 'distance_km',
+                         'travel_time_minutes', 'route_path_coords')
+            .iterator(chunk_size=500))
+    arrays, codes = build_arrays(rows)
+
+    name = f"network-{int(time.time() * 1000)}.bin"
+    path = directory / name
+    write_snapshot(path, arrays, {
+        'version': version,
+        'built_at': time.time(),
+        'bucket_deg': BUCKET_DEG,
+        'transport_types': TRANSPORT_TYPES,
+        'codes': codes,
+    })
+
+    pointer_tmp = directory / f"{POINTER_NAME}.tmp"
+    pointer_tmp.write_text(name, encoding='utf-8')
+    os.replace(pointer_tmp, directory / POINTER_NAME)
+
+    for old in sorted(directory.glob('network-*.bin'))[:-KEEP_SNAPSHOTS]:
+        # Workers still mapping an old file keep it alive until they swap (POSIX unlink semantics)
+        try:
+            old.unlink()
+        except OSError:
+            pass
+    logger.info("Built route network snapshot %s (%s routes, %s points)",
+                name, len(arrays['route_ids']), len(arrays['coords']))
+    return path
+
+
+def mark_dirty():
+    """Flag the snapshot as behind the Route table; cheap enough for every committed save."""
+    directory = snapshot_dir()
+    if directory is None:
+        return
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / DIRTY_NAME).touch()
+    except OSError:
+        logger.exception("Could not mark the route network snapshot dirty")
+
+
+def is_dirty(directory=None):
+    directory = Path(directory) if directory else snapshot_dir()
+    return directory is not None and (directory / DIRTY_NAME).exists()
+
+
+def rebuild_if_dirty(directory=None):
+    """Build a new snapshot if a change was committed since the last build; returns its path or None."""
+    if not is_dirty(directory):
+        return None
+    return build_snapshot(directory)
+
+
+_rebuild_lock = threading.Lock()
+_rebuild_timer = None
+
+
+def _rebuild_later():
+    global _rebuild_timer
+    with _rebuild_lock:
+        _rebuild_timer = None
+    try:
+        rebuild_if_dirty()
+    except Exception:
+        # Workers keep serving the previous snapshot (stale paths fall back to JSON)
+        logger.exception("Route network snapshot rebuild failed")
+        mark_dirty()
+    finally:
+        close_old_connections()
+
+
+def schedule_rebuild(delay=None):
+    """Rebuild once, `delay` seconds after the first change of a burst; later changes join that rebuild."""
+    global _rebuild_timer
+    with _rebuild_lock:
+        if _rebuild_timer is not None:
+            return
+        _rebuild_timer = threading.Timer(REBUILD_DELAY if delay is None else delay, _rebuild_later)
+        _rebuild_timer.daemon = True
+        _rebuild_timer.start()
+
+
+# -----------------------------
+# Reading
+# -----------------------------
+
+class RouteNetwork:
+    """Zero-copy view of one snapshot file."""
+
+    def __init__(self, path):
+        self.file_path = Path(path)
+        with open(self.file_path, 'rb') as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.file_path} is not a route network snapshot")
+        header_len = int.from_bytes(self._mmap[len(MAGIC):len(MAGIC) + 8], 'little')
+        header_start = len(MAGIC) + 8
+        self.meta = json.loads(bytes(self._mmap[header_start:header_start + header_len]))
+        data_start = header_start + header_len
+
+        for name, section in self.meta['sections'].items():
+            dtype = np.dtype(section['dtype'])
+            count = int(np.prod(section['shape'])) if section['shape'] else 1
+            array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=data_start + section['offset'])
+            setattr(self, name, array.reshape(section['shape']))
+
+    @property
+    def version(self):
+        return self.meta['version']
+
+    def __len__(self):
+        return len(self.route_ids)
+
+    def row_for(self, route_id):
+        row = int(np.searchsorted(self.route_ids, route_id))
+        if row < len(self.route_ids) and self.route_ids[row] == route_id:
+            return row
+        return None
+
+    def path_array(self, row):
+        """(n, 2) [lat, lon] view into the shared coords array."""
+        return self.coords[self.offsets[row]:self.offsets[row + 1]]
+
+    def path(self, route_id, updated_at=None):
+        """
+        Path of a route as a numpy view, or None if the snapshot doesn't have it
+        or (when `updated_at` is given) has an older copy than the database.
+        """
+        row = self.row_for(route_id)
+        if row is None:
+            return None
+        if updated_at is not None and self.route_updated[row] != _epoch_us(updated_at):
+            return None
+        return self.path_array(row)
+
+    def routes_near(self, lat, lon, radius_cells=1):
+        """Route ids whose path passes within `radius_cells` grid cells of a point."""
+        lat_idx = math.floor(float(lat) / BUCKET_DEG)
+        lon_idx = math.floor(float(lon) / BUCKET_DEG)
+        rows = []
+        for d_lat in range(-radius_cells, radius_cells + 1):
+            for d_lon in range(-radius_cells, radius_cells + 1):
+                key = ((lat_idx + d_lat) << 32) | ((lon_idx + d_lon) & 0xFFFFFFFF)
+                i = int(np.searchsorted(self.bucket_keys, key))
+                if i < len(self.bucket_keys) and self.bucket_keys[i] == key:
+                    rows.append(self.bucket_routes[self.bucket_offsets[i]:self.bucket_offsets[i + 1]])
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        return self.route_ids[np.unique(np.concatenate(rows))]
+
+
+_lock = threading.Lock()
+_current = {'network': None, 'pointer': None, 'checked_at': 0.0}
+
+
+def get_network():
+    """
+    The worker's current RouteNetwork, or None when snapshots are disabled or not built.
+    Re-reads the CURRENT pointer at most every CHECK_INTERVAL seconds and swaps in
+    a new snapshot when it changed.
+    """
+    directory = snapshot_dir()
+    if directory is None:
+        return None
+    now = time.monotonic()
+    if now - _current['checked_at'] < CHECK_INTERVAL:
+        return _current['network']
+
+    with _lock:
+        _current['checked_at'] = now
+        try:
+            pointer = (directory / POINTER_NAME).read_text(encoding='utf-8').strip()
+        except OSError:
+            return _current['network']
+        if pointer != _current['pointer']:
+            try:
+                network = RouteNetwork(directory / pointer)
+            except (OSError, ValueError):
+                logger.exception("Could not load route network snapshot %s", pointer)
+                return _current['network']
+            # Swapping the reference is atomic; requests already holding the old
+            # network keep using it until they finish.
+            _current['network'], _current['pointer'] = network, pointer
+        return _current['network']
+
+
+def route_paths(routes):
+    """
+    {route.id: [[lat, lon], ...]} for the given Route instances, from the shared
+    snapshot where it is up to date and from route_path_coords JSON otherwise.
+    """
+    network = get_network()
+    paths = {}
+    for route in routes:
+        path = network.path(route.id, route.updated_at) if network is not None else None
+        paths[route.id] = path.tolist() if path is not None else route.get_path_coords()
+    return paths
+
+# --- END OF FILE: route_input/network.py ---
@@ -0,0 +1,210 @@
+# --- START OF FILE: route_input/profiling.py ---
+
+"""
+On-demand statistical profiling of live requests.
+
+A request is profiled when
+- it carries a valid signed X-Profile header (staff copy one from the
+  "Profile captures" admin page; it expires after PROFILE_TOKEN_MAX_AGE), or
+- it is picked by PROFILE_SAMPLE_RATE (0.0 - 1.0, default 0 = off).
+
+While the view runs, a sampler thread records the request thread's Python
+stack every PROFILE_INTERVAL seconds. The result is written to PROFILE_DIR as
+<stem>.folded (collapsed stacks, for flamegraph.pl / inferno) and
+<stem>.speedscope.json (https://www.speedscope.app), and listed in the admin
+as a ProfileCapture.
+
+When neither trigger applies, the middleware costs one header lookup.
+"""
+
+from collections import Counter
+from pathlib import Path
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core import signing
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SAMPLE_RATE = float(getattr(settings, 'PROFILE_SAMPLE_RATE', 0.0))
+PROFILE_INTERVAL = getattr(settings, 'PROFILE_INTERVAL', 0.005)  # seconds between samples
+PROFILE_TOKEN_MAX_AGE = getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 60 * 60)  # 1 hour
+PROFILE_KEEP = getattr(settings, 'PROFILE_KEEP', 200)  # captures kept on disk
+PROFILE_HEADER = 'X-Profile'
+TOKEN_SALT = 'route_input.profiling'
+
+_SITE_PREFIXES = sorted({p for p in sys.path if p and os.path.isdir(p)}, key=len, reverse=True)
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILE_DIR', None) or Path(settings.BASE_DIR) / 'var' / 'profiles')
+
+
+def make_token(user):
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(str(user.pk))
+
+
+def token_is_valid(token):
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def _short_path(filename):
+    for prefix in _SITE_PREFIXES:
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Counts the distinct stacks of one thread, sampled from a background thread."""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self):
+        names = {}  # code object -> frame name, so each function is formatted once
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = names.get(code)
+                if name is None:
+                    name = names[code] = _frame_name(code)
+                stack.append(name)
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def collapsed(stacks):
+    """Brendan Gregg's folded format: 'root;child;leaf count' per line."""
+    return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in stacks.most_common())
+
+
+def speedscope(stacks, name, interval_ms, duration_ms):
+    frames, index = [], {}
+    samples, weights = [], []
+    for stack, count in stacks.items():
+        sample = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({'name': frame})
+            sample.append(index[frame])
+        samples.append(sample)
+        weights.append(count * interval_ms)
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'trancit',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': duration_ms,
+            'samples': samples,
+            'weights': weights,
+        }],
+    }
+
+
+def save_capture(request, response, stacks, duration_ms, trigger):
+    from .models import ProfileCapture
+
+    match = getattr(request, 'resolver_match', None)
+    view_name = (match.view_name if match else None) or 'unresolved'
+    stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{view_name.replace(':', '-')}-{uuid.uuid4().hex[:8]}"
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+
+    (directory / f"{stem}.folded").write_text(collapsed(stacks), encoding='utf-8')
+    title = f"{request.method} {request.path} ({view_name})"
+    document = speedscope(stacks, title, PROFILE_INTERVAL * 1000, duration_ms)
+    (directory / f"{stem}.speedscope.json").write_text(json.dumps(document), encoding='utf-8')
+
+    capture = ProfileCapture.objects.create(
+        view_name=view_name[:100], method=request.method, path=request.path[:500],
+        status_code=response.status_code, duration_ms=duration_ms,
+        sample_count=sum(stacks.values()), trigger=trigger, file_stem=stem,
+    )
+    for old in ProfileCapture.objects.order_by('-created_at', '-id')[PROFILE_KEEP:]:
+        delete_capture_files(old)
+        old.delete()
+    return capture
+
+
+def capture_file(capture, fmt):
+    suffix = {'folded': '.folded', 'speedscope': '.speedscope.json'}[fmt]
+    return profile_dir() / f"{capture.file_stem}{suffix}"
+
+
+def delete_capture_files(capture):
+    for fmt in ('folded', 'speedscope'):
+        try:
+            capture_file(capture, fmt).unlink()
+        except FileNotFoundError:
+            pass
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _trigger(self, request):
+        token = request.headers.get(PROFILE_HEADER)
+        if token is not None:
+            return 'header' if token_is_valid(token) else None
+        if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            return 'sampled'
+        return None
+
+    def __call__(self, request):
+        trigger = self._trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        sampler = StackSampler(threading.get_ident())
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        try:
+            save_capture(request, response, sampler.stacks, duration_ms, trigger)
+        except Exception:
+            logger.exception("Could not save profile capture for %s", request.path)
+        return response
+
+# --- END OF FILE: route_input/profiling.py ---
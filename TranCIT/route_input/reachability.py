@@ -0,0 +1,339 @@
+# --- START OF FILE: route_input/reachability.py ---
+
+"""
+"Where can I get to for under P30 / within 20 minutes from here?"
+
+One one-to-many search over the stored jeepney network answers it, instead of
+one routing call per candidate destination. The network is the jeepney line
+catalogue (lines.py, one merged path per code), turned into a ReachabilityGraph
+of numpy arrays: points, the line each point belongs to, and the cumulative
+ride distance along the line.
+
+The search works in rounds, like RAPTOR:
+- walk from the origin to the points within WALK_RADIUS_M,
+- ride every line that has a boardable point, to all later points on it
+  (fare and time from calculate_fare / estimate_mode_time on the ride distance,
+  so a transfer pays a new base fare and waits for a new jeepney); boarding
+  points are tried one at a time against a running best per later point, so
+  memory stays linear in the line's length,
+- walk from the points that improved to points of other lines (transfers),
+for at most MAX_RIDES rides. Labels are (minutes, fare); a point keeps the one
+that is best on the budget asked for, and nothing over either budget is kept.
+
+Search labels are cached per snapped origin (ORIGIN_SNAP_DEG grid) and budget
+bucket, and invalidated with the catalogue version: saving a route changes
+nothing here until its line is rebuilt. A bucket is searched at its upper bound
+(a P14 budget searches P15), and each request keeps the labels within its own
+budget, so nearby budgets share a search without losing anything.
+"""
+
+import logging
+import math
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .caching import REACHABILITY
+from .lines import catalogue_version
+from .models import JeepneyLine
+
+logger = logging.getLogger(__name__)
+
+WALK_RADIUS_M = getattr(settings, 'REACHABILITY_WALK_RADIUS_M', 300)
+WALK_KPH = getattr(settings, 'REACHABILITY_WALK_KPH', 4.5)
+MAX_RIDES = getattr(settings, 'REACHABILITY_MAX_RIDES', 3)
+ORIGIN_SNAP_DEG = getattr(settings, 'REACHABILITY_ORIGIN_SNAP_DEG', 0.002)  # ~220 m
+FARE_BUCKET = getattr(settings, 'REACHABILITY_FARE_BUCKET', 5)  # pesos
+MINUTES_BUCKET = getattr(settings, 'REACHABILITY_MINUTES_BUCKET', 5)
+CELL_DEG = getattr(settings, 'REACHABILITY_CELL_DEG', 0.0025)  # polygon resolution, ~275 m
+TABLE_STEP_KM = 0.1
+EARTH_RADIUS_KM = 6371.0088
+
+INF = np.inf
+
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _walk_minutes(km):
+    return km / WALK_KPH * 60
+
+
+class RideCosts:
+    """
+    Fare and minutes of one jeepney ride by distance, tabulated from calculate_fare
+    and estimate_mode_time in TABLE_STEP_KM steps (rounded up, so never optimistic).
+    """
+
+    def __init__(self, max_km):
+        from .views import calculate_fare, estimate_mode_time
+        steps = int(math.ceil(max_km / TABLE_STEP_KM)) + 1
+        self.minutes = np.empty(steps)
+        self.fare = np.empty(steps)
+        for i in range(steps):
+            km = f"{i * TABLE_STEP_KM:.1f}"
+            minutes = estimate_mode_time('Jeepney', km)
+            self.minutes[i] = float(minutes)
+            self.fare[i] = float(calculate_fare('Jeepney', km, minutes))
+
+    def lookup(self, km):
+        index = np.minimum(np.ceil(np.asarray(km) / TABLE_STEP_KM - 1e-9).astype(np.int64), len(self.fare) - 1)
+        return self.minutes[index], self.fare[index]
+
+
+class ReachabilityGraph:
+    def __init__(self, lines, version=None):
+        """lines: [(code, origin, destination, [[lat, lon], ...]), ...]"""
+        self.version = version
+        self.lines = []
+        coords, line_of, cum_km, offsets = [], [], [], [0]
+        for code, origin, destination, path in lines:
+            path = np.asarray(path, dtype=np.float64).reshape(-1, 2)
+            if len(path) < 2:
+                continue
+            steps = _haversine_km(path[:-1, 0], path[:-1, 1], path[1:, 0], path[1:, 1])
+            coords.append(path)
+            cum_km.append(np.concatenate([[0.0], np.cumsum(steps)]))
+            line_of.append(np.full(len(path), len(self.lines)))
+            offsets.append(offsets[-1] + len(path))
+            self.lines.append({'code': code, 'origin': origin, 'destination': destination})
+        self.coords = np.concatenate(coords) if coords else np.empty((0, 2))
+        self.cum_km = np.concatenate(cum_km) if cum_km else np.empty(0)
+        self.line_of = np.concatenate(line_of) if line_of else np.empty(0, dtype=np.int64)
+        self.offsets = np.asarray(offsets)
+        longest = max((c[-1] for c in cum_km), default=0.0)
+        self.costs = RideCosts(longest + 1)
+
+        # Grid of WALK_RADIUS cells -> point indices, for walking transfers
+        self._cell_deg = WALK_RADIUS_M / 111_000
+        self._cells = {}
+        if len(self.coords):
+            keys = np.floor(self.coords / self._cell_deg).astype(np.int64)
+            for index, (i, j) in enumerate(map(tuple, keys)):
+                self._cells.setdefault((i, j), []).append(index)
+            self._cells = {key: np.asarray(value) for key, value in self._cells.items()}
+
+    def __len__(self):
+        return len(self.coords)
+
+    def points_near(self, lat, lon):
+        """(point indices, walking km) within WALK_RADIUS_M of a point."""
+        i, j = math.floor(lat / self._cell_deg), math.floor(lon / self._cell_deg)
+        found = [self._cells[key] for key in ((i + di, j + dj) for di in (-1, 0, 1) for dj in (-1, 0, 1))
+                 if key in self._cells]
+        if not found:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        candidates = np.concatenate(found)
+        km = _haversine_km(lat, lon, self.coords[candidates, 0], self.coords[candidates, 1])
+        close = km <= WALK_RADIUS_M / 1000
+        return candidates[close], km[close]
+
+    # -----------------------------
+    # Search
+    # -----------------------------
+
+    def search(self, lat, lon, max_fare=None, max_minutes=None):
+        """
+        (minutes, fare, rode) arrays per point: unreachable points are inf, and
+        rode marks points whose best label ends in a ride rather than a walk.
+        """
+        max_fare = INF if max_fare is None else float(max_fare)
+        max_minutes = INF if max_minutes is None else float(max_minutes)
+        by_time = max_minutes != INF
+        minutes = np.full(len(self), INF)
+        fare = np.full(len(self), INF)
+        rode = np.zeros(len(self), dtype=bool)
+
+        def better(new_minutes, new_fare, old_minutes, old_fare):
+            within = (new_minutes <= max_minutes) & (new_fare <= max_fare)
+            if by_time:
+                return within & ((new_minutes < old_minutes) | ((new_minutes == old_minutes) & (new_fare < old_fare)))
+            return within & ((new_fare < old_fare) | ((new_fare == old_fare) & (new_minutes < old_minutes)))
+
+        points, km = self.points_near(lat, lon)
+        walk = _walk_minutes(km)
+        improved = better(walk, np.zeros_like(walk), minutes[points], fare[points])
+        points, walk = points[improved], walk[improved]
+        minutes[points], fare[points] = walk, 0.0
+        boardable = set(points.tolist())
+
+        for _ in range(MAX_RIDES):
+            if not boardable:
+                break
+            ridden = self._ride(boardable, minutes, fare, rode, better)
+            boardable = self._transfer(ridden, minutes, fare, rode, better)
+        return minutes, fare, rode
+
+    def _ride(self, boardable, minutes, fare, rode, better):
+        """Ride every line from its boardable points; returns the points that improved."""
+        board = np.sort(np.fromiter(boardable, dtype=np.int64))
+        improved = set()
+        for line in np.unique(self.line_of[board]):
+            here = board[self.line_of[board] == line]
+            end = self.offsets[line + 1]
+            stops = np.arange(here[0] + 1, end)
+            if not len(stops):
+                continue
+            # Best arrival at every later point, one boarding point at a time (rides only go forward)
+            new_minutes, new_fare = np.full(len(stops), INF), np.full(len(stops), INF)
+            for point in here.tolist():
+                ride_minutes, ride_fare = self.costs.lookup(self.cum_km[point + 1:end] - self.cum_km[point])
+                arrive_minutes, arrive_fare = minutes[point] + ride_minutes, fare[point] + ride_fare
+                later = point + 1 - stops[0]
+                take = better(arrive_minutes, arrive_fare, new_minutes[later:], new_fare[later:])
+                new_minutes[later:][take], new_fare[later:][take] = arrive_minutes[take], arrive_fare[take]
+            mask = better(new_minutes, new_fare, minutes[stops], fare[stops])
+            minutes[stops[mask]], fare[stops[mask]] = new_minutes[mask], new_fare[mask]
+            rode[stops[mask]] = True
+            improved.update(stops[mask].tolist())
+        return improved
+
+    def _transfer(self, ridden, minutes, fare, rode, better):
+        """Walk from newly reached points to nearby points of other lines."""
+        improved = set()
+        for point in ridden:
+            lat, lon = self.coords[point]
+            near, km = self.points_near(lat, lon)
+            other = self.line_of[near] != self.line_of[point]
+            near, km = near[other], km[other]
+            new_minutes = minutes[point] + _walk_minutes(km)
+            new_fare = np.full(len(near), fare[point])
+            mask = better(new_minutes, new_fare, minutes[near], fare[near])
+            minutes[near[mask]], fare[near[mask]] = new_minutes[mask], new_fare[mask]
+            rode[near[mask]] = False
+            improved.update(near[mask].tolist())
+        return improved
+
+    # -----------------------------
+    # Results
+    # -----------------------------
+
+    def summarize(self, minutes, fare, rode):
+        """Routes ridden (where to board, how far they get you), places reached and the area."""
+        reached = np.isfinite(minutes)
+        routes, places = [], {}
+        for line, info in enumerate(self.lines):
+            start, end = self.offsets[line], self.offsets[line + 1]
+            ridden = np.flatnonzero(rode[start:end])
+            if not len(ridden):
+                continue
+            first, last = start + np.flatnonzero(reached[start:end])[0], start + ridden[-1]
+            routes.append(dict(info, board=self.coords[first].round(6).tolist(),
+                               furthest=self.coords[last].round(6).tolist(),
+                               fare=round(float(fare[last]), 2), minutes=round(float(minutes[last]), 1)))
+            for name, point in ((info['origin'], start), (info['destination'], end - 1)):
+                if name and reached[point] and (name not in places or fare[point] < places[name]['fare']):
+                    places[name] = {'name': name, 'lat': round(float(self.coords[point, 0]), 6),
+                                    'lon': round(float(self.coords[point, 1]), 6),
+                                    'fare': round(float(fare[point]), 2), 'minutes': round(float(minutes[point]), 1)}
+        routes.sort(key=lambda r: (r['fare'], r['minutes']))
+        return {
+            'routes': routes,
+            'places': sorted(places.values(), key=lambda p: (p['fare'], p['minutes'])),
+            'area': reachable_polygon(self.coords[reached]),
+        }
+
+
+def reachable_polygon(points):
+    """
+    Simplified reachable area as a GeoJSON MultiPolygon: the CELL_DEG grid cells
+    containing reachable points, with each row's consecutive cells merged.
+    """
+    if not len(points):
+        return {'type': 'MultiPolygon', 'coordinates': []}
+    cells = np.unique(np.floor(points / CELL_DEG).astype(np.int64), axis=0)
+    polygons = []
+    run_start = prev = None
+    for i, j in map(tuple, np.vstack([cells, [[cells[-1][0] + 2, 0]]])):
+        if prev is not None and i == prev[0] and j == prev[1] + 1:
+            prev = (i, j)
+            continue
+        if prev is not None:
+            south, north = run_start[0] * CELL_DEG, (run_start[0] + 1) * CELL_DEG
+            west, east = run_start[1] * CELL_DEG, (prev[1] + 1) * CELL_DEG
+            ring = [[west, south], [east, south], [east, north], [west, north], [west, south]]
+            polygons.append([[[round(x, 6), round(y, 6)] for x, y in ring]])
+        run_start = prev = (i, j)
+    return {'type': 'MultiPolygon', 'coordinates': polygons}
+
+
+# -----------------------------
+# Graph and result caching
+# -----------------------------
+
+_graph_lock = threading.Lock()
+_graph = {'graph': None}
+
+
+def build_graph(version=None):
+    lines = []
+    for line in JeepneyLine.objects.exclude(path_coords='').only('code', 'name', 'path_coords'):
+        # lines.build_line() names a line after its most common "origin to destination"
+        origin, _, destination = line.name.partition(' to ')
+        lines.append((line.code, origin or None, destination or None, line.get_path_coords()))
+    return ReachabilityGraph(lines, version=version)
+
+
+def get_graph():
+    """This worker's graph of the jeepney line catalogue, rebuilt when a line changes."""
+    version = catalogue_version()
+    graph = _graph['graph']
+    if graph is not None and graph.version == version:
+        return graph
+    with _graph_lock:
+        if _graph['graph'] is None or _graph['graph'].version != version:
+            _graph['graph'] = build_graph(version)
+            logger.info("Built reachability graph: %s lines, %s points", len(_graph['graph'].lines), len(_graph['graph']))
+        return _graph['graph']
+
+
+def _bucket(value, size):
+    """Upper bound of the bucket a budget falls in (14 -> 15 for 5-peso buckets)."""
+    return None if value is None else math.ceil(float(value) / size) * size
+
+
+def _within(graph, labels, max_fare, max_minutes):
+    """Full (minutes, fare, rode) arrays from cached labels, keeping only those within the budgets."""
+    points, point_minutes, point_fare, point_rode = labels
+    keep = np.ones(len(points), dtype=bool)
+    if max_fare is not None:
+        keep &= point_fare <= float(max_fare)
+    if max_minutes is not None:
+        keep &= point_minutes <= float(max_minutes)
+    minutes, fare, rode = np.full(len(graph), INF), np.full(len(graph), INF), np.zeros(len(graph), dtype=bool)
+    points = points[keep]
+    minutes[points], fare[points], rode[points] = point_minutes[keep], point_fare[keep], point_rode[keep]
+    return minutes, fare, rode
+
+
+def reachable(lat, lon, max_fare=None, max_minutes=None):
+    """
+    Reachable routes, places and area from (lat, lon) within the budgets. The origin
+    is snapped to the ORIGIN_SNAP_DEG grid and the search runs at the budgets' bucket
+    upper bounds, so nearby queries share one cached search.
+    """
+    if max_fare is None and max_minutes is None:
+        raise ValueError("give max_fare and/or max_minutes")
+    snapped_lat = (math.floor(float(lat) / ORIGIN_SNAP_DEG) + 0.5) * ORIGIN_SNAP_DEG
+    snapped_lon = (math.floor(float(lon) / ORIGIN_SNAP_DEG) + 0.5) * ORIGIN_SNAP_DEG
+    fare_bucket, minutes_bucket = _bucket(max_fare, FARE_BUCKET), _bucket(max_minutes, MINUTES_BUCKET)
+
+    graph = get_graph()
+    raw_key = f"{graph.version}|{snapped_lat:.6f}|{snapped_lon:.6f}|{fare_bucket}|{minutes_bucket}"
+    labels = REACHABILITY.get(raw_key, args=[snapped_lat, snapped_lon, fare_bucket, minutes_bucket])
+    if labels is None:
+        minutes, fare, rode = graph.search(snapped_lat, snapped_lon, fare_bucket, minutes_bucket)
+        points = np.flatnonzero(np.isfinite(minutes))
+        labels = REACHABILITY.set(raw_key, (points, minutes[points], fare[points], rode[points]))
+
+    result = graph.summarize(*_within(graph, labels, max_fare, max_minutes))
+    result['origin'] = [round(snapped_lat, 6), round(snapped_lon, 6)]
+    result['max_fare'] = None if max_fare is None else float(max_fare)
+    result['max_minutes'] = None if max_minutes is None else float(max_minutes)
+    return result
+
+# --- END OF FILE: route_input/reachability.py ---
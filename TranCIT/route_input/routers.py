@@ -0,0 +1,79 @@
+# --- START OF FILE: route_input/routers.py ---
+
+"""
+Send Route/SavedRoute reads to read replicas, writes to the primary.
+
+Replication lag would make a freshly saved route vanish from the dashboard, so
+reads are pinned to the primary:
+- for the rest of a request once it has written anything, and
+- for REPLICA_STICKY_SECONDS afterwards, via a cookie ReplicaPinMiddleware sets
+  on responses to requests that wrote (save_current_route, plan_route, ...).
+
+Everything else (auth, sessions, admin, profile captures) stays on `default`.
+"""
+
+import contextvars
+import random
+import time
+
+from django.conf import settings
+
+REPLICATED_MODELS = {'route_input.route', 'route_input.savedroute'}
+PIN_COOKIE = 'db_pin'
+
+# {'pinned': bool, 'wrote': bool} for the request being served
+_request_state = contextvars.ContextVar('replica_request_state', default=None)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def pinned_to_primary():
+    state = _request_state.get()
+    return state is not None and (state['pinned'] or state['wrote'])
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in REPLICATED_MODELS or pinned_to_primary():
+            return 'default'
+        aliases = replicas()
+        return random.choice(aliases) if aliases else 'default'
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and model._meta.label_lower in REPLICATED_MODELS:
+            state['wrote'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+
+class ReplicaPinMiddleware:
+    """Track writes per request and keep the writer's next reads on the primary."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        state = {'pinned': pinned_until > time.time(), 'wrote': False}
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        if state['wrote'] and replicas():
+            sticky = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+            response.set_cookie(PIN_COOKIE, f"{time.time() + sticky:.0f}", max_age=sticky,
+                                httponly=True, samesite='Lax')
+        return response
+
+# --- END OF FILE: route_input/routers.py ---
@@ -0,0 +1,192 @@
+# --- START OF FILE: route_input/saved_routes.py ---
+
+"""
+Cached, compact listing of a user's (or anonymous session's) saved routes.
+
+The dashboard used to query SavedRoute and hand full model instances to the
+template on every render. Here the first SAVED_ROUTES_CACHE_LIMIT rows are kept
+in the cache as plain tuples, and anything older is paged in with a keyset
+("load more") cursor straight from the DB.
+
+The rows are cached under a per-owner generation. Saves, deletes and usage
+flushes never edit the cached list (two of them racing would lose rows); they
+start a new generation instead, and the next read loads it from the DB. A read
+that raced a write stores its rows under the old generation, where nobody looks.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+import secrets
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import SavedRoute
+
+SAVED_ROUTES_CACHE_TTL = getattr(settings, 'SAVED_ROUTES_CACHE_TTL', 10 * 60)  # 10 minutes
+SAVED_ROUTES_CACHE_LIMIT = getattr(settings, 'SAVED_ROUTES_CACHE_LIMIT', 100)
+SAVED_ROUTES_PAGE_SIZE = getattr(settings, 'SAVED_ROUTES_PAGE_SIZE', 20)
+
+ROW_FIELDS = (
+    'id', 'origin', 'destination',
+    'origin_latitude', 'origin_longitude', 'destination_latitude', 'destination_longitude',
+    'transport_type', 'code', 'fare', 'last_used', 'thumbnail_key',
+)
+
+# Attribute access keeps the template unchanged ({{ saved.origin }} etc.).
+# Decimals are stored as strings and last_used as epoch microseconds to keep pickles small.
+SavedRouteRow = namedtuple('SavedRouteRow', ROW_FIELDS)
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_stats():
+    """Hit/miss counters for this worker process."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _decimal_str(value):
+    return None if value is None else str(value)
+
+
+def _epoch_us(value):
+    return int(value.timestamp() * 1_000_000)
+
+
+def to_row(values):
+    """Build a SavedRouteRow from a values_list() tuple (in ROW_FIELDS order) or a model instance."""
+    if isinstance(values, SavedRoute):
+        values = tuple(getattr(values, f) for f in ROW_FIELDS)
+    (pk, origin, destination, o_lat, o_lon, d_lat, d_lon, transport_type, code, fare, last_used, thumbnail_key) = values
+    return SavedRouteRow(
+        pk, origin, destination,
+        _decimal_str(o_lat), _decimal_str(o_lon), _decimal_str(d_lat), _decimal_str(d_lon),
+        transport_type, code, _decimal_str(fare), _epoch_us(last_used), thumbnail_key,
+    )
+
+
+def _user_id(user):
+    return user.pk if user is not None and user.is_authenticated else None
+
+
+def owner_filter(user_id=None, owner_hash=None):
+    if user_id is not None:
+        return Q(user_id=user_id)
+    return Q(session_key_hash=owner_hash)
+
+
+def _owner_key(user_id=None, owner_hash=None):
+    return f"user:{user_id}" if user_id is not None else f"anon:{owner_hash}"
+
+
+def _cache_key(user_id=None, owner_hash=None):
+    """Key of the owner's rows in their current generation, starting one if there is none."""
+    generation_key = f"saved_routes:generation:{_owner_key(user_id, owner_hash)}"
+    generation = cache.get(generation_key)
+    if generation is None:
+        cache.add(generation_key, secrets.token_hex(4), SAVED_ROUTES_CACHE_TTL)
+        generation = cache.get(generation_key)
+    # v3: rows are cached per generation
+    return f"saved_routes:v3:{_owner_key(user_id, owner_hash)}:{generation}"
+
+
+def _load_rows(user_id=None, owner_hash=None):
+    qs = (SavedRoute.objects.filter(owner_filter(user_id, owner_hash))
+          .order_by('-last_used', '-id')
+          .values_list(*ROW_FIELDS)[:SAVED_ROUTES_CACHE_LIMIT])
+    return [to_row(values) for values in qs]
+
+
+def cached_rows(user=None, owner_hash=None):
+    """All cached rows (newest first) for the owner, loading them on a miss."""
+    user_id = _user_id(user)
+    if user_id is None and not owner_hash:
+        return []
+    key = _cache_key(user_id, owner_hash)
+    rows = cache.get(key)
+    if rows is not None:
+        _count('hits')
+        return rows
+    _count('misses')
+    rows = _load_rows(user_id, owner_hash)
+    cache.set(key, rows, SAVED_ROUTES_CACHE_TTL)
+    return rows
+
+
+def _with_pending_usage(rows):
+    """Rows with this process's unflushed last_used (usage.py) applied, newest first again."""
+    from .usage import pending_last_used
+    pending = pending_last_used()
+    if not any(row.id in pending for row in rows):
+        return rows
+    rows = [row._replace(last_used=max(row.last_used, _epoch_us(pending[row.id]))) if row.id in pending else row
+            for row in rows]
+    return sorted(rows, key=lambda row: (row.last_used, row.id), reverse=True)
+
+
+def encode_cursor(row):
+    return f"{row.last_used}:{row.id}"
+
+
+def decode_cursor(cursor):
+    try:
+        last_used, pk = cursor.split(':')
+        return int(last_used), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def get_page(user=None, owner_hash=None, cursor=None, page_size=SAVED_ROUTES_PAGE_SIZE):
+    """
+    Return (rows, next_cursor). Pages inside the cached window come from the cache;
+    later pages use a keyset query on (last_used, id).
+    """
+    rows = _with_pending_usage(cached_rows(user, owner_hash))
+    position = decode_cursor(cursor) if cursor else None
+
+    if position is None:
+        page = rows[:page_size + 1]
+    else:
+        page = [r for r in rows if (r.last_used, r.id) < position][:page_size + 1]
+        cache_complete = len(rows) < SAVED_ROUTES_CACHE_LIMIT
+        if len(page) <= page_size and not cache_complete:
+            # Past the cached window: fall back to the database.
+            last_used_us, pk = position
+            last_used = datetime.fromtimestamp(last_used_us / 1_000_000, tz=dt_timezone.utc)
+            qs = (SavedRoute.objects.filter(owner_filter(_user_id(user), owner_hash))
+                  .filter(Q(last_used__lt=last_used) | Q(last_used=last_used, id__lt=pk))
+                  .order_by('-last_used', '-id')
+                  .values_list(*ROW_FIELDS)[:page_size + 1])
+            page = [to_row(values) for values in qs]
+
+    has_more = len(page) > page_size
+    page = page[:page_size]
+    next_cursor = encode_cursor(page[-1]) if has_more and page else None
+    return page, next_cursor
+
+
+def forget_owner(user_id=None, owner_hash=None):
+    """Start a new generation of the owner's cached rows after any write to their saved routes."""
+    cache.set(f"saved_routes:generation:{_owner_key(user_id, owner_hash)}", secrets.token_hex(4),
+              SAVED_ROUTES_CACHE_TTL)
+
+
+def remember_saved(saved):
+    """After creating or updating a SavedRoute."""
+    forget_owner(saved.user_id, saved.session_key_hash)
+
+
+def forget_saved(saved):
+    """After deleting a SavedRoute."""
+    forget_owner(saved.user_id, saved.session_key_hash)
+
+# --- END OF FILE: route_input/saved_routes.py ---
@@ -0,0 +1,56 @@
+# --- START OF FILE: route_input/signals.py ---
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Route
+
+def _network_snapshot_changed():
+    from .network import mark_dirty, schedule_rebuild
+    mark_dirty()
+    if settings.ROUTE_SNAPSHOT_AUTO_REBUILD:
+        schedule_rebuild()
+
+
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+def route_changed(sender, **kwargs):
+    """Mark the shared route network snapshot dirty once the change is committed (rebuilt debounced)."""
+    if settings.ROUTE_SNAPSHOT_DIR:
+        transaction.on_commit(_network_snapshot_changed)
+
+
+@receiver(post_save, sender=Route)
+def route_saved_log(sender, instance, update_fields=None, **kwargs):
+    """Append to the network change log (sync.py), in the same transaction as the save."""
+    from .sync import SYNCED_FIELDS, log_changes
+    if update_fields is None or SYNCED_FIELDS & set(update_fields):
+        log_changes([instance.pk])
+
+
+@receiver(post_delete, sender=Route)
+def route_deleted_log(sender, instance, **kwargs):
+    from .sync import log_changes
+    log_changes([instance.pk], deleted=True)
+
+
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+def route_line_changed(sender, instance, **kwargs):
+    """Queue the jeepney line of the route's code for a debounced rebuild once the change is committed."""
+    if settings.LINE_CATALOGUE_AUTO_REBUILD and instance.transport_type == 'Jeepney' and instance.code:
+        from .lines import schedule_sync
+        code = instance.code
+        transaction.on_commit(lambda: schedule_sync([code]))
+
+
+@receiver(post_save, sender=Route)
+def route_thumbnail_changed(sender, instance, update_fields=None, **kwargs):
+    """Render the route's preview in the background once a new path is committed (thumbnails.py)."""
+    if settings.THUMBNAIL_AUTO_RENDER and (update_fields is None or 'route_path_coords' in update_fields):
+        from .thumbnails import schedule
+        transaction.on_commit(lambda: schedule([instance.pk]))
+
+# --- END OF FILE: route_input/signals.py ---
@@ -0,0 +1,276 @@
+# --- START OF FILE: route_input/speeds.py ---
+
+"""
+Learned travel speeds, for ETAs without calling ORS.
+
+Observations are (cell, hour of the week, transport type, speed in kph):
+- every fresh ORS driving result, split per grid cell using its steps
+  (stored as transport type 'car'),
+- trips users report with their actual duration (stored under their mode; the
+  speed includes stops along the way but not the wait before boarding).
+Cells are network.bucket_key() cells (~1.1 km). Each observation is one atomic
+UPDATE of a TravelSpeed row (count, sum, sum of squares), so mean and variance
+stay exact without ever reading the row back.
+
+predict() splits a trip into cells and adds up the time through each one at the
+best known speed: the mode's own speed for that cell and hour, else for that
+cell at any hour, else the 'car' speed scaled by the mode's speed_factor (plus
+its dwell time), else the mode's fallback_kph. Every worker keeps the whole
+table in memory (it is small: cells x 168 hours x modes that were observed) and
+reloads it every SPEED_MODEL_MAX_AGE seconds.
+"""
+
+from collections import namedtuple
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, models, transaction
+from django.utils import timezone
+
+from .models import TravelSpeed
+from .network import bucket_key
+
+logger = logging.getLogger(__name__)
+
+CAR = 'car'
+SPEED_FALLBACK_KPH = getattr(settings, 'SPEED_FALLBACK_KPH', 20)
+SPEED_MIN_SAMPLES = getattr(settings, 'SPEED_MIN_SAMPLES', 3)
+SPEED_MIN_KPH, SPEED_MAX_KPH = getattr(settings, 'SPEED_PLAUSIBLE_KPH', (2, 100))
+SPEED_MODEL_MAX_AGE = getattr(settings, 'SPEED_MODEL_MAX_AGE', 5 * 60)
+SPEED_TIMEZONE = ZoneInfo(getattr(settings, 'SPEED_TIMEZONE', 'Asia/Manila'))
+SPEED_SAMPLE_KM = 0.25  # straight-line trips are split into pieces this long
+SPEED_DETOUR_FACTOR = getattr(settings, 'SPEED_DETOUR_FACTOR', 1.3)  # road km per straight-line km
+SPEED_LEARNED_COVERAGE = 0.5  # share of the distance with learned speeds to call a prediction learned
+
+Stats = namedtuple('Stats', 'count mean variance')
+Prediction = namedtuple('Prediction', 'minutes coverage')
+
+
+def hour_of_week(when=None):
+    local = timezone.localtime(when or timezone.now(), SPEED_TIMEZONE)
+    return local.weekday() * 24 + local.hour
+
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0088 * np.arcsin(np.sqrt(a))
+
+
+def split_by_cell(points, distance_km=None):
+    """
+    {cell: km} for a trip along [(lat, lon), ...]: each piece counts for the cell of
+    its midpoint, scaled so the total is distance_km when given (the road distance).
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) == 2:
+        # Straight line: cut it up so it still crosses the cells in between
+        steps = max(int(_haversine_km(*points[0], *points[1]) / SPEED_SAMPLE_KM), 1)
+        points = points[0] + (points[1] - points[0]) * np.linspace(0, 1, steps + 1)[:, None]
+    if len(points) < 2:
+        return {}
+    pieces = _haversine_km(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1])
+    total = pieces.sum()
+    if total <= 0:
+        return {int(bucket_key(*points[0])): float(distance_km or 0)}
+    if distance_km is not None:
+        pieces = pieces * (float(distance_km) / total)
+    middles = (points[:-1] + points[1:]) / 2
+    by_cell = {}
+    for cell, km in zip(bucket_key(middles[:, 0], middles[:, 1]).tolist(), pieces.tolist()):
+        by_cell[cell] = by_cell.get(cell, 0.0) + km
+    return by_cell
+
+
+# -----------------------------
+# In-memory model
+# -----------------------------
+
+class SpeedModel:
+    def __init__(self, rows=()):
+        """rows: (cell, hour_of_week, transport_type, count, speed_sum, speed_sq_sum)"""
+        self.loaded_at = time.monotonic()
+        self._sums = {}
+        self._any_hour = {}
+        for cell, hour, mode, count, total, total_sq in rows:
+            self.add(cell, hour, mode, count, total, total_sq)
+
+    @staticmethod
+    def _merge(table, key, count, total, total_sq):
+        n, s, sq = table.get(key, (0, 0.0, 0.0))
+        table[key] = (n + count, s + total, sq + total_sq)
+
+    def add(self, cell, hour, mode, count, total, total_sq):
+        self._merge(self._sums, (cell, hour, mode), count, total, total_sq)
+        self._merge(self._any_hour, (cell, mode), count, total, total_sq)
+
+    def observe(self, cell, hour, mode, kph):
+        self.add(cell, hour, mode, 1, kph, kph * kph)
+
+    def stats(self, cell, hour, mode):
+        """Stats for the cell at that hour, else at any hour; None below SPEED_MIN_SAMPLES."""
+        for sums in (self._sums.get((cell, hour, mode)), self._any_hour.get((cell, mode))):
+            n, total, total_sq = sums or (0, 0.0, 0.0)
+            if n >= SPEED_MIN_SAMPLES:
+                mean = total / n
+                return Stats(n, mean, max(total_sq - total * total / n, 0.0) / max(n - 1, 1))
+        return None
+
+    def __len__(self):
+        return len(self._sums)
+
+
+_lock = threading.Lock()
+_model = {'model': None}
+
+
+def get_model():
+    model = _model['model']
+    if model is not None and time.monotonic() - model.loaded_at < SPEED_MODEL_MAX_AGE:
+        return model
+    with _lock:
+        model = _model['model']
+        if model is None or time.monotonic() - model.loaded_at >= SPEED_MODEL_MAX_AGE:
+            try:
+                rows = TravelSpeed.objects.values_list(
+                    'cell', 'hour_of_week', 'transport_type', 'count', 'speed_sum', 'speed_sq_sum')
+                model = SpeedModel(rows.iterator(chunk_size=5000))
+            except DatabaseError:
+                logger.exception("Could not load the travel speed model")
+                model = model or SpeedModel()
+            _model['model'] = model
+        return model
+
+
+def reset_model():
+    _model['model'] = None
+
+
+# -----------------------------
+# Recording
+# -----------------------------
+
+def _add_observation(cell, hour, mode, kph):
+    changes = dict(count=models.F('count') + 1, speed_sum=models.F('speed_sum') + kph,
+                   speed_sq_sum=models.F('speed_sq_sum') + kph * kph, updated_at=timezone.now())
+    row = TravelSpeed.objects.filter(cell=cell, hour_of_week=hour, transport_type=mode)
+    if row.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            TravelSpeed.objects.create(cell=cell, hour_of_week=hour, transport_type=mode,
+                                       count=1, speed_sum=kph, speed_sq_sum=kph * kph)
+    except IntegrityError:  # another worker created it first
+        row.update(**changes)
+
+
+def record(mode, by_cell, minutes, when=None):
+    """
+    Record a trip of sum(by_cell.values()) km taking `minutes` as one speed
+    observation per cell. Returns the number of cells recorded (0 if implausible).
+    """
+    km = sum(by_cell.values())
+    if not km or not minutes or minutes <= 0:
+        return 0
+    kph = km / (float(minutes) / 60)
+    if not SPEED_MIN_KPH <= kph <= SPEED_MAX_KPH:
+        return 0
+    hour, model = hour_of_week(when), get_model()
+    for cell in by_cell:
+        _add_observation(cell, hour, mode, kph)
+        model.observe(cell, hour, mode, kph)
+    return len(by_cell)
+
+
+def record_steps(mode, step_cells, when=None):
+    """Record [(by_cell, minutes), ...] per step, merged per cell first. Returns cells recorded."""
+    per_cell = {}
+    for by_cell, minutes in step_cells:
+        km_total = sum(by_cell.values())
+        for cell, km in by_cell.items():
+            km_sum, min_sum = per_cell.get(cell, (0.0, 0.0))
+            per_cell[cell] = (km_sum + km, min_sum + minutes * (km / km_total if km_total else 0))
+    return sum(record(mode, {cell: km}, minutes, when) for cell, (km, minutes) in per_cell.items())
+
+
+def record_ors_route(route_geojson, when=None):
+    """Feed one ORS driving-car geojson result into the model as 'car' speeds."""
+    try:
+        feature = route_geojson['features'][0]
+        coords = [(lat, lon) for lon, lat, *_ in feature['geometry']['coordinates']]
+        properties = feature.get('properties', {})
+        steps = [step for segment in properties.get('segments', []) for step in segment.get('steps', [])]
+        if steps:
+            pieces = []
+            for step in steps:
+                first, last = step['way_points']
+                if last > first and step.get('duration'):
+                    pieces.append((split_by_cell(coords[first:last + 1], step['distance'] / 1000),
+                                   step['duration'] / 60))
+            return record_steps(CAR, pieces, when)
+        summary = properties.get('summary', {})
+        return record_steps(CAR, [(split_by_cell(coords, summary.get('distance', 0) / 1000),
+                                   summary.get('duration', 0) / 60)], when)
+    except (KeyError, IndexError, TypeError, ValueError):
+        logger.warning("Could not read speeds from an ORS response", exc_info=True)
+        return 0
+    except DatabaseError:
+        logger.exception("Could not record ORS speeds")
+        return 0
+
+
+def record_trip(transport_type, points, minutes, distance_km=None, when=None):
+    """
+    Record a trip a user reports taking `minutes` door to door (wait included).
+    Without distance_km the road distance is the straight line times SPEED_DETOUR_FACTOR.
+    """
+    from .views import TRANSPORT_TIME_MODELS
+    by_cell = split_by_cell(points, distance_km)
+    if distance_km is None and len(points) == 2:
+        by_cell = {cell: km * SPEED_DETOUR_FACTOR for cell, km in by_cell.items()}
+    mode = TRANSPORT_TIME_MODELS.get(transport_type)
+    moving = float(minutes) - (float(mode['wait_min']) if mode else 0)
+    return record(transport_type, by_cell, max(moving, 1.0), when)
+
+
+# -----------------------------
+# Prediction
+# -----------------------------
+
+def predict(transport_type, points, distance_km=None, when=None):
+    """
+    Prediction(minutes, coverage) for a trip along points ([(lat, lon), ...]; just
+    the two ends is fine). minutes includes the mode's wait before boarding;
+    coverage is the share of the distance priced with learned speeds.
+    """
+    from .views import TRANSPORT_TIME_MODELS
+    mode = TRANSPORT_TIME_MODELS.get(transport_type)
+    fallback_kph = mode['fallback_kph'] if mode else SPEED_FALLBACK_KPH
+    hour, model = hour_of_week(when), get_model()
+    minutes = learned_km = total_km = 0.0
+    for cell, km in split_by_cell(points, distance_km).items():
+        total_km += km
+        own = model.stats(cell, hour, transport_type or CAR)
+        car = model.stats(cell, hour, CAR) if own is None and mode is not None else None
+        if own is not None:
+            minutes += km / own.mean * 60
+            learned_km += km
+        elif car is not None:
+            minutes += km / car.mean * 60 * float(mode['speed_factor']) + km * float(mode['dwell_min_per_km'])
+            learned_km += km
+        else:
+            minutes += km / fallback_kph * 60 + (km * float(mode['dwell_min_per_km']) if mode else 0)
+    if mode:
+        minutes += float(mode['wait_min'])
+    return Prediction(Decimal(f"{minutes:.2f}"), learned_km / total_km if total_km else 0.0)
+
+
+def is_learned(prediction):
+    return prediction.coverage >= SPEED_LEARNED_COVERAGE
+
+# --- END OF FILE: route_input/speeds.py ---
@@ -0,0 +1,116 @@
+// Keeps a copy of the route network in IndexedDB, brought up to date from
+// /routes/network/changes/ (route_input/sync.py). Shared by the dashboard
+// (script.js) and the service worker (importScripts).
+self.NetworkSync = (() => {
+    const DB_NAME = 'trancit-network';
+    const ROUTES = 'routes';
+    const META = 'meta';
+
+    const request = (req) => new Promise((resolve, reject) => {
+        req.onsuccess = () => resolve(req.result);
+        req.onerror = () => reject(req.error);
+    });
+
+    const done = (tx) => new Promise((resolve, reject) => {
+        tx.oncomplete = () => resolve();
+        tx.onerror = tx.onabort = () => reject(tx.error);
+    });
+
+    const toRoute = ([id, transport_type, code, label, path]) => ({ id, transport_type, code, label, path });
+
+    async function indexedDbStore() {
+        const open = indexedDB.open(DB_NAME, 1);
+        open.onupgradeneeded = () => {
+            open.result.createObjectStore(ROUTES, { keyPath: 'id' });
+            open.result.createObjectStore(META);
+        };
+        const db = await request(open);
+        return {
+            version: async () => (await request(db.transaction(META).objectStore(META).get('version'))) || 0,
+            apply(data, version, clear) {
+                const tx = db.transaction([ROUTES, META], 'readwrite');
+                const routes = tx.objectStore(ROUTES);
+                if (clear) routes.clear();
+                data.upserts.forEach(row => routes.put(toRoute(row)));
+                data.deletes.forEach(id => routes.delete(id));
+                tx.objectStore(META).put(version, 'version');
+                return done(tx);
+            },
+            all: () => request(db.transaction(ROUTES).objectStore(ROUTES).getAll()),
+        };
+    }
+
+    // Without IndexedDB (private browsing, old browsers) every sync is a full download
+    function memoryStore() {
+        const routes = new Map();
+        let current = 0;
+        return {
+            version: async () => current,
+            async apply(data, version, clear) {
+                if (clear) routes.clear();
+                data.upserts.forEach(row => routes.set(row[0], toRoute(row)));
+                data.deletes.forEach(id => routes.delete(id));
+                current = version;
+            },
+            all: async () => [...routes.values()],
+        };
+    }
+
+    const openStore = () => indexedDbStore().catch(() => memoryStore());
+
+    async function sync(changesUrl, { signal, store } = {}) {
+        store = store || await openStore();
+        let since = await store.version();
+        let cursor = null;
+        let asOf = null;
+        for (;;) {
+            const params = new URLSearchParams({ since });
+            if (cursor !== null) {
+                params.set('cursor', cursor);
+                params.set('as_of', asOf);
+            }
+            const res = await fetch(`${changesUrl}?${params}`, { signal, credentials: 'same-origin' });
+            if (!res.ok) throw new Error(`Route network sync failed (${res.status})`);
+            const data = await res.json();
+            const resetting = data.reset && data.cursor !== null;
+            // Mid-reset the stored version stays 0, so an interrupted reset starts over
+            await store.apply(data, resetting ? 0 : data.version, data.reset && cursor === null);
+            if (resetting) {
+                cursor = data.cursor;
+                asOf = data.version;
+            } else {
+                since = data.version;
+                cursor = null;
+            }
+            if (!data.more) return store;
+        }
+    }
+
+    // Routes of the up-to-date network; throws when the server cannot be reached
+    async function load(changesUrl, options = {}) {
+        return (await sync(changesUrl, options)).all();
+    }
+
+    function decodePolyline(encoded, precision = 5) {
+        const factor = 10 ** precision;
+        const points = [];
+        let lat = 0, lon = 0, index = 0;
+        const next = () => {
+            let result = 0, shift = 0, byte;
+            do {
+                byte = encoded.charCodeAt(index++) - 63;
+                result |= (byte & 0x1f) << shift;
+                shift += 5;
+            } while (byte >= 0x20);
+            return result & 1 ? ~(result >> 1) : result >> 1;
+        };
+        while (index < encoded.length) {
+            lat += next();
+            lon += next();
+            points.push([lat / factor, lon / factor]);
+        }
+        return points;
+    }
+
+    return { openStore, sync, load, decodePolyline };
+})();
@@ -289,4 +289,150 @@ document.addEventListener('DOMContentLoaded', () => {
         if (!suggestionsContainer.contains(e.target) && e.target !== destinationInput)
             suggestionsContainer.style.display = 'none';
     });
+
+    // === Route Network (synced copy in IndexedDB, see network-sync.js) ===
+    const mapContainer = $('#map-container');
+    const networkRouteIds = $('#network-route-ids') ? JSON.parse($('#network-route-ids').textContent) : null;
+    const networkWorkerUrl = mapContainer?.dataset.networkWorkerUrl;
+
+    if (networkWorkerUrl && 'serviceWorker' in navigator) {
+        navigator.serviceWorker.register(networkWorkerUrl, { scope: mapContainer.dataset.networkScope })
+            .catch(err => console.warn('Route network service worker not registered:', err));
+    }
+
+    async function loadNetwork() {
+        if (navigator.serviceWorker?.controller) {
+            // The service worker answers network/ from its copy, synced when online
+            try {
+                const res = await fetch(new URL('./', new URL(networkWorkerUrl, window.location)));
+                if (res.ok) return (await res.json()).routes;
+            } catch { /* sync directly below */ }
+        }
+        return NetworkSync.load(mapContainer.dataset.changesUrl);
+    }
+
+    window.addEventListener('message', async (event) => {
+        if (event.data?.type !== 'MAP_READY' || !networkRouteIds) return;
+        try {
+            const order = new Map(networkRouteIds.map((id, index) => [id, index]));
+            const routes = (await loadNetwork())
+                .filter(route => order.has(route.id) && route.path)
+                .sort((a, b) => order.get(a.id) - order.get(b.id))
+                .map(route => ({ label: route.label, path: NetworkSync.decodePolyline(route.path) }));
+            event.source.postMessage({ type: 'SHOW_ROUTES', routes }, '*');
+        } catch (err) {
+            console.warn('Could not load the route network:', err);
+        }
+    });
+    // In case the map was ready before this listener
+    if (networkRouteIds) $('#map-container iframe')?.contentWindow?.postMessage({ type: 'MAP_READY?' }, '*');
+
+    // === Load More Saved Routes ===
+    const savedList = $('#savedList');
+    const loadMoreSavedBtn = $('#loadMoreSavedBtn');
+
+    const savedRouteIcon = (route) => {
+        if (route.transport_type === 'Jeepney' && route.code) return ['fa-bus', route.code];
+        if (route.transport_type === 'Taxi') return ['fa-car', 'Taxi'];
+        if (route.transport_type === 'Motorcycle') return ['fa-motorcycle', 'Motorcycle'];
+        return ['fa-bus', route.transport_type];
+    };
+
+    const renderSavedRoute = (route) => {
+        const [icon, label] = savedRouteIcon(route);
+        const li = document.createElement('li');
+        li.className = 'saved-route-item';
+        li.innerHTML = `
+            <div class="saved-route-info">
+              <strong><i class="fa-solid ${icon}"></i> </strong>
+              <p style="margin: 3px 0; font-size: 12px;"></p>
+              <p style="margin: 0; font-size: 11px; color: #4CAF50;"></p>
+            </div>
+            <div class="saved-route-actions">
+              <button type="button" class="btn-icon use-saved-route" title="Use this route">
+                <i class="fa-solid fa-arrow-right"></i>
+              </button>
+              <button type="button" class="btn-icon delete-saved-route" title="Delete">
+                <i class="fa-solid fa-trash"></i>
+              </button>
+            </div>`;
+        // Text is set separately so user-entered places are never parsed as HTML
+        li.querySelector('strong').append(label || '');
+        li.querySelectorAll('p')[0].textContent = `${route.origin} → ${route.destination}`;
+        li.querySelectorAll('p')[1].textContent = `Php ${parseFloat(route.fare || 0).toFixed(2)}`;
+        Object.assign(li.querySelector('.use-saved-route').dataset, {
+            savedId: route.id,
+            origin: route.origin,
+            destination: route.destination,
+            originLat: route.origin_latitude ?? '',
+            originLon: route.origin_longitude ?? '',
+            destLat: route.destination_latitude ?? '',
+            destLon: route.destination_longitude ?? '',
+            transport: route.transport_type,
+            code: route.code ?? ''
+        });
+        li.querySelector('.delete-saved-route').dataset.savedId = route.id;
+        if (route.thumbnail_key && savedList.dataset.thumbnailUrl) {
+            const thumb = document.createElement('img');
+            Object.assign(thumb, {
+                className: 'route-thumb route-thumb-small', alt: '', loading: 'lazy',
+                src: savedList.dataset.thumbnailUrl.replace('KEY', route.thumbnail_key),
+            });
+            li.prepend(thumb);
+        }
+        return li;
+    };
+
+    // === Use a Saved Route (usage is buffered server-side, see usage.py) ===
+    let activeSavedId = null;
+
+    const recordUsage = (savedId, event) => {
+        const url = savedList?.dataset.usageUrl;
+        if (!url || !savedId) return;
+        const body = new FormData();
+        body.append('saved_id', savedId);
+        body.append('event', event);
+        body.append('csrfmiddlewaretoken', csrftoken || '');
+        // A beacon still goes out when the click navigates away
+        if (!navigator.sendBeacon?.(url, body)) fetch(url, { method: 'POST', body, keepalive: true }).catch(() => {});
+    };
+
+    savedList?.addEventListener('click', (e) => {
+        const btn = e.target.closest('.use-saved-route');
+        if (!btn) return;
+        const d = btn.dataset;
+        originInput.value = d.origin || '';
+        destinationInput.value = d.destination || '';
+        originLat.value = d.originLat || '';
+        originLon.value = d.originLon || '';
+        destLat.value = d.destLat || '';
+        destLon.value = d.destLon || '';
+        if (transportSelect && d.transport) transportSelect.value = d.transport;
+        if (codeInput) codeInput.value = d.code || '';
+        toggleNavigateButton();
+        activeSavedId = d.savedId;
+        recordUsage(activeSavedId, 'open');
+    });
+
+    navigateBtn?.addEventListener('click', () => {
+        if (activeSavedId && originLat.value && destLat.value) recordUsage(activeSavedId, 'navigate');
+    });
+
+    loadMoreSavedBtn?.addEventListener('click', async () => {
+        loadMoreSavedBtn.disabled = true;
+        try {
+            const res = await fetch(`${loadMoreSavedBtn.dataset.url}?${qs({ cursor: loadMoreSavedBtn.dataset.cursor })}`);
+            const data = await res.json();
+            data.routes.forEach(route => savedList.appendChild(renderSavedRoute(route)));
+            if (data.next_cursor) {
+                loadMoreSavedBtn.dataset.cursor = data.next_cursor;
+                loadMoreSavedBtn.disabled = false;
+            } else {
+                loadMoreSavedBtn.remove();
+            }
+        } catch {
+            loadMoreSavedBtn.disabled = false;
+            alertMsg('Could not load more saved routes.');
+        }
+    });
 });
\ No newline at end of file
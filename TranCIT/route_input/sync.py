@@ -0,0 +1,206 @@
+# --- START OF FILE: route_input/sync.py ---
+
+"""
+Versioned delta sync of the route network for the dashboard's offline copy.
+
+Every Route save/delete appends a RouteChange row (signals.py); its id is the
+network version. A client that holds version N asks for the changes since N and
+gets, per route changed since, its latest state only:
+
+    {"version": V, "reset": false, "more": false, "cursor": null,
+     "upserts": [[id, transport_type, code, label, encoded_path], ...],
+     "deletes": [id, ...]}
+
+Ids only work as versions if they become visible in order: on PostgreSQL a
+transaction that took id 7 can commit after one that took id 8, and a client
+that already synced to 8 would never see 7. So log_changes() locks the
+RouteChangeLock row before taking ids and holds it until its transaction
+commits; writers of the log queue there, and only there.
+
+Paths are Google encoded polylines (precision 5, ~1 m), several times smaller
+than the JSON coordinates. When N is 0, newer than the log (the database was
+reset) or older than the oldest logged change, the answer is a reset instead:
+every route, paged by id with `cursor`, all pages pinned to the version the
+reset started at (`as_of`), after which the client continues with deltas.
+
+The log is pruned by `manage.py prune_route_changes` (prune_log): rows older
+than ROUTE_CHANGE_RETENTION_DAYS go, except the newest ROUTE_CHANGE_KEEP, and
+clients that were further behind get a reset.
+
+Every page is immutable for a given (since, cursor, as_of, current version), so
+pages are cached and served with a matching ETag.
+"""
+
+from datetime import timedelta
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from .caching import SYNC_PAGES
+from .models import Route, RouteChange, RouteChangeLock
+from .network import route_paths
+
+logger = logging.getLogger(__name__)
+
+SYNC_PAGE_SIZE = getattr(settings, 'SYNC_PAGE_SIZE', 200)
+ROUTE_CHANGE_RETENTION_DAYS = getattr(settings, 'ROUTE_CHANGE_RETENTION_DAYS', 30)
+ROUTE_CHANGE_KEEP = getattr(settings, 'ROUTE_CHANGE_KEEP', 1000)  # newest rows kept whatever their age
+POLYLINE_PRECISION = 5
+
+# Route fields that end up in a sync payload; saves touching none of them are not logged
+SYNCED_FIELDS = frozenset({'transport_type', 'code', 'origin', 'destination', 'display_label', 'route_path_coords'})
+
+
+# -----------------------------
+# Encoded polylines
+# -----------------------------
+
+def encode_polyline(points, precision=POLYLINE_PRECISION):
+    """Google encoded polyline of [[lat, lon], ...]."""
+    values = np.round(np.asarray(points, dtype=np.float64).reshape(-1, 2) * 10 ** precision).astype(np.int64)
+    if not len(values):
+        return ''
+    chars = []
+    for value in np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel().tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return ''.join(chars)
+
+
+def decode_polyline(encoded, precision=POLYLINE_PRECISION):
+    """[[lat, lon], ...] from a Google encoded polyline."""
+    values, value, shift = [], 0, 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    points = np.cumsum(np.asarray(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+    return points.round(precision).tolist()
+
+
+# -----------------------------
+# Change log
+# -----------------------------
+
+def log_changes(route_ids, deleted=False):
+    """Append to the log, holding the lock row until the caller's transaction commits."""
+    if not route_ids:
+        return
+    with transaction.atomic(savepoint=False):
+        RouteChangeLock.objects.select_for_update().get_or_create(pk=1)
+        RouteChange.objects.bulk_create([RouteChange(route_id=pk, deleted=deleted) for pk in route_ids])
+
+
+def log_state():
+    """(current version, oldest logged version); (0, 0) when nothing was logged yet."""
+    stats = RouteChange.objects.aggregate(current=models.Max('id'), oldest=models.Min('id'))
+    return stats['current'] or 0, stats['oldest'] or 0
+
+
+def prune_log(days=None, keep=None, batch_size=1000):
+    """
+    Delete log rows older than `days` except the newest `keep` (at least one, so the
+    current version survives); returns how many rows went.
+    """
+    days = ROUTE_CHANGE_RETENTION_DAYS if days is None else days
+    keep = max(1, ROUTE_CHANGE_KEEP if keep is None else keep)
+    newest = list(RouteChange.objects.order_by('-id').values_list('id', flat=True)[keep - 1:keep])
+    if not newest:
+        return 0
+    recent = RouteChange.objects.filter(changed_at__gte=timezone.now() - timedelta(days=days)).aggregate(
+        first=models.Min('id'))['first']
+    # The first row kept: the keep-th newest, or the first within the retention window if that is older
+    boundary = newest[0] if recent is None else min(newest[0], recent)
+    deleted = 0
+    while True:
+        ids = list(RouteChange.objects.filter(id__lt=boundary).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += RouteChange.objects.filter(id__in=ids).delete()[0]
+
+
+def needs_reset(since, current, oldest):
+    return since <= 0 or since > current or since < oldest - 1
+
+
+def _upserts(routes):
+    paths = route_paths(routes)
+    return [[route.id, route.transport_type, route.code or '', str(route), encode_polyline(paths[route.id])]
+            for route in routes]
+
+
+def _routes(ids=None, after=None, limit=None):
+    routes = Route.objects.order_by('id').only(
+        'id', 'transport_type', 'code', 'origin', 'destination', 'display_label', 'updated_at', 'route_path_coords')
+    if ids is not None:
+        routes = routes.filter(pk__in=ids)
+    if after is not None:
+        routes = routes.filter(pk__gt=after)
+    return list(routes[:limit] if limit else routes)
+
+
+def changes_since(since, current, limit=SYNC_PAGE_SIZE):
+    """The changes after version `since`, at most `limit` log rows per page."""
+    rows = list(RouteChange.objects.filter(id__gt=since, id__lte=current).order_by('id')
+                .values_list('id', 'route_id', 'deleted')[:limit + 1])
+    more = len(rows) > limit
+    rows = rows[:limit]
+    latest = {}
+    for _, route_id, deleted in rows:
+        latest[route_id] = deleted
+    saved = [pk for pk, deleted in latest.items() if not deleted]
+    routes = _routes(ids=saved) if saved else []
+    found = {route.id for route in routes}
+    return {
+        'version': rows[-1][0] if rows else max(since, 0),
+        'reset': False,
+        'more': more,
+        'cursor': None,
+        'upserts': _upserts(routes),
+        # Routes saved in this page but gone since are deletes too
+        'deletes': sorted(pk for pk in latest if pk not in found),
+    }
+
+
+def snapshot_page(as_of, current, cursor=0, limit=SYNC_PAGE_SIZE):
+    """One page of a reset: routes with id > cursor, pinned to version as_of."""
+    routes = _routes(after=cursor, limit=limit + 1)
+    last_page = len(routes) <= limit
+    routes = routes[:limit]
+    return {
+        'version': as_of,
+        'reset': True,
+        # After the last page the client continues with the deltas since as_of
+        'more': not last_page or current > as_of,
+        'cursor': None if last_page else routes[-1].id,
+        'upserts': _upserts(routes),
+        'deletes': [],
+    }
+
+
+def page(since, cursor=None, as_of=None, state=None):
+    """The sync page for a request; cached, since it never changes for the same arguments and log state."""
+    current, oldest = state or log_state()
+    if cursor is None and needs_reset(since, current, oldest):
+        cursor, as_of = 0, current
+    key = f"{current}:{since}:{cursor}:{as_of}:{SYNC_PAGE_SIZE}"
+    data = SYNC_PAGES.get(key)
+    if data is None:
+        if cursor is None:
+            data = changes_since(since, current, SYNC_PAGE_SIZE)
+        else:
+            as_of = min(as_of if as_of is not None else current, current)
+            data = snapshot_page(as_of, current, cursor, SYNC_PAGE_SIZE)
+        data = SYNC_PAGES.set(key, data)
+    return data
+
+# --- END OF FILE: route_input/sync.py ---
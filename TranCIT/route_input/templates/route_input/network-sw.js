@@ -0,0 +1,37 @@
+{% load static %}// Service worker of the dashboard (views.route_network_worker). Answers the
+// dashboard's requests for network/ with every route in the IndexedDB copy,
+// brought up to date first when the server answers within the timeout, so
+// repeat visits only download what changed and offline visits still work.
+importScripts('{% static "route_input/js/network-sync.js" %}');
+
+const CHANGES_URL = '{{ changes_url|escapejs }}';
+const SYNC_TIMEOUT_MS = {{ sync_timeout_ms }};
+const NETWORK_PATH = new URL('./', self.location).pathname;
+
+self.addEventListener('install', () => self.skipWaiting());
+self.addEventListener('activate', (event) => event.waitUntil(self.clients.claim()));
+
+async function networkResponse() {
+    const store = await NetworkSync.openStore();
+    const controller = new AbortController();
+    const timer = setTimeout(() => controller.abort(), SYNC_TIMEOUT_MS);
+    let offline = false;
+    try {
+        await NetworkSync.sync(CHANGES_URL, { signal: controller.signal, store });
+    } catch (err) {
+        // Slow or no connection: serve the copy we have
+        offline = true;
+    } finally {
+        clearTimeout(timer);
+    }
+    return new Response(JSON.stringify({ routes: await store.all(), offline }), {
+        headers: { 'Content-Type': 'application/json', 'Cache-Control': 'no-store' },
+    });
+}
+
+self.addEventListener('fetch', (event) => {
+    const url = new URL(event.request.url);
+    if (event.request.method === 'GET' && url.origin === self.location.origin && url.pathname === NETWORK_PATH) {
+        event.respondWith(networkResponse());
+    }
+});
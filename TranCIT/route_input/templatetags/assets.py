@@ -0,0 +1,20 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+from route_input.assets import bundle_sources
+
+register = template.Library()
+
+
+@register.simple_tag
+def bundle(name):
+    """
+    <link>/<script> tags for a bundle from route_input.assets.BUNDLES, e.g.
+    {% bundle 'dashboard.css' %}. Falls back to the source files until
+    `manage.py build_assets` has been run.
+    """
+    paths = [(static(path),) for path in bundle_sources(name)]
+    if name.endswith('.css'):
+        return format_html_join('\n', '<link rel="stylesheet" href="{}">', paths)
+    return format_html_join('\n', '<script src="{}"></script>', paths)
@@ -0,0 +1,81 @@
+# --- START OF FILE: route_input/testing.py ---
+
+"""
+Per-endpoint performance budgets for the test suite.
+
+measure() runs one request and records its SQL queries, wall time and peak
+Python allocation (tracemalloc). Wall time and memory come from separate runs,
+because tracemalloc itself slows the code it traces down several times.
+
+BudgetAssertionsMixin.assertWithinBudget() fails a test when a measurement
+exceeds its Budget and prints the captured queries, so an N+1 regression shows
+up as a failing test with the offending SQL in the output. Query counts and
+memory are checked on every run; wall time depends on the machine, so it is
+only checked with BUDGET_ENFORCE_TIMING=1 (e.g. on a dedicated benchmark
+runner). Every measurement is logged at INFO level on this module's logger.
+"""
+
+from collections import namedtuple
+import logging
+import os
+import time
+import tracemalloc
+
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+
+logger = logging.getLogger(__name__)
+
+ENFORCE_TIMING = os.getenv('BUDGET_ENFORCE_TIMING', '0') == '1'
+
+# queries: max SQL queries; ms: max wall time; kib: max peak Python allocation
+Budget = namedtuple('Budget', 'queries ms kib')
+
+Measurement = namedtuple('Measurement', 'queries ms kib response captured')
+
+
+def measure(make_request, setup=None):
+    """
+    Call `make_request()` (which performs one request and returns the response)
+    twice: once for queries and wall time, once under tracemalloc for memory.
+    `setup()`, if given, runs unmeasured before each call.
+    """
+    if setup:
+        setup()
+    # Every request clears queries_log (request_started -> reset_queries), which
+    # would leave CaptureQueriesContext slicing from a stale offset.
+    reset_queries()
+    with CaptureQueriesContext(connection) as captured:
+        started = time.perf_counter()
+        response = make_request()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+    # captured_queries reads queries_log lazily; copy it before the next request clears it
+    queries = [q['sql'] for q in captured.captured_queries]
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        make_request()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return Measurement(len(queries), elapsed_ms, peak / 1024, response, queries)
+
+
+class BudgetAssertionsMixin:
+    def assertWithinBudget(self, name, measurement, budget):
+        logger.info("%s: %s queries, %.1f ms, %.0f KiB", name, measurement.queries, measurement.ms, measurement.kib)
+        problems = []
+        if measurement.queries > budget.queries:
+            problems.append(f"{measurement.queries} queries (budget {budget.queries})")
+        if ENFORCE_TIMING and measurement.ms > budget.ms:
+            problems.append(f"{measurement.ms:.0f} ms (budget {budget.ms})")
+        if measurement.kib > budget.kib:
+            problems.append(f"{measurement.kib:.0f} KiB peak (budget {budget.kib})")
+        if problems:
+            queries = '\n'.join(f"  {i}. {sql}" for i, sql in enumerate(measurement.captured, 1))
+            self.fail(f"{name} over budget: {', '.join(problems)}\nQueries:\n{queries}")
+
+# --- END OF FILE: route_input/testing.py ---
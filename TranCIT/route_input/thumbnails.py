@@ -0,0 +1,310 @@
+# --- START OF FILE: route_input/thumbnails.py ---
+
+"""
+Small static previews of route paths for the dashboard sidebars, without a
+folium map per route.
+
+A path's thumbnail key is a hash of its geometry (rounded to ~1 m), stored on
+Route.thumbnail_key by Route.save() and copied to the SavedRoutes made from it.
+Files are content-addressed, THUMBNAIL_DIR/<width>x<height>/<key[:2]>/<key>.<fmt>,
+so the URL of a thumbnail (/routes/thumbs/<key>.svg) never changes meaning and
+is served with a year-long immutable Cache-Control. A route whose path changes
+gets a new key; unchanged paths are never rendered twice.
+
+Rendering is NumPy only: project to a local equirectangular plane, fit the box,
+simplify (Douglas-Peucker, THUMBNAIL_TOLERANCE pixels), then write an SVG path
+or rasterise the polyline into an RGBA PNG. After a route is saved its
+thumbnails are rendered on a background thread (THUMBNAIL_AUTO_RENDER), with at
+most THUMBNAIL_QUEUE_MAX routes waiting; a missing file is also rendered on its
+first request, and `manage.py render_thumbnails` backfills keys and files (bulk
+renders belong there) and prunes unused ones.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import hashlib
+import logging
+import math
+import os
+import struct
+import tempfile
+import threading
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = getattr(settings, 'THUMBNAIL_SIZE', (120, 72))  # width, height in pixels
+THUMBNAIL_PADDING = getattr(settings, 'THUMBNAIL_PADDING', 8)
+THUMBNAIL_TOLERANCE = getattr(settings, 'THUMBNAIL_TOLERANCE', 0.75)  # pixels
+# Rendered after a save; other formats only on request
+THUMBNAIL_FORMATS = getattr(settings, 'THUMBNAIL_FORMATS', ('svg',))
+THUMBNAIL_BROWSER_MAX_AGE = getattr(settings, 'THUMBNAIL_BROWSER_MAX_AGE', 365 * 24 * 60 * 60)
+THUMBNAIL_QUEUE_MAX = getattr(settings, 'THUMBNAIL_QUEUE_MAX', 200)  # routes waiting for the background thread
+
+FORMATS = {'svg': 'image/svg+xml', 'png': 'image/png'}
+BACKGROUND = (244, 246, 248)
+STROKE = (123, 31, 162)  # the map's route purple
+STROKE_WIDTH = 3
+ORIGIN_COLOR = (33, 150, 243)
+DESTINATION_COLOR = (244, 67, 54)
+ENDPOINT_RADIUS = 3.5
+KEY_PRECISION = 5  # decimal places of lat/lon hashed into the key
+
+
+def thumbnail_dir():
+    return Path(getattr(settings, 'THUMBNAIL_DIR', None) or Path(settings.BASE_DIR) / 'var' / 'thumbnails')
+
+
+def _points(path):
+    points = np.asarray(path, dtype=np.float64)
+    return points.reshape(-1, 2) if points.size else np.empty((0, 2))
+
+
+def geometry_key(path):
+    """Content hash of a [[lat, lon], ...] path; '' when there is nothing to draw."""
+    points = _points(path)
+    if len(points) < 2:
+        return ''
+    rounded = np.round(points * 10 ** KEY_PRECISION).astype('<i4')
+    return hashlib.blake2b(rounded.tobytes(), digest_size=10).hexdigest()
+
+
+def valid_key(key):
+    return len(key) == 20 and all(c in '0123456789abcdef' for c in key)
+
+
+def thumbnail_path(key, fmt, size=None):
+    width, height = size or THUMBNAIL_SIZE
+    return thumbnail_dir() / f"{width}x{height}" / key[:2] / f"{key}.{fmt}"
+
+
+# -----------------------------
+# Geometry
+# -----------------------------
+
+def project(path, size=None, padding=THUMBNAIL_PADDING):
+    """Pixel coordinates (x right, y down) of a path, fitted and centred in the box."""
+    width, height = size or THUMBNAIL_SIZE
+    points = _points(path)
+    xy = np.column_stack([points[:, 1] * math.cos(math.radians(points[:, 0].mean())), -points[:, 0]])
+    low, span = xy.min(axis=0), np.ptp(xy, axis=0)
+    room = np.array([width - 2 * padding, height - 2 * padding], dtype=np.float64)
+    scale = np.min(np.where(span > 0, room / np.where(span > 0, span, 1), np.inf))
+    if not np.isfinite(scale):
+        scale = 0.0  # a single repeated point
+    return (xy - low) * scale + (np.array([width, height]) - span * scale) / 2
+
+
+def simplify(xy, tolerance=THUMBNAIL_TOLERANCE):
+    """Douglas-Peucker: the points within `tolerance` of the kept polyline are dropped."""
+    if len(xy) < 3:
+        return xy
+    keep = np.zeros(len(xy), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(xy) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = xy[first], xy[last]
+        inner = xy[first + 1:last]
+        chord = end - start
+        length = np.hypot(*chord)
+        if length == 0:
+            distances = np.hypot(*(inner - start).T)
+        else:
+            distances = np.abs(chord[0] * (inner[:, 1] - start[1]) - chord[1] * (inner[:, 0] - start[0])) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.extend([(first, split), (split, last)])
+    return xy[keep]
+
+
+def _thumbnail_points(path, size):
+    return simplify(project(path, size))
+
+
+# -----------------------------
+# Rendering
+# -----------------------------
+
+def _hex(rgb):
+    return '#%02x%02x%02x' % rgb
+
+
+def render_svg(path, size=None):
+    width, height = size or THUMBNAIL_SIZE
+    xy = np.round(_thumbnail_points(path, size), 1)
+    coords = ' '.join(f"{x:g},{y:g}" for x, y in xy.tolist())
+    (x0, y0), (x1, y1) = xy[0].tolist(), xy[-1].tolist()
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">'
+        f'<rect width="{width}" height="{height}" rx="6" fill="{_hex(BACKGROUND)}"/>'
+        f'<polyline points="{coords}" fill="none" stroke="{_hex(STROKE)}" stroke-width="{STROKE_WIDTH}" '
+        f'stroke-linecap="round" stroke-linejoin="round"/>'
+        f'<circle cx="{x0:g}" cy="{y0:g}" r="{ENDPOINT_RADIUS}" fill="{_hex(ORIGIN_COLOR)}"/>'
+        f'<circle cx="{x1:g}" cy="{y1:g}" r="{ENDPOINT_RADIUS}" fill="{_hex(DESTINATION_COLOR)}"/>'
+        '</svg>'
+    ).encode('utf-8')
+
+
+def _disc(radius):
+    r = int(math.ceil(radius))
+    dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+    inside = dx ** 2 + dy ** 2 <= radius ** 2
+    return np.column_stack([dx[inside], dy[inside]])
+
+
+def _stamp(canvas, centres, radius, rgb):
+    """Paint a disc of `radius` around every (x, y) centre."""
+    height, width = canvas.shape[:2]
+    pixels = (np.round(centres).astype(np.int64)[:, None, :] + _disc(radius)[None, :, :]).reshape(-1, 2)
+    inside = (pixels[:, 0] >= 0) & (pixels[:, 0] < width) & (pixels[:, 1] >= 0) & (pixels[:, 1] < height)
+    pixels = pixels[inside]
+    canvas[pixels[:, 1], pixels[:, 0], :3] = rgb
+    canvas[pixels[:, 1], pixels[:, 0], 3] = 255
+
+
+def _png(canvas):
+    """PNG bytes of an (height, width, 4) uint8 RGBA array."""
+    height, width = canvas.shape[:2]
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), canvas.reshape(height, -1)], axis=1)
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw.tobytes(), 9))
+            + chunk(b'IEND', b''))
+
+
+def render_png(path, size=None):
+    width, height = size or THUMBNAIL_SIZE
+    xy = _thumbnail_points(path, size)
+    canvas = np.empty((height, width, 4), dtype=np.uint8)
+    canvas[:, :] = (*BACKGROUND, 255)
+    # Samples every half pixel along each segment, each stamped with the stroke disc
+    segments = np.diff(xy, axis=0)
+    steps = np.maximum(np.ceil(np.hypot(*segments.T) * 2).astype(np.int64), 1)
+    starts = np.repeat(xy[:-1], steps, axis=0)
+    fractions = np.concatenate([np.arange(n) / n for n in steps.tolist()])[:, None]
+    samples = np.vstack([starts + np.repeat(segments, steps, axis=0) * fractions, xy[-1:]])
+    _stamp(canvas, samples, STROKE_WIDTH / 2, STROKE)
+    _stamp(canvas, xy[:1], ENDPOINT_RADIUS, ORIGIN_COLOR)
+    _stamp(canvas, xy[-1:], ENDPOINT_RADIUS, DESTINATION_COLOR)
+    return _png(canvas)
+
+
+RENDERERS = {'svg': render_svg, 'png': render_png}
+
+
+# -----------------------------
+# Storage
+# -----------------------------
+
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def ensure_thumbnail(key, path, fmt='svg'):
+    """The file of the thumbnail, rendered from `path` unless it already exists."""
+    file_path = thumbnail_path(key, fmt)
+    if not file_path.exists():
+        _write_atomic(file_path, RENDERERS[fmt](path))
+    return file_path
+
+
+def render_routes(route_ids, formats=None):
+    """Render the missing thumbnails of these routes and point their SavedRoutes at the current key."""
+    from . import saved_routes
+    from .models import Route, SavedRoute
+    rendered = 0
+    for route in Route.objects.filter(pk__in=route_ids).only('id', 'route_path_coords', 'thumbnail_key'):
+        if not route.thumbnail_key:
+            continue
+        for fmt in formats or THUMBNAIL_FORMATS:
+            if not thumbnail_path(route.thumbnail_key, fmt).exists():
+                ensure_thumbnail(route.thumbnail_key, route.get_path_coords(), fmt)
+                rendered += 1
+        stale = SavedRoute.objects.filter(original_route_id=route.pk).exclude(thumbnail_key=route.thumbnail_key)
+        owners = set(stale.values_list('user_id', 'session_key_hash'))
+        if owners:
+            stale.update(thumbnail_key=route.thumbnail_key)
+            for user_id, owner_hash in owners:
+                saved_routes.forget_owner(user_id, owner_hash)
+    return rendered
+
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnails')
+_queue_lock = threading.Lock()
+_queued = 0  # routes submitted to _executor and not rendered yet
+
+
+def _render_in_background(route_ids):
+    global _queued
+    try:
+        render_routes(route_ids)
+    except Exception:
+        # The view renders a missing thumbnail on its first request instead
+        logger.exception("Rendering thumbnails of routes %s failed", route_ids)
+    finally:
+        with _queue_lock:
+            _queued -= len(route_ids)
+        close_old_connections()
+
+
+def schedule(route_ids):
+    """
+    Render these routes' thumbnails on the background thread; returns False, and
+    leaves them to their first request or render_thumbnails, when that would put
+    more than THUMBNAIL_QUEUE_MAX routes in the queue.
+    """
+    global _queued
+    route_ids = list(route_ids)
+    with _queue_lock:
+        if _queued + len(route_ids) > THUMBNAIL_QUEUE_MAX:
+            logger.warning("Thumbnail queue full; not rendering routes %s in the background", route_ids)
+            return False
+        _queued += len(route_ids)
+    try:
+        _executor.submit(_render_in_background, route_ids)
+    except RuntimeError:  # shutting down
+        with _queue_lock:
+            _queued -= len(route_ids)
+        return False
+    return True
+
+
+def thumbnail_for_key(key, fmt):
+    """File of a thumbnail, rendered on demand from a route with this key; None if no route has it."""
+    file_path = thumbnail_path(key, fmt)
+    if file_path.exists():
+        return file_path
+    from .models import Route
+    route = Route.objects.filter(thumbnail_key=key).only('id', 'route_path_coords').first()
+    if route is None:
+        return None
+    return ensure_thumbnail(key, route.get_path_coords(), fmt)
+
+
+def prune(keep_keys):
+    """Delete thumbnail files whose key is not in keep_keys; returns how many were removed."""
+    removed = 0
+    for file_path in thumbnail_dir().glob('*/*/*.*'):
+        if file_path.stem not in keep_keys:
+            file_path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+# --- END OF FILE: route_input/thumbnails.py ---
@@ -0,0 +1,227 @@
+# --- START OF FILE: route_input/tiles.py ---
+
+"""
+Caching proxy for the map's OpenStreetMap raster tiles.
+
+Browsers ask us (/routes/tiles/<z>/<x>/<y>.png) instead of tile.openstreetmap.org.
+A tile is served from, in order:
+1. TILE_MBTILES, an optional read-only MBTiles file (e.g. a pre-rendered Cebu extract),
+2. the on-disk cache, TILE_CACHE_DIR/<z>/<x>/<y>.png, sharded by zoom and column,
+3. the upstream tile server, storing the result in the on-disk cache.
+
+Upstream is only asked for tiles that touch TILE_FETCH_BBOX (Metro Cebu by default);
+the view redirects anything else straight to the tile server, so we are not an
+open proxy. Cached tiles older than TILE_REFRESH_AFTER are revalidated upstream
+with the ETag it gave us, and served stale if that fails.
+
+`manage.py seed_tiles <file.mbtiles>` fills the cache for a bbox and zoom range
+from a local MBTiles file, so a fresh deploy does not hit the tile server at all.
+"""
+
+from collections import namedtuple
+from pathlib import Path
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.urls import reverse
+import requests
+
+from .upstream import UpstreamUnavailable, call_upstream, tile_breaker
+
+logger = logging.getLogger(__name__)
+
+TILE_UPSTREAM_URL = getattr(settings, 'TILE_UPSTREAM_URL', 'https://tile.openstreetmap.org/{z}/{x}/{y}.png')
+TILE_ATTRIBUTION = getattr(settings, 'TILE_ATTRIBUTION',
+                           '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors')
+TILE_USER_AGENT = getattr(settings, 'TILE_USER_AGENT', 'TranCIT tile cache (https://trancit.onrender.com)')
+# (west, south, east, north) in degrees; Metro Cebu with some margin
+CEBU_BBOX = (123.70, 10.15, 124.10, 10.50)
+TILE_FETCH_BBOX = getattr(settings, 'TILE_FETCH_BBOX', CEBU_BBOX)
+TILE_SEED_ZOOMS = range(12, 18)
+TILE_MAX_ZOOM = getattr(settings, 'TILE_MAX_ZOOM', 19)
+TILE_FETCH_TIMEOUT = getattr(settings, 'TILE_FETCH_TIMEOUT', 5)
+TILE_BROWSER_MAX_AGE = getattr(settings, 'TILE_BROWSER_MAX_AGE', 7 * 24 * 60 * 60)  # 7 days
+TILE_REFRESH_AFTER = getattr(settings, 'TILE_REFRESH_AFTER', 30 * 24 * 60 * 60)  # 30 days
+
+Tile = namedtuple('Tile', 'data etag source')
+
+
+def tile_cache_dir():
+    return Path(getattr(settings, 'TILE_CACHE_DIR', None) or Path(settings.BASE_DIR) / 'var' / 'tiles')
+
+
+def tile_url_template():
+    """Leaflet URL template for folium.Map(tiles=...)."""
+    return reverse('map_tile', args=[0, 0, 0]).replace('/0/0/0.png', '/{z}/{x}/{y}.png')
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= TILE_MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tile_for(lat, lon, z):
+    """Web Mercator (slippy map) tile containing lat/lon at zoom z."""
+    n = 2 ** z
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_range(bbox, z):
+    """(x_min, x_max, y_min, y_max), inclusive, of the tiles covering bbox at zoom z."""
+    west, south, east, north = bbox
+    x_min, y_min = tile_for(north, west, z)
+    x_max, y_max = tile_for(south, east, z)
+    return x_min, x_max, y_min, y_max
+
+
+def in_bbox(z, x, y, bbox=None):
+    x_min, x_max, y_min, y_max = tile_range(bbox or TILE_FETCH_BBOX, z)
+    return x_min <= x <= x_max and y_min <= y <= y_max
+
+
+def upstream_url(z, x, y):
+    return TILE_UPSTREAM_URL.format(z=z, x=x, y=y)
+
+
+def _etag(data):
+    return f'"{hashlib.sha1(data).hexdigest()[:20]}"'
+
+
+# -----------------------------
+# MBTiles (read-only)
+# -----------------------------
+
+_mbtiles = threading.local()
+
+
+def _mbtiles_connection(path):
+    connection = getattr(_mbtiles, 'connection', None)
+    if connection is None or _mbtiles.path != path:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        _mbtiles.connection, _mbtiles.path = connection, path
+    return connection
+
+
+def mbtiles_tile(path, z, x, y):
+    # MBTiles rows are TMS: y counts from the south
+    row = _mbtiles_connection(path).execute(
+        "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+        (z, x, 2 ** z - 1 - y),
+    ).fetchone()
+    return bytes(row[0]) if row else None
+
+
+def iter_mbtiles(path, bbox, zooms):
+    """(z, x, y, data) for every tile of an MBTiles file inside bbox at the given zooms."""
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        for z in zooms:
+            x_min, x_max, y_min, y_max = tile_range(bbox, z)
+            rows = connection.execute(
+                "SELECT tile_column, tile_row, tile_data FROM tiles "
+                "WHERE zoom_level = ? AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ?",
+                (z, x_min, x_max, 2 ** z - 1 - y_max, 2 ** z - 1 - y_min),
+            )
+            for x, tms_row, data in rows:
+                yield z, x, 2 ** z - 1 - tms_row, bytes(data)
+    finally:
+        connection.close()
+
+
+# -----------------------------
+# On-disk cache
+# -----------------------------
+
+def tile_path(z, x, y):
+    return tile_cache_dir() / str(z) / str(x) / f"{y}.png"
+
+
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def store_tile(z, x, y, data, upstream_etag=None):
+    path = tile_path(z, x, y)
+    _write_atomic(path, data)
+    etag_path = path.with_suffix('.etag')
+    if upstream_etag:
+        _write_atomic(etag_path, upstream_etag.encode('ascii', 'ignore'))
+    else:
+        etag_path.unlink(missing_ok=True)
+
+
+def _fetch(z, x, y, upstream_etag=None):
+    """(status, data, etag) from the tile server; status 304 means our copy is still current."""
+    headers = {'User-Agent': TILE_USER_AGENT}
+    if upstream_etag:
+        headers['If-None-Match'] = upstream_etag
+
+    def get(timeout):
+        response = requests.get(upstream_url(z, x, y), headers=headers, timeout=timeout)
+        if response.status_code not in (200, 304):
+            response.raise_for_status()
+        return response
+
+    response = call_upstream(tile_breaker, get, timeout_cap=TILE_FETCH_TIMEOUT,
+                             failures=(requests.RequestException,))
+    return response.status_code, response.content, response.headers.get('ETag')
+
+
+def _revalidate(z, x, y, path, data):
+    etag_path = path.with_suffix('.etag')
+    upstream_etag = etag_path.read_text() if etag_path.exists() else None
+    try:
+        status, fresh, new_etag = _fetch(z, x, y, upstream_etag)
+    except (UpstreamUnavailable, requests.RequestException) as e:
+        logger.info("Serving stale tile %s/%s/%s: %s", z, x, y, e)
+        return data
+    if status == 304:
+        os.utime(path)
+        return data
+    store_tile(z, x, y, fresh, new_etag)
+    return fresh
+
+
+def get_tile(z, x, y):
+    """
+    Tile(data, etag, source) for z/x/y, or None when it has to come from upstream
+    but lies outside TILE_FETCH_BBOX. Raises UpstreamUnavailable / RequestException
+    when upstream is needed and fails.
+    """
+    mbtiles = getattr(settings, 'TILE_MBTILES', None)
+    if mbtiles:
+        data = mbtiles_tile(mbtiles, z, x, y)
+        if data:
+            return Tile(data, _etag(data), 'mbtiles')
+
+    path = tile_path(z, x, y)
+    try:
+        data = path.read_bytes()
+        age = time.time() - path.stat().st_mtime
+    except FileNotFoundError:
+        data = None
+    if data is not None:
+        if age > TILE_REFRESH_AFTER:
+            data = _revalidate(z, x, y, path, data)
+        return Tile(data, _etag(data), 'cache')
+
+    if not in_bbox(z, x, y):
+        return None
+    status, data, upstream_etag = _fetch(z, x, y)
+    store_tile(z, x, y, data, upstream_etag)
+    return Tile(data, _etag(data), 'upstream')
+
+# --- END OF FILE: route_input/tiles.py ---
@@ -0,0 +1,213 @@
+# --- START OF FILE: route_input/upstream.py ---
+
+"""
+Shared plumbing for calls to external services (Nominatim, OpenRouteService).
+
+- Deadline: every request gets a time budget (UpstreamDeadlineMiddleware), and
+  each upstream call only gets what is left of it, so a fallback chain of
+  geocoder calls can't add up to 4 x 7 seconds any more.
+- CircuitBreaker: after a run of failures an upstream is marked open and skipped
+  outright, so callers go straight to their local fallback. State lives in the
+  Django cache, so every worker sees it when a shared cache (REDIS_URL) is used.
+  After `reset_timeout` one probe request is let through (half-open); success
+  closes the circuit again, failure reopens it.
+- Rate limits: code running inside rate_limited() (batch jobs) spaces its calls
+  to each upstream by UPSTREAM_RATE_LIMITS, per process, so a batch of hundreds
+  of lookups stays within the public APIs' usage policies.
+"""
+
+from contextlib import contextmanager
+import contextvars
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_REQUEST_BUDGET = getattr(settings, 'UPSTREAM_REQUEST_BUDGET', 10)  # seconds per HTTP request
+UPSTREAM_MIN_CALL_TIME = getattr(settings, 'UPSTREAM_MIN_CALL_TIME', 1)  # don't start a call with less left
+BREAKER_FAILURE_THRESHOLD = getattr(settings, 'BREAKER_FAILURE_THRESHOLD', 5)
+BREAKER_RESET_TIMEOUT = getattr(settings, 'BREAKER_RESET_TIMEOUT', 30)  # seconds
+
+# Calls per second allowed inside rate_limited(): Nominatim's policy is 1/s, ORS's free plan 40/min
+UPSTREAM_RATE_LIMITS = getattr(settings, 'UPSTREAM_RATE_LIMITS', {
+    'nominatim': 1.0,
+    'ors': 40 / 60,
+    'osm_tiles': 2.0,
+})
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream whose circuit is open or whose deadline has passed."""
+
+
+# -----------------------------
+# Deadlines
+# -----------------------------
+
+class Deadline:
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self, cap):
+        """Timeout for the next call: at most `cap`, never more than what is left."""
+        remaining = self.remaining()
+        if remaining < UPSTREAM_MIN_CALL_TIME:
+            raise UpstreamUnavailable("request deadline exhausted")
+        return min(cap, remaining)
+
+
+_current_deadline = contextvars.ContextVar('upstream_deadline', default=None)
+
+
+def current_deadline():
+    """Deadline of the request being served, or a fresh full budget outside requests (commands, shell)."""
+    return _current_deadline.get() or Deadline(UPSTREAM_REQUEST_BUDGET)
+
+
+@contextmanager
+def deadline_scope(seconds=UPSTREAM_REQUEST_BUDGET):
+    token = _current_deadline.set(Deadline(seconds))
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+
+class UpstreamDeadlineMiddleware:
+    """Give every request one shared budget for all of its upstream calls."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with deadline_scope():
+            return self.get_response(request)
+
+
+# -----------------------------
+# Rate limits
+# -----------------------------
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across the threads of this process."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_rate_limiters = {name: RateLimiter(rate) for name, rate in UPSTREAM_RATE_LIMITS.items()}
+_rate_limited = contextvars.ContextVar('upstream_rate_limited', default=False)
+
+
+@contextmanager
+def rate_limited():
+    """Apply UPSTREAM_RATE_LIMITS to the upstream calls made inside this block."""
+    token = _rate_limited.set(True)
+    try:
+        yield
+    finally:
+        _rate_limited.reset(token)
+
+
+# -----------------------------
+# Circuit breakers
+# -----------------------------
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.key = f"breaker:{name}"
+
+    def _load(self):
+        return cache.get(self.key) or {'state': CLOSED, 'failures': 0, 'opened_at': None}
+
+    def _save(self, state):
+        cache.set(self.key, state, None)
+
+    def state(self):
+        state = self._load()
+        if state['state'] == OPEN and time.time() - state['opened_at'] >= self.reset_timeout:
+            return HALF_OPEN
+        return state['state']
+
+    def allow(self):
+        current = self.state()
+        if current == CLOSED:
+            return True
+        if current == HALF_OPEN:
+            # Only one worker gets to probe per reset period
+            return cache.add(f"{self.key}:probe", True, self.reset_timeout)
+        return False
+
+    def record_success(self):
+        state = self._load()
+        if state['state'] != CLOSED or state['failures']:
+            self._save({'state': CLOSED, 'failures': 0, 'opened_at': None})
+            cache.delete(f"{self.key}:probe")
+
+    def record_failure(self):
+        state = self._load()
+        state['failures'] += 1
+        if state['state'] != CLOSED or state['failures'] >= self.failure_threshold:
+            if state['state'] == CLOSED:
+                logger.warning("Circuit for %s opened after %s failures", self.name, state['failures'])
+            state['state'] = OPEN
+            state['opened_at'] = time.time()
+            cache.delete(f"{self.key}:probe")
+        self._save(state)
+
+    def snapshot(self):
+        state = self._load()
+        return {'state': self.state(), 'failures': state['failures'], 'opened_at': state['opened_at']}
+
+
+nominatim_breaker = CircuitBreaker('nominatim')
+ors_breaker = CircuitBreaker('ors')
+tile_breaker = CircuitBreaker('osm_tiles')
+BREAKERS = [nominatim_breaker, ors_breaker, tile_breaker]
+
+
+def call_upstream(breaker, func, *, timeout_cap, failures=(Exception,), **kwargs):
+    """
+    Call `func(timeout=..., **kwargs)` through `breaker` within the current deadline.
+    Raises UpstreamUnavailable without calling when the circuit is open or time is up.
+    """
+    if not breaker.allow():
+        raise UpstreamUnavailable(f"{breaker.name} circuit open")
+    if _rate_limited.get() and breaker.name in _rate_limiters:
+        _rate_limiters[breaker.name].wait()
+    timeout = current_deadline().timeout(timeout_cap)
+    try:
+        result = func(timeout=timeout, **kwargs)
+    except failures:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return result
+
+
+def breaker_metrics():
+    return {breaker.name: breaker.snapshot() for breaker in BREAKERS}
+
+# --- END OF FILE: route_input/upstream.py ---
@@ -10,5 +10,22 @@ urlpatterns = [
 
     path('save_current_route/', views.save_current_route, name='save_current_route'),
     path('save_suggested_route/', views.save_suggested_route, name='save_suggested_route'),
+    path('save_route_ajax/', views.save_route_ajax, name='save_route_ajax'),
+    path('delete_saved_route/', views.delete_saved_route, name='delete_saved_route'),
+    path('saved_routes/', views.saved_routes_page, name='saved_routes_page'),
+    path('saved_routes/use/', views.saved_route_used, name='saved_route_used'),
+    path('get_jeep_codes/', views.get_jeep_codes, name='get_jeep_codes'),
+    path('lines/', views.jeepney_lines, name='jeepney_lines'),
+    path('lines/<str:code>/', views.jeepney_line, name='jeepney_line'),
+    path('network/changes/', views.route_changes, name='route_changes'),
+    path('network/sw.js', views.route_network_worker, name='route_network_worker'),
+    path('compare/', views.compare_routes, name='compare_routes'),
+    path('report_trip/', views.report_trip, name='report_trip'),
+    path('reachable/', views.reachable_places, name='reachable_places'),
+    path('plan_batch/', views.plan_routes_batch, name='plan_routes_batch'),
+    path('metrics/', views.metrics, name='route_metrics'),
+    path('analytics/', views.search_analytics, name='search_analytics'),
+    path('tiles/<int:z>/<int:x>/<int:y>.png', views.map_tile, name='map_tile'),
+    path('thumbs/<slug:key>.<str:fmt>', views.route_thumbnail, name='route_thumbnail'),
     path('logout/', views.logout_view, name='logout'),
 ]
\ No newline at end of file
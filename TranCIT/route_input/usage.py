@@ -0,0 +1,134 @@
+# --- START OF FILE: route_input/usage.py ---
+
+"""
+Buffered usage tracking for saved routes.
+
+Opening a saved route (filling the form from it) or navigating it is recorded
+in this process's buffer: per saved route, open and navigate counts since the
+last flush and the latest time it was used. flush() writes the whole buffer
+with one bulk_update() per USAGE_FLUSH_MAX routes, adding the counts with F()
+expressions and keeping the later last_used (Greatest), so flushes from several
+workers add up instead of overwriting each other. Flushes happen when the
+buffer is USAGE_FLUSH_INTERVAL seconds old or holds USAGE_FLUSH_MAX routes, on
+exit, and before popularity is computed.
+
+A flush starts a new generation of the owners' cached saved-route lists
+(saved_routes.py), so the next read loads the -last_used order from the DB;
+until then saved_routes applies this process's pending timestamps itself.
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, models
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import SavedRoute
+
+logger = logging.getLogger(__name__)
+
+USAGE_FLUSH_INTERVAL = getattr(settings, 'USAGE_FLUSH_INTERVAL', 30)  # seconds
+USAGE_FLUSH_MAX = getattr(settings, 'USAGE_FLUSH_MAX', 500)  # saved routes per batch
+USAGE_POPULAR_LIMIT = getattr(settings, 'USAGE_POPULAR_LIMIT', 10)
+
+EVENTS = ('open', 'navigate')
+
+_lock = threading.Lock()
+_pending = {}  # saved route id -> [opens, navigates, last_used, (user_id, owner_hash)]
+_state = {'started': time.monotonic(), 'events': 0, 'flushes': 0, 'rows_written': 0, 'failures': 0}
+
+
+def record(saved_id, event, user_id=None, owner_hash=None, when=None):
+    """Count one `event` ('open' or 'navigate') on a saved route; flushes when the buffer is due."""
+    if event not in EVENTS:
+        raise ValueError(f"unknown usage event {event!r}")
+    when = when or timezone.now()
+    with _lock:
+        if not _pending:
+            _state['started'] = time.monotonic()
+        entry = _pending.setdefault(saved_id, [0, 0, when, (user_id, owner_hash)])
+        entry[EVENTS.index(event)] += 1
+        entry[2] = max(entry[2], when)
+        _state['events'] += 1
+        due = len(_pending) >= USAGE_FLUSH_MAX or time.monotonic() - _state['started'] >= USAGE_FLUSH_INTERVAL
+    if due:
+        flush()
+
+
+def _merge_back(batch):
+    """Put a batch that could not be written back into the buffer."""
+    with _lock:
+        for saved_id, (opens, navigates, last_used, owner) in batch.items():
+            entry = _pending.setdefault(saved_id, [0, 0, last_used, owner])
+            entry[0] += opens
+            entry[1] += navigates
+            entry[2] = max(entry[2], last_used)
+
+
+def flush():
+    """Write the buffered usage to the database; returns the number of saved routes written."""
+    global _pending
+    with _lock:
+        batch, _pending = _pending, {}
+        _state['started'] = time.monotonic()
+    if not batch:
+        return 0
+
+    rows = []
+    for saved_id, (opens, navigates, last_used, _) in batch.items():
+        row = SavedRoute(pk=saved_id)
+        row.open_count = models.F('open_count') + opens
+        row.navigate_count = models.F('navigate_count') + navigates
+        row.last_used = Greatest('last_used', models.Value(last_used, output_field=models.DateTimeField()))
+        rows.append(row)
+    try:
+        SavedRoute.objects.bulk_update(rows, ['open_count', 'navigate_count', 'last_used'], batch_size=USAGE_FLUSH_MAX)
+    except DatabaseError:
+        logger.exception("Could not write usage of %s saved routes; keeping it for the next flush", len(batch))
+        _merge_back(batch)
+        with _lock:
+            _state['failures'] += 1
+        return 0
+
+    with _lock:
+        _state['flushes'] += 1
+        _state['rows_written'] += len(batch)
+
+    from .saved_routes import forget_owner
+    for user_id, owner_hash in {owner for _, _, _, owner in batch.values()}:
+        forget_owner(user_id, owner_hash)
+    return len(batch)
+
+
+atexit.register(flush)
+
+
+def pending_last_used():
+    """{saved route id: last_used} not flushed yet by this process."""
+    with _lock:
+        return {saved_id: entry[2] for saved_id, entry in _pending.items()}
+
+
+def popular_routes(limit=USAGE_POPULAR_LIMIT):
+    """Suggested routes saved most often, by navigations then opens (after a flush)."""
+    flush()
+    rows = (SavedRoute.objects.filter(original_route__isnull=False)
+            .values('original_route', 'original_route__display_label')
+            .annotate(navigates=models.Sum('navigate_count'), opens=models.Sum('open_count'),
+                      saves=models.Count('id'))
+            .order_by('-navigates', '-opens', '-saves', 'original_route')[:limit])
+    return [{'route_id': row['original_route'], 'label': row['original_route__display_label'],
+             'navigates': row['navigates'], 'opens': row['opens'], 'saves': row['saves']} for row in rows]
+
+
+def stats():
+    """Buffer and flush counters for this worker process."""
+    with _lock:
+        counters = {name: value for name, value in _state.items() if name != 'started'}
+        return dict(counters, pending=len(_pending))
+
+# --- END OF FILE: route_input/usage.py ---
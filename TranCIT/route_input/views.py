@@ -1,30 +1,51 @@
 # --- START OF FILE: route_input/views.py ---
 
 from django.shortcuts import render, redirect, get_object_or_404
-from django.core.cache import cache
 from django.conf import settings
 from django.db import DatabaseError
 from django.db.models import Q
-from django.views.decorators.http import require_POST, require_GET
+from django.views.decorators.http import require_POST, require_GET, condition
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import logout
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.http import (FileResponse, JsonResponse, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden,
+                         HttpResponseNotFound, HttpResponseNotModified, HttpResponseRedirect, StreamingHttpResponse)
+from django.middleware.csrf import get_token
 from django.utils import timezone
+from django.utils.cache import add_never_cache_headers
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import urlencode
+from collections import namedtuple
+from functools import wraps
+from datetime import timedelta
 from decimal import Decimal, InvalidOperation
 from geopy.geocoders import Nominatim
 from geopy.distance import geodesic
 from geopy.exc import GeocoderTimedOut, GeocoderServiceError
 import openrouteservice
+import requests
+import hashlib
 import json
 import logging
+import secrets
 import folium
 
 # --- 1. ADD THIS IMPORT ---
 from django.urls import reverse 
 # --- END 1. ---
 
+from .admission import ADMITTED, admit, admission_stats
+from .assets import localize_folium_assets
+from .batch import BatchError, plan_batch
+from .dedupe import check_submission
+from . import analytics, caching, lines, speeds, sync, thumbnails, tiles, usage
+from .network import route_paths
+from .reachability import reachable
 from .forms import RouteForm, JeepneySuggestionForm
-from .models import Route, SavedRoute, JEEPNEY_CODE_CHOICES
+from .upstream import UpstreamUnavailable, call_upstream, nominatim_breaker, ors_breaker, breaker_metrics
+from . import saved_routes as saved_routes_cache
+from .models import Route, SavedRoute, SearchRollup, JeepneyLine, JEEPNEY_CODE_CHOICES, hash_session_key, route_table_version
 
 
 # -----------------------------
@@ -38,19 +59,34 @@ CEBU_CITY_KEYWORDS = ["cebu", "mandaue", "lapu", "liloan", "consolacion", "talis
 # Default map center (put in settings if you prefer)
 DEFAULT_MAP_CENTER = getattr(settings, 'DEFAULT_MAP_CENTER', (10.3157, 123.8854))
 DEFAULT_MAP_ZOOM = getattr(settings, 'DEFAULT_MAP_ZOOM', 14)
+# Serve map tiles through our caching proxy (tiles.py) instead of straight from OSM
+MAP_TILE_PROXY = getattr(settings, 'MAP_TILE_PROXY', True)
 
 # Cache timeouts (seconds)
-GEOCODE_CACHE_TTL = getattr(settings, 'GEOCODE_CACHE_TTL', 24 * 60 * 60)  # 24 hours
-ORS_ROUTE_CACHE_TTL = getattr(settings, 'ORS_ROUTE_CACHE_TTL', 6 * 60 * 60)  # 6 hours
 MAP_HTML_CACHE_TTL = getattr(settings, 'MAP_HTML_CACHE_TTL', 5 * 60)  # 5 minutes
 
+# Suggested routes drawn on the map / listed in the sidebar (use the search filters to narrow down)
+SUGGESTED_ROUTES_LIMIT = getattr(settings, 'SUGGESTED_ROUTES_LIMIT', 100)
+
+# Sidebar fragments ({% cache %} in index.html) live this long; their keys change
+# with the route table / saved routes anyway. 0 disables fragment caching.
+DASHBOARD_FRAGMENT_TTL = getattr(settings, 'DASHBOARD_FRAGMENT_TTL', 10 * 60)
+# 'django' or 'jinja2' (route_input/jinja2/route_input/index.html)
+DASHBOARD_TEMPLATE_ENGINE = getattr(settings, 'DASHBOARD_TEMPLATE_ENGINE', 'django')
+
+# Upper bounds per upstream call; the request deadline may cut them shorter (see upstream.py)
+GEOCODE_TIMEOUT = getattr(settings, 'GEOCODE_TIMEOUT', 7)
+ORS_TIMEOUT = getattr(settings, 'ORS_TIMEOUT', 8)
+
 # Init geolocator
 geolocator = Nominatim(user_agent=getattr(settings, 'GEOCODER_USER_AGENT', 'trancit_app_geocoder'))
 
 # Initialize ORS client (may raise if not configured)
 ORS_API_KEY = getattr(settings, 'ORS_API_KEY', None)
 if ORS_API_KEY:
-    ors_client = openrouteservice.Client(key=ORS_API_KEY)
+    # No long retry loops: the circuit breaker decides when to try ORS again
+    ors_client = openrouteservice.Client(key=ORS_API_KEY, timeout=ORS_TIMEOUT,
+                                         retry_timeout=ORS_TIMEOUT, retry_over_query_limit=False)
 else:
     ors_client = None
 
@@ -59,17 +95,39 @@ else:
 # Helper functions
 # -----------------------------
 
-def _cache_key_for_geocode(address: str) -> str:
-    return f"geo:{address.strip().lower()}"
+def local_place_lookup(address: str):
+    """
+    Nearest known place for `address` from the coordinates already stored on routes:
+    an exact name match first, then a partial one. Returns (lat, lon, name) or None.
+    """
+    query = address.strip()
+    if not query:
+        return None
+    for lookup in ('iexact', 'icontains'):
+        for prefix in ('origin', 'destination'):
+            match = (Route.objects
+                     .filter(**{f"{prefix}__{lookup}": query, f"{prefix}_latitude__isnull": False,
+                                f"{prefix}_longitude__isnull": False})
+                     .values_list(prefix, f"{prefix}_latitude", f"{prefix}_longitude")
+                     .first())
+            if match:
+                name, lat, lon = match
+                return (float(lat), float(lon), name)
+    return None
+
+
+def _nominatim_geocode(query):
+    return call_upstream(nominatim_breaker, geolocator.geocode, timeout_cap=GEOCODE_TIMEOUT,
+                         failures=(GeocoderTimedOut, GeocoderServiceError), query=query)
 
 
 def cached_geocode(address: str):
-    """Geocode with caching and fallback heuristics. Returns geopy Location or None."""
+    """Geocode with caching and fallback heuristics. Returns (lat, lon, address) or None."""
     if not address:
         return None
 
-    key = _cache_key_for_geocode(address)
-    cached = cache.get(key)
+    key = address.strip().lower()
+    cached = caching.GEOCODES.get(key, args=[address])
     if cached:
         return cached
 
@@ -82,32 +140,39 @@ def cached_geocode(address: str):
         else:
             query_with_context = query
 
-        location = geolocator.geocode(query_with_context, timeout=7)
+        location = _nominatim_geocode(query_with_context)
         if not location:
             query_no_numbers = " ".join([w for w in query_with_context.split() if not w.isdigit()])
-            location = geolocator.geocode(query_no_numbers, timeout=7)
+            location = _nominatim_geocode(query_no_numbers)
         if not location:
             parts = [p.strip() for p in query.split(",") if p.strip()]
             if len(parts) >= 2:
                 simplified = ", ".join(parts[:2]) + ", Cebu, Philippines"
-                location = geolocator.geocode(simplified, timeout=7)
+                location = _nominatim_geocode(simplified)
         if not location:
+            # A place we already know beats a city-level guess
+            known = local_place_lookup(query)
+            if known:
+                return known
             # city-level fallback
             if "lapu" in lower:
-                location = geolocator.geocode("Lapu-Lapu City, Cebu, Philippines", timeout=7)
+                location = _nominatim_geocode("Lapu-Lapu City, Cebu, Philippines")
             elif "mandaue" in lower:
-                location = geolocator.geocode("Mandaue City, Cebu, Philippines", timeout=7)
+                location = _nominatim_geocode("Mandaue City, Cebu, Philippines")
             else:
-                location = geolocator.geocode("Cebu City, Philippines", timeout=7)
+                location = _nominatim_geocode("Cebu City, Philippines")
 
         if location:
             # store a small tuple to avoid pickling geopy objects
-            cached_val = (location.latitude, location.longitude, getattr(location, 'address', None))
-            cache.set(key, cached_val, GEOCODE_CACHE_TTL)
-            return cached_val
+            return caching.GEOCODES.set(key, (location.latitude, location.longitude, getattr(location, 'address', None)))
 
+    except UpstreamUnavailable as e:
+        # Circuit open or out of time: answer from local data right away
+        logger.info("Skipping Nominatim for %s: %s", address, e)
+        return local_place_lookup(query)
     except (GeocoderTimedOut, GeocoderServiceError) as e:
         logger.warning("Geocoder error for %s: %s", address, e, exc_info=True)
+        return local_place_lookup(query)
 
     return None
 
@@ -119,8 +184,11 @@ def _parse_decimal(value):
         return None
 
 
-def calculate_distance_and_time(start_lat, start_lon, end_lat, end_lon):
-    """Approximate (geodesic) distance and a naive travel time estimate."""
+def calculate_distance_and_time(start_lat, start_lon, end_lat, end_lon, transport_type=None):
+    """
+    Approximate (geodesic) distance and travel time, from the learned speeds where
+    known (see speeds.py) and SPEED_FALLBACK_KPH / the mode's fallback_kph elsewhere.
+    """
     if not all([start_lat, start_lon, end_lat, end_lon]):
         return None, None
 
@@ -128,10 +196,8 @@ def calculate_distance_and_time(start_lat, start_lon, end_lat, end_lon):
         coords_1 = (float(start_lat), float(start_lon))
         coords_2 = (float(end_lat), float(end_lon))
         distance_km = geodesic(coords_1, coords_2).km
-        # conservative average speed assumption (kph)
-        average_speed_kph = 20
-        travel_time_minutes = (distance_km / average_speed_kph) * 60
-        return Decimal(f"{distance_km:.2f}"), Decimal(f"{travel_time_minutes:.2f}")
+        travel_time_minutes = speeds.predict(transport_type, [coords_1, coords_2], distance_km).minutes
+        return Decimal(f"{distance_km:.2f}"), travel_time_minutes
     except Exception:
         logger.exception("Failed to calculate geodesic distance")
         return None, None
@@ -191,7 +257,19 @@ def calculate_fare(transport_type, distance_km, travel_time_minutes):
 
 
 def _ors_cache_key(a_lat, a_lon, b_lat, b_lon, profile):
-    return f"ors:{float(a_lat):.6f},{float(a_lon):.6f}:{float(b_lat):.6f},{float(b_lon):.6f}:{profile}"
+    return f"{float(a_lat):.6f},{float(a_lon):.6f}:{float(b_lat):.6f},{float(b_lon):.6f}:{profile}"
+
+
+# Errors that mean ORS itself is unhealthy. ApiError (bad coordinates, no route found) doesn't count.
+ORS_FAILURES = (openrouteservice.exceptions.Timeout, openrouteservice.exceptions.HTTPError,
+                requests.exceptions.RequestException)
+
+
+def _ors_directions(coordinates, profile, timeout):
+    # Same request as ors_client.directions(), but with a per-call timeout
+    return ors_client.request(f"/v2/directions/{profile}/geojson", {},
+                              requests_kwargs={'timeout': timeout},
+                              post_json={'coordinates': coordinates})
 
 
 def get_route_geojson_cached(start_lat, start_lon, end_lat, end_lon, profile='driving-car'):
@@ -201,15 +279,22 @@ def get_route_geojson_cached(start_lat, start_lon, end_lat, end_lon, profile='dr
         return None
 
     key = _ors_cache_key(start_lat, start_lon, end_lat, end_lon, profile)
-    cached = cache.get(key)
+    cached = caching.ORS_ROUTES.get(key, args=[float(start_lat), float(start_lon), float(end_lat), float(end_lon), profile])
     if cached:
         return cached
 
     try:
-        coords = [(float(start_lon), float(start_lat)), (float(end_lon), float(end_lat))]
-        route = ors_client.directions(coordinates=coords, profile=profile, format='geojson')
-        cache.set(key, route, ORS_ROUTE_CACHE_TTL)
+        coords = [[float(start_lon), float(start_lat)], [float(end_lon), float(end_lat)]]
+        route = call_upstream(ors_breaker, _ors_directions, timeout_cap=ORS_TIMEOUT, failures=ORS_FAILURES,
+                              coordinates=coords, profile=profile)
+        route = caching.ORS_ROUTES.set(key, route)
+        if profile == 'driving-car':
+            speeds.record_ors_route(route)
         return route
+    except UpstreamUnavailable as e:
+        # Callers fall back to calculate_distance_and_time
+        logger.info("Skipping ORS: %s", e)
+        return None
     except Exception as e:
         logger.exception("ORS route request failed: %s", e)
         return None
@@ -242,6 +327,74 @@ def get_route_and_calculate(start_lat, start_lon, end_lat, end_lon, transport_ty
         return None, None, None
 
 
+# Per-mode travel time model applied to one shared (car) routing result.
+#   speed_factor: multiplier on the ORS driving-car duration
+#   fallback_kph: average speed when only the straight-line distance is known
+#   dwell_min_per_km: stops for loading/unloading passengers
+#   wait_min: expected wait before boarding
+TRANSPORT_TIME_MODELS = getattr(settings, 'TRANSPORT_TIME_MODELS', {
+    'Jeepney': {'speed_factor': Decimal('1.35'), 'fallback_kph': 15, 'dwell_min_per_km': Decimal('0.60'), 'wait_min': Decimal('5')},
+    'Bus': {'speed_factor': Decimal('1.25'), 'fallback_kph': 18, 'dwell_min_per_km': Decimal('0.40'), 'wait_min': Decimal('8')},
+    'Taxi': {'speed_factor': Decimal('1.00'), 'fallback_kph': 22, 'dwell_min_per_km': Decimal('0'), 'wait_min': Decimal('3')},
+    'Motorcycle': {'speed_factor': Decimal('0.85'), 'fallback_kph': 28, 'dwell_min_per_km': Decimal('0'), 'wait_min': Decimal('2')},
+})
+
+
+def estimate_mode_time(transport_type, distance_km, drive_minutes=None):
+    """
+    Travel time (minutes) for a transport mode. Uses the shared ORS driving
+    duration when available, otherwise the mode's average speed.
+    """
+    model = TRANSPORT_TIME_MODELS.get(transport_type)
+    if model is None or distance_km is None:
+        return drive_minutes
+    distance = Decimal(distance_km)
+    if drive_minutes is not None:
+        moving = Decimal(drive_minutes) * model['speed_factor']
+    else:
+        moving = distance / Decimal(model['fallback_kph']) * 60
+    total = moving + distance * model['dwell_min_per_km'] + model['wait_min']
+    return Decimal(f"{total:.2f}")
+
+
+def compare_transport_modes(start_lat, start_lon, end_lat, end_lon, use_ors=True):
+    """
+    One routing call, every transport mode: returns (modes, route_geojson) where
+    modes is a list of {transport_type, distance_km, travel_time_minutes, fare, source}.
+    Falls back to the geodesic estimate when ORS is unavailable (or use_ors is False).
+    """
+    if use_ors:
+        distance_km, drive_minutes, route_geojson = get_route_and_calculate(start_lat, start_lon, end_lat, end_lon)
+    else:
+        distance_km, drive_minutes, route_geojson = None, None, None
+    source = 'ors'
+    if distance_km is None:
+        distance_km, _ = calculate_distance_and_time(start_lat, start_lon, end_lat, end_lon)
+        drive_minutes = None
+        source = 'estimate'
+    if distance_km is None:
+        return [], None
+
+    distance_km = Decimal(f"{Decimal(distance_km):.2f}")
+    modes = []
+    for transport_type, _ in Route.TRANSPORT_CHOICES:
+        minutes, mode_source = estimate_mode_time(transport_type, distance_km, drive_minutes), source
+        if drive_minutes is None:
+            # No ORS duration: use learned speeds where we have enough of them
+            predicted = speeds.predict(transport_type, [(float(start_lat), float(start_lon)),
+                                                        (float(end_lat), float(end_lon))], distance_km)
+            if speeds.is_learned(predicted):
+                minutes, mode_source = predicted.minutes, 'learned'
+        modes.append({
+            'transport_type': transport_type,
+            'distance_km': distance_km,
+            'travel_time_minutes': minutes,
+            'fare': calculate_fare(transport_type, distance_km, minutes),
+            'source': mode_source,
+        })
+    return modes, route_geojson
+
+
 def store_route_path(route_instance, route_geojson):
     """Store route path coordinates on the model instance (as JSON lat/lon list)."""
     if not route_geojson or 'features' not in route_geojson:
@@ -255,9 +408,123 @@ def store_route_path(route_instance, route_geojson):
         logger.exception("Failed storing route path")
 
 
+def _weak_etag(*parts):
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode('utf-8')).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _routes_version(request):
+    """route_table_version(), once per request (shared by the ETag and the fragment cache keys)."""
+    if not hasattr(request, '_routes_version'):
+        request._routes_version = route_table_version()
+    return request._routes_version
+
+
+SavedPage = namedtuple('SavedPage', 'routes next_cursor')
+
+
+def _saved_first_page(request):
+    """First page of the visitor's saved routes (from the per-owner cache), once per request."""
+    if not hasattr(request, '_saved_first_page'):
+        # Don't create a session just to list routes: without an owner key there is nothing saved yet.
+        request._saved_first_page = SavedPage(*saved_routes_cache.get_page(
+            request.user, _get_session_key_hash(request, create=False)
+        ))
+    return request._saved_first_page
+
+
+def _saved_version(request):
+    """
+    Digest of what the saved-routes sidebar shows: the rows of its first page in
+    order, with this worker's unflushed usage (usage.py) and their thumbnail keys.
+    """
+    page = _saved_first_page(request)
+    parts = [f"{row.id}:{row.last_used}:{row.thumbnail_key}" for row in page.routes]
+    return hashlib.sha1("|".join(parts + [page.next_cursor or '']).encode('utf-8')).hexdigest()
+
+
+def _index_etag(request):
+    """
+    Weak ETag for the dashboard: route table version, the visitor's saved routes,
+    their CSRF cookie (embedded in the page forms) and the query string.
+    """
+    # Make sure the CSRF secret exists now, so a first visit gets the same ETag as the next one
+    get_token(request)
+    return _weak_etag(
+        _routes_version(request),
+        _saved_version(request),
+        request.META.get('CSRF_COOKIE', ''),
+        request.GET.urlencode(),
+    )
+
+
+SuggestionsPage = namedtuple('SuggestionsPage', 'routes number previous_url next_url')
+
+
+# The only parameters the suggestions fragment is keyed on (with the page); the pager
+# links are cached with it and shared, so they must not carry anything else
+SUGGESTION_FILTERS = ('origin_search', 'destination_search', 'transport_type_search', 'jeepney_code_search')
+
+
+def _page_url(request, number):
+    params = {name: request.GET[name] for name in SUGGESTION_FILTERS if request.GET.get(name)}
+    if number > 1:
+        params['suggestions_page'] = number
+    return f"?{urlencode(params)}" if params else request.path
+
+
+def _suggestions_page(request, queryset, number):
+    """
+    Page `number` of the sidebar suggestions, SUGGESTED_ROUTES_LIMIT per page, loaded
+    only on a fragment cache miss. One extra row tells whether there is a next page.
+    """
+    def load():
+        start = (number - 1) * SUGGESTED_ROUTES_LIMIT
+        rows = list(queryset[start:start + SUGGESTED_ROUTES_LIMIT + 1])
+        return SuggestionsPage(
+            rows[:SUGGESTED_ROUTES_LIMIT], number,
+            _page_url(request, number - 1) if number > 1 else None,
+            _page_url(request, number + 1) if len(rows) > SUGGESTED_ROUTES_LIMIT else None,
+        )
+    return SimpleLazyObject(load)
+
+
+def _has_route_coords(params):
+    return all(params.get(name) for name in
+               ('origin_latitude', 'origin_longitude', 'destination_latitude', 'destination_longitude'))
+
+
+def _no_store_when_degraded(view):
+    """
+    A degraded dashboard has the same ETag inputs as the full one; sent with that
+    ETag it would be revalidated (304) and kept after the load is gone. It goes
+    out without validators and with Cache-Control: no-store instead.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if getattr(request, '_dashboard_degraded', False):
+            del response['ETag']
+            add_never_cache_headers(response)
+        return response
+    return wrapper
+
+
 @login_required(login_url='/')
+@_no_store_when_degraded
+@condition(etag_func=_index_etag)
 def index(request):
     """Main dashboard view. Builds the folium map and handles route calculation for display."""
+    if _has_route_coords(request.GET):
+        # Routing + drawing is the expensive path; under load it is served degraded
+        with admit(request) as admission:
+            return _render_dashboard(request, admission)
+    return _render_dashboard(request, ADMITTED)
+
+
+def _render_dashboard(request, admission):
+    degraded = not admission.admitted
+    request._dashboard_degraded = degraded
     error_message = None
     success_message = None
 
@@ -266,6 +533,8 @@ def index(request):
     dest_q = request.GET.get('destination_search', '')
     transport_q = request.GET.get('transport_type_search', '')
     code_q = request.GET.get('jeepney_code_search', '')
+    suggestions_page = max(_int_param(request.GET, 'suggestions_page') or 1, 1)
+    analytics.record_search(origin=origin_q, destination=dest_q, code=code_q)
 
     # Filter suggested routes based on search parameters
     suggested_qs = Route.objects.all().order_by('transport_type', 'code', 'origin')
@@ -308,8 +577,9 @@ def index(request):
     calculated_fare = None
     calculated_distance = None
     calculated_time = None
+    mode_comparison = []
     
-    m = folium.Map(location=[center_lat, center_lon], zoom_start=DEFAULT_MAP_ZOOM)
+    m = localize_folium_assets(_base_map(center_lat, center_lon))
 
     if current_origin_lat and current_origin_lon:
         folium.Marker([float(current_origin_lat), float(current_origin_lon)], popup=get_origin_text or "Origin", icon=folium.Icon(color='blue', icon='circle', prefix='fa')).add_to(m)
@@ -321,17 +591,19 @@ def index(request):
     if current_origin_lat and current_origin_lon and current_dest_lat and current_dest_lon:
         try:
             transport_type_for_route = request.GET.get('transport_type', 'Jeepney')
-            
-            distance_km, travel_minutes, route_geojson = get_route_and_calculate(
+
+            # One routing call gives the figures for every mode; show them side by side
+            mode_comparison, route_geojson = compare_transport_modes(
                 current_origin_lat, current_origin_lon,
                 current_dest_lat, current_dest_lon,
-                transport_type_for_route
+                use_ors=not degraded,
             )
-            
-            if distance_km is not None:
-                calculated_distance = distance_km
-                calculated_time = travel_minutes
-                calculated_fare = calculate_fare(transport_type_for_route, distance_km, travel_minutes)
+
+            for mode in mode_comparison:
+                if mode['transport_type'] == transport_type_for_route:
+                    calculated_distance = mode['distance_km']
+                    calculated_time = mode['travel_time_minutes']
+                    calculated_fare = mode['fare']
 
             if route_geojson and 'features' in route_geojson and route_geojson['features']:
                 coords = route_geojson['features'][0]['geometry']['coordinates']
@@ -342,11 +614,17 @@ def index(request):
         except Exception as e:
             logger.error(f"Error drawing route on map: {e}")
 
-    # Draw suggested routes on the map
-    for route in suggested_qs[:100]:
-        path_coords = route.get_path_coords()
+    # Draw suggested routes on the map (skipped when shedding load: the map is the expensive part).
+    # With client sync the browser draws them from its own copy of the network; the page only lists ids.
+    network_route_ids = None
+    if ROUTE_NETWORK_CLIENT_SYNC and not degraded:
+        network_route_ids = list(suggested_qs.values_list('id', flat=True)[:SUGGESTED_ROUTES_LIMIT])
+    suggested_routes = [] if degraded or network_route_ids is not None else list(suggested_qs[:SUGGESTED_ROUTES_LIMIT])
+    suggested_paths = route_paths(suggested_routes)
+    for route in suggested_routes:
+        path_coords = suggested_paths[route.id]
         if path_coords:
-            folium.PolyLine(path_coords, color='purple', weight=3, opacity=0.7, popup=f"{route.transport_type} {route.code or ''}").add_to(m)
+            folium.PolyLine(path_coords, color='purple', weight=3, opacity=0.7, popup=str(route)).add_to(m)
 
     folium.LayerControl().add_to(m)
     
@@ -375,7 +653,18 @@ function attachHandlers() {
       window.mapClickMode = data.mode;
       alert("Click on the map to set " + data.mode);
     }
+    if (data?.type === "MAP_READY?") parent.postMessage({ type: "MAP_READY" }, "*");
+    if (data?.type === "SHOW_ROUTES") {
+      // Suggested routes from the parent's synced copy of the network (script.js)
+      if (window.networkLayer) window.map.removeLayer(window.networkLayer);
+      window.networkLayer = L.layerGroup(data.routes.map(function(route) {
+        const popup = document.createElement("div");
+        popup.textContent = route.label;
+        return L.polyline(route.path, { color: "purple", weight: 3, opacity: 0.7 }).bindPopup(popup);
+      })).addTo(window.map);
+    }
   });
+  parent.postMessage({ type: "MAP_READY" }, "*");
 
   window.map.on("click", function(e) {
     if (!window.mapClickMode) return;
@@ -414,22 +703,20 @@ initFoliumMap();
     m.get_root().html.add_child(folium.Element(f"<script>{click_js}</script>"))
     map_html = m._repr_html_()
 
-    # Get saved routes for the user or session
-    if request.user.is_authenticated:
-        saved_routes = SavedRoute.objects.filter(user=request.user)
-    else:
-        sk = request.session.session_key
-        if not sk:
-            request.session.create()
-            sk = request.session.session_key
-        saved_routes = SavedRoute.objects.filter(session_key=sk)
-
     context = {
         'form': form,
         'suggestion_form': suggestion_form,
         'map': map_html,
-        'all_routes': suggested_qs,
-        'saved_routes': saved_routes,
+        # The sidebar only lists jeepney routes and never shows their paths.
+        # Both lists are lazy: on a fragment cache hit they are never queried.
+        'suggestions': _suggestions_page(
+            request, suggested_qs.filter(transport_type='Jeepney').defer('route_path_coords'), suggestions_page),
+        'suggestions_page': suggestions_page,
+        'saved_page': _saved_first_page(request),
+        'fragment_ttl': DASHBOARD_FRAGMENT_TTL,
+        'routes_version': _routes_version(request),
+        'saved_version': _saved_version(request),
+        'highlight_route_id': request.GET.get('route_id', ''),
         'success_message': success_message,
         'error_message': error_message,
         'get_origin_text': get_origin_text,
@@ -441,18 +728,31 @@ initFoliumMap();
         'calculated_fare': calculated_fare,
         'calculated_distance': calculated_distance,
         'calculated_time': calculated_time,
+        'mode_comparison': mode_comparison,
+        'degraded': degraded,
+        'network_route_ids': network_route_ids,
+        'selected_transport_type': request.GET.get('transport_type', 'Jeepney'),
     }
 
-    return render(request, 'route_input/index.html', context)
+    return render(request, 'route_input/index.html', context, using=DASHBOARD_TEMPLATE_ENGINE)
+
+
+def _base_map(center_lat, center_lon):
+    if not MAP_TILE_PROXY:
+        return folium.Map(location=[center_lat, center_lon], zoom_start=DEFAULT_MAP_ZOOM)
+    m = folium.Map(location=[center_lat, center_lon], zoom_start=DEFAULT_MAP_ZOOM, tiles=None)
+    folium.TileLayer(tiles=tiles.tile_url_template(), attr=tiles.TILE_ATTRIBUTION, name='OpenStreetMap',
+                     max_zoom=tiles.TILE_MAX_ZOOM).add_to(m)
+    return m
 
 
-def _get_coords_from_request_data(address_text):
-    """Helper to geocode text from POST data, with fallback."""
+def _get_coords_from_request_data(address_text, use_geocoder=True):
+    """Helper to geocode text from POST data, with fallback (known places only when use_geocoder is False)."""
     if not address_text:
         return None, None, "Address text was empty."
     
     # Try geocoding the full text
-    geo_result = cached_geocode(address_text)
+    geo_result = cached_geocode(address_text) if use_geocoder else local_place_lookup(address_text)
     if geo_result:
         # cached_geocode returns a tuple (lat, lon, address)
         return geo_result[0], geo_result[1], None
@@ -465,11 +765,23 @@ def _get_coords_from_request_data(address_text):
 @require_POST
 def plan_route(request):
     """Endpoint to handle route planning + saving. Expects CSRF token if called from JS."""
+    with admit(request) as admission:
+        if admission.reason == 'rate_limited':
+            return render(request, 'route_input/index.html', {
+                'form': RouteForm(request.POST),
+                'error_message': 'Too many route calculations. Please wait a minute and try again.',
+            }, status=429)
+        return _plan_route(request, use_upstream=admission.admitted)
+
+
+def _plan_route(request, use_upstream):
     form = RouteForm(request.POST)
     if not form.is_valid():
         return render(request, 'route_input/index.html', {'form': form, 'error_message': 'Please check your inputs.'})
 
     route_instance = form.save(commit=False)
+    analytics.record_search(origin=route_instance.origin, destination=route_instance.destination,
+                            code=request.POST.get('code') if route_instance.transport_type == 'Jeepney' else None)
 
     post_origin_lat = request.POST.get('origin_latitude')
     post_origin_lon = request.POST.get('origin_longitude')
@@ -480,7 +792,7 @@ def plan_route(request):
         route_instance.origin_latitude = _parse_decimal(post_origin_lat)
         route_instance.origin_longitude = _parse_decimal(post_origin_lon)
     else:
-        lat, lon, err = _get_coords_from_request_data(route_instance.origin)
+        lat, lon, err = _get_coords_from_request_data(route_instance.origin, use_geocoder=use_upstream)
         if err: return render(request, 'route_input/index.html', {'form': form, 'error_message': err})
         route_instance.origin_latitude = lat
         route_instance.origin_longitude = lon
@@ -489,24 +801,27 @@ def plan_route(request):
         route_instance.destination_latitude = _parse_decimal(post_dest_lat)
         route_instance.destination_longitude = _parse_decimal(post_dest_lon)
     else:
-        lat, lon, err = _get_coords_from_request_data(route_instance.destination)
+        lat, lon, err = _get_coords_from_request_data(route_instance.destination, use_geocoder=use_upstream)
         if err: return render(request, 'route_input/index.html', {'form': form, 'error_message': err})
         route_instance.destination_latitude = lat
         route_instance.destination_longitude = lon
 
     if all([route_instance.origin_latitude, route_instance.destination_latitude]):
-        distance_km, travel_minutes, route_geojson = get_route_and_calculate(
-            route_instance.origin_latitude, route_instance.origin_longitude,
-            route_instance.destination_latitude, route_instance.destination_longitude,
-            route_instance.transport_type
-        )
+        if use_upstream:
+            distance_km, travel_minutes, route_geojson = get_route_and_calculate(
+                route_instance.origin_latitude, route_instance.origin_longitude,
+                route_instance.destination_latitude, route_instance.destination_longitude,
+                route_instance.transport_type
+            )
+        else:
+            distance_km = None  # overloaded: straight-line estimate below
         if distance_km is not None:
             route_instance.distance_km = distance_km
             route_instance.travel_time_minutes = travel_minutes
             route_instance.fare = calculate_fare(route_instance.transport_type, distance_km, travel_minutes)
             store_route_path(route_instance, route_geojson)
         else: # Fallback
-            d_km, t_min = calculate_distance_and_time(route_instance.origin_latitude, route_instance.origin_longitude, route_instance.destination_latitude, route_instance.destination_longitude)
+            d_km, t_min = calculate_distance_and_time(route_instance.origin_latitude, route_instance.origin_longitude, route_instance.destination_latitude, route_instance.destination_longitude, route_instance.transport_type)
             route_instance.distance_km = d_km
             route_instance.travel_time_minutes = t_min
             route_instance.fare = calculate_fare(route_instance.transport_type, d_km, t_min)
@@ -517,8 +832,12 @@ def plan_route(request):
         route_instance.code = request.POST.get('code')
 
     try:
-        route_instance.save()
-        logger.info("Saved route %s -> %s (id=%s)", route_instance.origin, route_instance.destination, route_instance.id)
+        action, existing = check_submission(route_instance)
+        if action == 'merge':
+            logger.info("Not saving route %s -> %s, near duplicate of id=%s", route_instance.origin, route_instance.destination, existing.pk)
+        else:
+            route_instance.save()
+            logger.info("Saved route %s -> %s (id=%s)", route_instance.origin, route_instance.destination, route_instance.id)
         
         # --- 2. CHANGE THIS LINE ---
         base_url = reverse('routes_page')
@@ -535,7 +854,12 @@ def plan_route(request):
 def suggest_route(request):
     form = JeepneySuggestionForm(request.POST)
     if form.is_valid():
-        form.save()
+        route = form.save(commit=False)
+        action, existing = check_submission(route)
+        if action == 'merge':
+            # Already suggested: show the existing route instead of adding another copy
+            return redirect(f"{reverse('routes_page')}?route_id={existing.pk}")
+        route.save()
         return redirect('routes_page') # This one is already correct!
     return render(request, 'route_input/index.html', {'suggestion_form': form, 'error_message': 'Please complete all required fields.'})
 
@@ -549,10 +873,14 @@ def save_current_route(request):
     fare_val = request.POST.get('fare')
     notes = request.POST.get('notes')
 
-    route = Route.objects.filter(Q(origin=origin) & Q(destination=destination) & Q(transport_type=transport_type) & Q(code=code)).first()
+    # Only the coordinates are copied; don't load the (large) path JSON
+    route = (Route.objects.filter(Q(origin=origin) & Q(destination=destination) & Q(transport_type=transport_type) & Q(code=code))
+             .only('id', 'origin_latitude', 'origin_longitude', 'destination_latitude', 'destination_longitude',
+                   'thumbnail_key')
+             .first())
     saved = SavedRoute.objects.create(
         user=request.user if request.user.is_authenticated else None,
-        session_key=request.session.session_key or _get_session_key(request),
+        session_key_hash=_owner_hash(request),
         original_route=route,
         origin=origin,
         destination=destination,
@@ -560,11 +888,13 @@ def save_current_route(request):
         origin_longitude=route.origin_longitude if route else None,
         destination_latitude=route.destination_latitude if route else None,
         destination_longitude=route.destination_longitude if route else None,
+        thumbnail_key=route.thumbnail_key if route else '',
         transport_type=transport_type,
         code=code,
         fare=fare_val or 0,
         notes=notes or ""
     )
+    saved_routes_cache.remember_saved(saved)
     return JsonResponse({"message": "Route saved successfully!", "id": saved.id})
 
 
@@ -577,7 +907,7 @@ def save_suggested_route(request):
 
     saved = SavedRoute.objects.create(
         user=request.user if request.user.is_authenticated else None,
-        session_key=request.session.session_key or _get_session_key(request),
+        session_key_hash=_owner_hash(request),
         original_route=route,
         origin=route.origin,
         destination=route.destination,
@@ -585,11 +915,13 @@ def save_suggested_route(request):
         origin_longitude=route.origin_longitude,
         destination_latitude=route.destination_latitude,
         destination_longitude=route.destination_longitude,
+        thumbnail_key=route.thumbnail_key,
         transport_type=route.transport_type,
         code=route.code,
         fare=route.fare or 0,
         notes=route.notes or ""
     )
+    saved_routes_cache.remember_saved(saved)
     return JsonResponse({"message": "Suggested route saved!", "id": saved.id})
 
 
@@ -600,20 +932,43 @@ def delete_saved_route(request):
     try: saved = SavedRoute.objects.get(pk=int(saved_id))
     except (SavedRoute.DoesNotExist, ValueError): return JsonResponse({'success': False, 'error': 'Not found.'}, status=404)
 
+    owner_hash = None if request.user.is_authenticated else _get_session_key_hash(request, create=False)
     if (request.user.is_authenticated and saved.user != request.user) or \
-       (not request.user.is_authenticated and saved.session_key != (request.session.session_key or _get_session_key(request))):
+       (not request.user.is_authenticated and (not owner_hash or saved.session_key_hash != owner_hash)):
         return JsonResponse({'success': False, 'error': 'Forbidden.'}, status=403)
 
     saved.delete()
+    saved_routes_cache.forget_saved(saved)
     return JsonResponse({'success': True})
 
 
+@require_POST
+def saved_route_used(request):
+    """Record that a saved route was opened or navigated (buffered, see usage.py)."""
+    event = request.POST.get('event')
+    saved_id = _int_param(request.POST, 'saved_id')
+    if saved_id is None or event not in usage.EVENTS:
+        return JsonResponse({'error': 'saved_id and event (open or navigate) required.'}, status=400)
+    user_id = request.user.pk if request.user.is_authenticated else None
+    owner_hash = None if user_id else _get_session_key_hash(request, create=False)
+    if user_id is None and not owner_hash:
+        return JsonResponse({'error': 'Not found.'}, status=404)
+    # Usually in the owner's cached list; older routes are checked in the database
+    owned = any(row.id == saved_id for row in saved_routes_cache.cached_rows(request.user, owner_hash)) or \
+        SavedRoute.objects.filter(saved_routes_cache.owner_filter(user_id, owner_hash), pk=saved_id).exists()
+    if not owned:
+        return JsonResponse({'error': 'Not found.'}, status=404)
+    usage.record(saved_id, event, user_id=user_id, owner_hash=owner_hash)
+    return HttpResponse(status=204)
+
+
 @require_POST
 def save_route_ajax(request):
     try:
         data = request.POST
         route = SavedRoute.objects.create(
             user=request.user if request.user.is_authenticated else None,
+            session_key_hash=_owner_hash(request),
             origin=data.get('origin', ''),
             destination=data.get('destination', ''),
             origin_latitude=_parse_decimal(data.get('origin_latitude')),
@@ -624,6 +979,7 @@ def save_route_ajax(request):
             code=data.get('code', ''),
             fare=_parse_decimal(data.get('fare') or 0)
         )
+        saved_routes_cache.remember_saved(route)
         return JsonResponse({'success': True, 'route': {'id': route.id, 'origin': route.origin, 'destination': route.destination, 'transport_type': route.transport_type, 'code': route.code, 'fare': float(route.fare or 0)}})
     except Exception as e:
         logger.exception("Error saving route via ajax")
@@ -631,14 +987,311 @@ def save_route_ajax(request):
 
 
 @require_GET
+def compare_routes(request):
+    """JSON: distance, time and fare for every transport mode between two points, from one routing call."""
+    coords = [_parse_decimal(request.GET.get(name)) for name in
+              ('origin_latitude', 'origin_longitude', 'destination_latitude', 'destination_longitude')]
+    if not all(c is not None and c.is_finite() for c in coords):
+        return JsonResponse({'error': 'origin_latitude, origin_longitude, destination_latitude and destination_longitude are required.'}, status=400)
+
+    with admit(request) as admission:
+        modes, route_geojson = compare_transport_modes(*coords, use_ors=admission.admitted)
+    if not modes:
+        return JsonResponse({'error': 'Could not calculate a route between these points.'}, status=502)
+
+    data = {'modes': [
+        {key: float(value) if isinstance(value, Decimal) else value for key, value in mode.items()}
+        for mode in modes
+    ]}
+    if request.GET.get('include_path') and route_geojson:
+        coords = route_geojson['features'][0]['geometry']['coordinates']
+        data['path'] = [[lat, lon] for lon, lat in coords]
+    return JsonResponse(data)
+
+
+@login_required(login_url='/')
+@require_POST
+def report_trip(request):
+    """
+    Record how long a trip actually took, for the learned speeds (see speeds.py).
+    POST transport_type, duration_minutes and either route_id or the origin and
+    destination coordinates (plus distance_km if known); started_at is optional.
+    """
+    transport_type = request.POST.get('transport_type')
+    if transport_type not in dict(Route.TRANSPORT_CHOICES):
+        return JsonResponse({'error': 'Unknown transport_type.'}, status=400)
+    duration = _parse_decimal(request.POST.get('duration_minutes'))
+    if duration is None or not duration.is_finite() or duration <= 0:
+        return JsonResponse({'error': 'duration_minutes is required.'}, status=400)
+
+    distance_km = _parse_decimal(request.POST.get('distance_km'))
+    route_id = request.POST.get('route_id')
+    if route_id:
+        route = Route.objects.filter(pk=route_id).only('id', 'route_path_coords', 'distance_km').first() \
+            if route_id.isdigit() else None
+        if route is None or len(route.get_path_coords()) < 2:
+            return JsonResponse({'error': 'Route not found or has no path.'}, status=404)
+        points, distance_km = route.get_path_coords(), distance_km or route.distance_km
+    else:
+        coords = [_parse_decimal(request.POST.get(name)) for name in
+                  ('origin_latitude', 'origin_longitude', 'destination_latitude', 'destination_longitude')]
+        if not all(c is not None and c.is_finite() for c in coords):
+            return JsonResponse({'error': 'route_id or origin/destination coordinates are required.'}, status=400)
+        points = [(float(coords[0]), float(coords[1])), (float(coords[2]), float(coords[3]))]
+
+    started_at = parse_datetime(request.POST.get('started_at') or '')
+    if started_at is not None and timezone.is_naive(started_at):
+        started_at = timezone.make_aware(started_at, speeds.SPEED_TIMEZONE)
+    recorded = speeds.record_trip(transport_type, points, duration,
+                                  distance_km=None if distance_km is None else float(distance_km),
+                                  when=started_at or timezone.now() - timedelta(minutes=float(duration)))
+    if not recorded:
+        return JsonResponse({'error': 'That duration is not plausible for this trip.'}, status=400)
+    return JsonResponse({'recorded_cells': recorded})
+
+
+@require_GET
+def reachable_places(request):
+    """
+    JSON: the jeepney routes, places and area reachable from lat/lon within
+    max_fare (pesos) and/or max_minutes, with up to MAX_RIDES rides (see reachability.py).
+    """
+    lat, lon = _parse_decimal(request.GET.get('lat')), _parse_decimal(request.GET.get('lon'))
+    if lat is None or lon is None or not (lat.is_finite() and lon.is_finite()):
+        return JsonResponse({'error': 'lat and lon are required.'}, status=400)
+    budgets = {name: _parse_decimal(request.GET.get(name)) for name in ('max_fare', 'max_minutes')}
+    if all(value is None for value in budgets.values()):
+        return JsonResponse({'error': 'max_fare and/or max_minutes is required.'}, status=400)
+    if any(value is not None and not (value.is_finite() and value > 0) for value in budgets.values()):
+        return JsonResponse({'error': 'Budgets must be positive.'}, status=400)
+    return JsonResponse(reachable(lat, lon, **budgets))
+
+
+@staff_member_required
+@require_POST
+def plan_routes_batch(request):
+    """
+    Staff-only batch trip planning. POST a JSON list of pairs (or {"pairs": [...],
+    "persist": true}); results stream back as NDJSON as they complete (see batch.py).
+    """
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Expected a JSON body.'}, status=400)
+    persist = False
+    if isinstance(payload, dict):
+        persist = bool(payload.get('persist'))
+        payload = payload.get('pairs')
+    try:
+        results = plan_batch(payload, persist=persist)
+    except BatchError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    lines = (json.dumps(result, default=str) + '\n' for result in results)
+    return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+
+@staff_member_required
+@require_GET
+def metrics(request):
+    """Staff-only JSON snapshot of upstream circuit breakers and cache counters."""
+    return JsonResponse({
+        'breakers': breaker_metrics(),
+        'saved_routes_cache': saved_routes_cache.cache_stats(),
+        'admission': admission_stats(),
+        'cache': caching.stats(),
+        'saved_route_usage': dict(usage.stats(), popular=usage.popular_routes()),
+        'search_analytics': analytics.stats(),
+    })
+
+
+@staff_member_required
+@require_GET
+def search_analytics(request):
+    """Staff dashboard of the most searched places, codes and pairs (see analytics.py)."""
+    days = min(max(_int_param(request.GET, 'days') or 7, 1), analytics.SEARCH_ANALYTICS_RETENTION_DAYS)
+    limit = min(max(_int_param(request.GET, 'limit') or 20, 1), 200)
+    labels = dict(SearchRollup.DIMENSIONS)
+    return render(request, 'route_input/search_analytics.html', {
+        'title': 'Search analytics',
+        'days': days,
+        'limit': limit,
+        'tables': [(labels[name], analytics.top_terms(name, days, limit)) for name in analytics.DIMENSIONS],
+        'worker': analytics.stats(),
+        'window_minutes': analytics.SEARCH_ANALYTICS_WINDOW // 60,
+    })
+
+
+@require_GET
+def saved_routes_page(request):
+    """Next page of saved routes for the "load more" button (keyset cursor)."""
+    rows, next_cursor = saved_routes_cache.get_page(
+        request.user, _get_session_key_hash(request, create=False), cursor=request.GET.get('cursor')
+    )
+    return JsonResponse({'routes': [row._asdict() for row in rows], 'next_cursor': next_cursor})
+
+
+def _tile_etag(request, z, x, y):
+    # Looked up once; the view below uses the same tile
+    request._tile = None
+    if tiles.valid_tile(z, x, y):
+        try:
+            request._tile = tiles.get_tile(z, x, y)
+        except (UpstreamUnavailable, requests.RequestException) as e:
+            logger.warning("Tile %s/%s/%s unavailable: %s", z, x, y, e)
+    return request._tile.etag if request._tile else None
+
+
+@require_GET
+@condition(etag_func=_tile_etag)
+def map_tile(request, z, x, y):
+    """Map tile from the local tile cache (see tiles.py)."""
+    if not tiles.valid_tile(z, x, y):
+        return HttpResponseNotFound()
+    tile = request._tile
+    if tile is None:
+        if not tiles.in_bbox(z, x, y):
+            # Outside the area we cache: let the browser fetch it from the tile server
+            return HttpResponseRedirect(tiles.upstream_url(z, x, y))
+        response = HttpResponse(status=503)
+        response['Retry-After'] = '30'
+        return response
+    response = HttpResponse(tile.data, content_type='image/png')
+    response['Cache-Control'] = f"public, max-age={tiles.TILE_BROWSER_MAX_AGE}"
+    response['X-Tile-Source'] = tile.source
+    return response
+
+
+@require_GET
+def route_thumbnail(request, key, fmt):
+    """Preview image of a route path by content key (thumbnails.py); never changes, so cached for good."""
+    if fmt not in thumbnails.FORMATS or not thumbnails.valid_key(key):
+        return HttpResponseNotFound()
+    if request.headers.get('If-None-Match') == f'"{key}"':
+        return HttpResponseNotModified()
+    file_path = thumbnails.thumbnail_for_key(key, fmt)
+    if file_path is None:
+        return HttpResponseNotFound()
+    response = FileResponse(open(file_path, 'rb'), content_type=thumbnails.FORMATS[fmt])
+    response['Cache-Control'] = f"public, max-age={thumbnails.THUMBNAIL_BROWSER_MAX_AGE}, immutable"
+    response['ETag'] = f'"{key}"'
+    return response
+
+
+JEEP_CODES = [code for code, _ in JEEPNEY_CODE_CHOICES]
+JEEP_CODES_ETAG = _weak_etag(*JEEP_CODES)
+
+
+@require_GET
+@condition(etag_func=lambda request: JEEP_CODES_ETAG)
 def get_jeep_codes(request):
-    return JsonResponse({'codes': [code for code, _ in JEEPNEY_CODE_CHOICES]})
+    return JsonResponse({'codes': JEEP_CODES})
+
+
+LINES_BROWSER_MAX_AGE = getattr(settings, 'LINES_BROWSER_MAX_AGE', 5 * 60)
+
+
+def _lines_etag(request):
+    request._lines_version = lines.catalogue_version()
+    return _weak_etag('lines', request._lines_version)
+
+
+@require_GET
+@condition(etag_func=_lines_etag)
+def jeepney_lines(request):
+    """JSON catalogue of the canonical jeepney lines (see lines.py)."""
+    response = JsonResponse(lines.catalogue(request._lines_version))
+    response['Cache-Control'] = f"public, max-age={LINES_BROWSER_MAX_AGE}"
+    return response
+
+
+def _line_etag(request, code):
+    row = (JeepneyLine.objects.filter(code=code).exclude(path_coords='')
+           .values_list('source_version', 'updated_at').first())
+    request._line_version = row and f"{row[0]}-{row[1].timestamp():.6f}"
+    return row and _weak_etag('line', code, request._line_version)
+
+
+@require_GET
+@condition(etag_func=_line_etag)
+def jeepney_line(request, code):
+    """One line's merged path, stops and stop-to-stop fare table."""
+    data = request._line_version and lines.line_json(code, request._line_version)
+    if data is None:
+        return JsonResponse({'error': 'No such line.'}, status=404)
+    response = JsonResponse(data)
+    response['Cache-Control'] = f"public, max-age={LINES_BROWSER_MAX_AGE}"
+    return response
+
+
+ROUTE_NETWORK_CLIENT_SYNC = getattr(settings, 'ROUTE_NETWORK_CLIENT_SYNC', True)
+SYNC_TIMEOUT_MS = getattr(settings, 'SYNC_TIMEOUT_MS', 4000)  # service worker falls back to its copy after this
 
 
-def _get_session_key(request):
-    if not request.session.session_key:
-        request.session.create()
-    return request.session.session_key
+def _int_param(params, name):
+    value = params.get(name, '')
+    return int(value) if value.isdigit() else None
+
+
+def _sync_etag(request):
+    request._sync_state = sync.log_state()
+    return _weak_etag('sync', *request._sync_state, *(request.GET.get(name, '') for name in ('since', 'cursor', 'as_of')))
+
+
+@require_GET
+@condition(etag_func=_sync_etag)
+def route_changes(request):
+    """Changes to the route network since ?since=<version> (see sync.py), or a reset page by ?cursor=."""
+    data = sync.page(_int_param(request.GET, 'since') or 0, cursor=_int_param(request.GET, 'cursor'),
+                     as_of=_int_param(request.GET, 'as_of'), state=request._sync_state)
+    response = JsonResponse(data)
+    # Pages of a version never change, but the client must ask again for newer versions
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+@require_GET
+def route_network_worker(request):
+    """
+    Service worker keeping the route network in IndexedDB. Served from
+    network/ but allowed to control the whole dashboard, whose requests for
+    network/ it answers from the synced copy (offline too).
+    """
+    response = render(request, 'route_input/network-sw.js', {
+        'changes_url': reverse('route_changes'),
+        'sync_timeout_ms': SYNC_TIMEOUT_MS,
+    }, content_type='application/javascript')
+    response['Service-Worker-Allowed'] = reverse('routes_page')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+# Session entry holding the stable owner key for anonymous saved routes. It is
+# kept inside the session data (not the session ID itself) so it survives
+# cycle_key() on login and works with the signed_cookies backend, whose
+# "session key" changes every time the session is modified.
+SAVED_ROUTES_OWNER_SESSION_KEY = '_saved_routes_owner'
+
+
+def _get_session_key(request, create=True):
+    """Return the anonymous owner key for this session, creating one if asked."""
+    owner = request.session.get(SAVED_ROUTES_OWNER_SESSION_KEY)
+    if owner or not create:
+        # Sessions from before the owner key existed saved routes under their session ID.
+        return owner or request.session.session_key
+    owner = request.session.session_key or secrets.token_urlsafe(32)
+    request.session[SAVED_ROUTES_OWNER_SESSION_KEY] = owner
+    return owner
+
+
+def _get_session_key_hash(request, create=True):
+    return hash_session_key(_get_session_key(request, create=create))
+
+
+def _owner_hash(request):
+    """Hash to store on a new SavedRoute; authenticated users are tracked by FK instead."""
+    if request.user.is_authenticated:
+        return None
+    return _get_session_key_hash(request)
 
 
 def logout_view(request):